@@ -0,0 +1,146 @@
+'''OpenAI Batch API mode for the weekly run.
+
+Batch requests cost half as much and don't count against the per-minute rate limits, at the price
+of up to 24 hours of latency. Rather than reimplementing the summarizers, batch mode replays the
+normal synchronous code path (section_summary_generator, article_summary_generator) against a
+collecting client: every request that is not in the summary cache is recorded instead of sent.
+The recorded requests are submitted as one batch, the results are written to the summary cache
+under the same keys the live calls would use, and the replay is repeated until it needs nothing
+new (section prompts -> section and chunk summaries -> chunk reductions). The regular run that
+follows is then served entirely from the cache.
+'''
+import io
+import json
+import time
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+import utils
+from summary_cache import cache_key, get_default_cache
+from metrics import Metrics, get_default_metrics, set_default_metrics, current_labels
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+COMPLETION_WINDOW = '24h'
+FINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+MAX_ROUNDS = 5
+
+
+class BatchDeferred(Exception):
+    '''Raised by CollectingClient in place of a live completion'''
+
+
+class CollectingClient:
+    '''Stand-in for the synchronous OpenAI client that records chat requests instead of sending them'''
+    def __init__(self):
+        self.requests = {}
+        self.chat = self
+        self.completions = self
+
+    def create(self, model, messages, **params):
+        key = cache_key(model, messages, **params)
+        # cached_chat_completion labels the call with its kind (section, chunk, prompt, article)
+        self.requests.setdefault(key, {
+            'kind': current_labels().get('kind', 'batch'), 'model': model, 'messages': messages, 'params': params
+        })
+        raise BatchDeferred("deferred to the next batch")
+
+
+def collect_requests(fn, items):
+    '''Run fn(item) for every item with the synchronous client swapped for a CollectingClient.
+    Returns {cache key: request} for every completion those calls would have sent.
+    '''
+    previous, previous_metrics = utils.client, get_default_metrics()
+    collector = CollectingClient()
+    utils.set_client(collector)
+    # Cache hits during the replay are not part of the run
+    set_default_metrics(Metrics())
+    try:
+        # The replay's own output (and its "deferred" errors) would only repeat the real run's
+        with redirect_stdout(io.StringIO()):
+            for item in items:
+                try:
+                    fn(item)
+                except BatchDeferred:
+                    pass
+    finally:
+        utils.set_client(previous)
+        set_default_metrics(previous_metrics)
+    return collector.requests
+
+
+def submit_batch(client, requests, poll_interval=30.0, timeout=None):
+    '''Upload `requests` ({custom_id: request}) as a JSONL batch, wait for it to finish and return
+    {custom_id: response body} for the requests that succeeded.
+    '''
+    lines = [
+        json.dumps({
+            'custom_id': custom_id, 'method': 'POST', 'url': BATCH_ENDPOINT,
+            'body': {'model': request['model'], 'messages': request['messages'], **request['params']},
+        })
+        for custom_id, request in requests.items()
+    ]
+    data = ('\n'.join(lines) + '\n').encode('utf-8')
+    input_file = client.files.create(file=('batch.jsonl', io.BytesIO(data)), purpose='batch')
+    batch = client.batches.create(
+        input_file_id=input_file.id, endpoint=BATCH_ENDPOINT, completion_window=COMPLETION_WINDOW
+    )
+    print(f"MESSAGE -> Submitted batch {batch.id} with {len(lines)} requests")
+    started = time.monotonic()
+    while batch.status not in FINAL_STATUSES:
+        if timeout is not None and time.monotonic() - started > timeout:
+            print(f"**WARNING: Batch {batch.id} still {batch.status} after {timeout:.0f}s, giving up on it")
+            return {}
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch.id)
+    print(f"MESSAGE -> Batch {batch.id} {batch.status} in {time.monotonic() - started:.0f}s")
+
+    results = {}
+    if batch.output_file_id:
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get('response') or {}
+            if response.get('status_code') == 200:
+                results[record['custom_id']] = response['body']
+            else:
+                print(f"**WARNING: Batch request {record['custom_id']} failed: {record.get('error') or response}")
+    if batch.error_file_id:
+        failed = client.files.content(batch.error_file_id).text.count('\n')
+        print(f"**WARNING: {failed} request(s) in batch {batch.id} failed, they will be sent live")
+    return results
+
+
+def store_results(requests, results, cache):
+    '''Write batch results into the summary cache under each request's cache key. Returns the count.'''
+    metrics = get_default_metrics()
+    stored = 0
+    for key, body in results.items():
+        request = requests[key]
+        choices = body.get('choices') or []
+        # Refusals and tool calls carry no text; they are left to the live run
+        if not choices or choices[0]['message'].get('content') is None:
+            continue
+        usage = SimpleNamespace(**(body.get('usage') or {}))
+        metrics.record_call(request['kind'], request['model'], 0.0, usage=usage, batch=True)
+        cache.set(key, request['kind'], choices[0]['message']['content'])
+        stored += 1
+    return stored
+
+
+def run_in_batches(fn, items, client, cache=None, poll_interval=30.0, timeout=None, max_rounds=MAX_ROUNDS):
+    '''Replay fn(item) over items until every completion they need is in the summary cache, sending
+    the missing ones as one batch per round. Returns the number of batches submitted.
+    '''
+    cache = cache or get_default_cache()
+    for round_number in range(max_rounds):
+        requests = collect_requests(fn, items)
+        if not requests:
+            return round_number
+        print(f"MESSAGE -> Batch round {round_number + 1}: {len(requests)} request(s)")
+        with get_default_metrics().span('batch'):
+            results = submit_batch(client, requests, poll_interval=poll_interval, timeout=timeout)
+        if not store_results(requests, results, cache):
+            print("**WARNING: Batch returned no usable results, remaining requests will be sent live")
+            return round_number + 1
+    print(f"**WARNING: Still missing completions after {max_rounds} batch rounds, the rest will be sent live")
+    return max_rounds
@@ -0,0 +1,359 @@
+'''Offline benchmarks for the newsletter pipeline. Nothing here touches the network: LLM calls go
+to the in-process fake clients from local_servers.
+
+    python benchmark.py tex --sections 10 50
+    python benchmark.py functions --sections 10 50 --depth 3
+    python benchmark.py markdown --years 5
+    python benchmark.py e2e --papers 20 --latency 0.2 --error-rate 0.05 --workers 1 4
+'''
+import io
+import os
+import re
+import random
+import time
+import shutil
+import tarfile
+import argparse
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from pathlib import Path
+
+# Nothing here calls the API, but utils builds its client at import time
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import utils
+from utils import (
+    find_main_tex_file, parse_tex_file, find_tex_command, create_sections_from_main_tex, create_section_dict
+)
+from tex_extract import extract_sections
+from paper_summary_generator import parse_sections_texsoup, generate_newsletter_content, TEST_DIR
+from llm_engine import AsyncSummaryEngine
+from local_servers import FakeOpenAI, FakeAsyncOpenAI
+from summary_cache import SummaryCache, set_default_cache
+from section_prompts import SectionPromptRegistry, set_default_registry
+from metrics import Metrics, set_default_metrics
+from postprocess import markdown_to_html, convert_markdown_section, build_site
+
+PARAGRAPH = (
+    "We study the problem of learning representations from unlabeled data with a contrastive "
+    "objective $\\mathcal{L} = -\\log \\frac{e^{s(x, x^+)}}{\\sum_j e^{s(x, x_j)}}$ and show that "
+    "it improves accuracy by 3.2\\% over the baseline \\cite{smith2020}. % reviewer note\n"
+)
+SECTION_TITLES = ['Introduction', 'Related Work', 'Background', 'Method', 'Experiments', 'Results',
+                  'Discussion', 'Conclusion']
+
+
+def make_table(rows=40):
+    return (
+        "\\begin{table}[t]\n\\centering\n\\begin{tabular}{lccc}\n"
+        + "".join(f"Model {i} & {i}.1 & {i}.2 & {i}.3 \\\\\n" for i in range(rows))
+        + "\\end{tabular}\n\\caption{Results.}\n\\end{table}\n"
+    )
+
+TABLE = make_table()
+
+
+def make_synthetic_paper(root, n_sections=10, paragraphs=20, tables=1, table_rows=40, depth=1, titles=None):
+    '''Write an arXiv-like source tree: a main file that \\input's one file per section. With depth > 1
+    each section file \\input's a subsection file, which \\input's the next, `depth - 1` levels deep.
+    `titles` names the sections (cycled); the default is "Section <i>".
+    '''
+    root = Path(root)
+    (root / 'sections').mkdir(parents=True, exist_ok=True)
+    (root / 'figures').mkdir(exist_ok=True)
+    (root / 'figures' / 'standalone.tex').write_text(
+        "\\documentclass{standalone}\n\\begin{document}\nfigure\n\\end{document}\n"
+    )
+    table = make_table(table_rows)
+    inputs = []
+    for i in range(n_sections):
+        name = f"section{i:03d}"
+        title = f"{titles[i % len(titles)]} {i}" if titles else f"Section {i}"
+        files = [name] + [f"{name}_{level}" for level in range(1, depth)]
+        for level, file_name in enumerate(files):
+            if level == 0:
+                body = [f"\\section{{{title}}}\\label{{sec:{i}}}\n"] + [PARAGRAPH] * paragraphs + [table] * tables
+            else:
+                body = [f"\\subsection{{Part {level}}}\n"] + [PARAGRAPH] * paragraphs
+            if level + 1 < len(files):
+                body.append(f"\\input{{sections/{files[level + 1]}}}\n")
+            (root / 'sections' / f"{file_name}.tex").write_text(''.join(body))
+        inputs.append(f"\\input{{sections/{name}}}\n")
+    (root / 'main.tex').write_text(
+        "\\documentclass{article}\n\\usepackage{amsmath}\n\\begin{document}\n"
+        + ''.join(inputs)
+        + "\\bibliography{refs}\n\\end{document}\n"
+    )
+    return root
+
+
+def _measure(fn, repeat, trace_memory=True):
+    '''Best wall time over `repeat` runs and peak traced memory (tracemalloc slows the run down,
+    so it is optional)'''
+    best, peak = float('inf'), 0
+    for _ in range(repeat):
+        if trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+        if trace_memory:
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+    return best, peak
+
+
+def texsoup_path(extract_path):
+    parse_tex_file.cache_clear()
+    main_text = find_main_tex_file(extract_path)
+    sections = parse_sections_texsoup(main_text, extract_path) or {}
+    return {name: str(contents) for name, contents in sections.items()}
+
+def stream_path(extract_path):
+    main_text = find_main_tex_file(extract_path)
+    return extract_sections(main_text)
+
+TEX_PARSERS = {'texsoup': texsoup_path, 'stream': stream_path}
+
+
+def bench_tex(section_counts, repeat=3, parsers=('texsoup', 'stream')):
+    with redirect_stdout(io.StringIO()):
+        # Only the fixture papers, not test/__pycache__ and the like
+        fixtures = [p for p in sorted(TEST_DIR.iterdir()) if p.is_dir() and find_main_tex_file(p) is not None]
+    cases = [(f"fixture {p.name}", p) for p in fixtures]
+    workdir = Path(tempfile.mkdtemp(prefix='bench_tex_'))
+    try:
+        for n in section_counts:
+            cases.append((f"synthetic {n} sections", make_synthetic_paper(workdir / f"paper_{n}", n_sections=n)))
+
+        print(f"{'case':<28}{'parser':<10}{'time (ms)':>12}{'peak (KiB)':>12}{'sections':>10}")
+        for label, path in cases:
+            for parser in parsers:
+                fn = TEX_PARSERS[parser]
+                with redirect_stdout(io.StringIO()):
+                    sections = fn(path)
+                    seconds, peak = _measure(lambda: fn(path), repeat)
+                print(f"{label:<28}{parser:<10}{seconds * 1000:>12.1f}{peak / 1024:>12.0f}{len(sections):>10}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def bench_functions(section_counts, depth=1, table_rows=40, repeat=3):
+    '''Time the TexSoup-path building blocks one by one on synthetic trees'''
+    workdir = Path(tempfile.mkdtemp(prefix='bench_fn_'))
+    try:
+        print(f"{'case':<28}{'function':<24}{'time (ms)':>12}")
+        for n in section_counts:
+            root = make_synthetic_paper(workdir / f"paper_{n}", n_sections=n, depth=depth, table_rows=table_rows)
+            with redirect_stdout(io.StringIO()):
+                main_text = find_main_tex_file(root)
+                input_list = find_tex_command(parse_tex_file(main_text), 'input')
+                section_filepaths = create_sections_from_main_tex(input_list, root)
+
+            def parse():
+                parse_tex_file.cache_clear()
+                return parse_tex_file(main_text)
+
+            steps = [
+                ('find_main_tex_file', lambda: find_main_tex_file(root)),
+                ('parse_tex_file', parse),
+                ('create_section_dict', lambda: create_section_dict(section_filepaths)),
+                ('extract_sections', lambda: extract_sections(main_text)),
+            ]
+            label = f"{n} sections, depth {depth}"
+            for name, fn in steps:
+                with redirect_stdout(io.StringIO()):
+                    seconds, _ = _measure(fn, repeat, trace_memory=False)
+                print(f"{label:<28}{name:<24}{seconds * 1000:>12.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def make_synthetic_papers(papers_dir, n_papers, n_sections=8, paragraphs=20, depth=1):
+    '''Write n_papers source tarballs into papers_dir. Returns (paper_info_list, file_list) in the
+    form fetch_latest_ml_papers returns them.
+    '''
+    papers_dir = Path(papers_dir)
+    papers_dir.mkdir(parents=True, exist_ok=True)
+    papers, files = [], []
+    for i in range(n_papers):
+        arxiv_id = f"2401.{i:05d}v1"
+        tree = make_synthetic_paper(papers_dir / f"tree_{i}", n_sections=n_sections, paragraphs=paragraphs,
+                                    depth=depth, titles=SECTION_TITLES)
+        # Distinct text per paper, so cold-cache runs really call the LLM for every section
+        for section_file in (tree / 'sections').glob('*.tex'):
+            section_file.write_text(section_file.read_text() + f"Paper {i}.\n")
+        filename = f"{arxiv_id}.tar.gz"
+        with tarfile.open(papers_dir / filename, 'w:gz') as tar:
+            tar.add(tree, arcname='.')
+        shutil.rmtree(tree)
+        papers.append({'title': f"Synthetic paper {i}", 'arxiv_id': arxiv_id,
+                       'arxiv_url': f"http://arxiv.org/abs/{arxiv_id}"})
+        files.append(filename)
+    return papers, files
+
+
+def run_e2e(workdir, papers, files, mode, workers, cache, latency, error_rate):
+    '''One generate_newsletter_content run against the fake LLM. Returns (seconds, report, n_entries)'''
+    metrics = Metrics()
+    set_default_metrics(metrics)
+    set_default_cache(cache)
+    registry = SectionPromptRegistry(workdir / 'section_prompts.json')
+    set_default_registry(registry)
+    engine = None
+    if mode == 'async':
+        engine = AsyncSummaryEngine(client=FakeAsyncOpenAI(latency=latency, error_rate=error_rate), cache=cache,
+                                    prompt_registry=registry, base_delay=0.01)
+    else:
+        utils.set_client(FakeOpenAI(latency=latency, error_rate=error_rate))
+    start = time.perf_counter()
+    try:
+        with redirect_stdout(io.StringIO()):
+            entries = generate_newsletter_content(papers, files, workdir / 'papers', max_workers=workers, engine=engine,
+                                                  summary_dir=workdir / 'summaries')
+    finally:
+        if engine is not None:
+            engine.close()
+    return time.perf_counter() - start, metrics.report(), len(entries)
+
+def bench_e2e(n_papers, n_sections=8, latency=0.1, error_rate=0.0, worker_counts=(1, 4), modes=('sync', 'async')):
+    '''End-to-end throughput of extract -> summarize -> render over synthetic papers, per mode,
+    worker count and cache state (cold: empty summary cache, warm: the same run again)
+    '''
+    workdir = Path(tempfile.mkdtemp(prefix='bench_e2e_'))
+    try:
+        papers, files = make_synthetic_papers(workdir / 'papers', n_papers, n_sections=n_sections)
+        print(f"{n_papers} papers x {n_sections} sections, LLM latency {latency * 1000:.0f} ms, error rate {error_rate:.0%}")
+        print(f"{'mode':<8}{'workers':>8}{'cache':>7}{'time (s)':>10}{'papers/s':>10}{'entries':>9}"
+              f"{'api calls':>11}{'retries':>9}{'errors':>8}{'p50 ms':>9}{'p99 ms':>9}")
+        for mode in modes:
+            for workers in worker_counts:
+                cache = SummaryCache(workdir / f"cache_{mode}_{workers}.sqlite")
+                for state in ('cold', 'warm'):
+                    seconds, report, n_entries = run_e2e(workdir, papers, files, mode, workers, cache, latency, error_rate)
+                    llm = report['llm']
+                    latency_stats = llm['latency']
+                    p50 = latency_stats.get('p50_s', 0) * 1000
+                    p99 = latency_stats.get('p99_s', 0) * 1000
+                    print(f"{mode:<8}{workers:>8}{state:>7}{seconds:>10.2f}{n_papers / seconds:>10.1f}{n_entries:>9}"
+                          f"{llm['api_calls']:>11}{llm['retries']:>9}{report['counters'].get('llm_error', 0):>8}{p50:>9.0f}{p99:>9.0f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+ISSUE_ENTRY = (
+    "## {title}\n\n"
+    "### Objective\n\nWe ask whether **sparse attention** with cost $O(n \\log n)$ matches *dense* attention.\n\n"
+    "### Method\n\nA kernel $k(x, y) = e^{{-\\|x - y\\|^2}}$ trained with [JAX](https://github.com/google/jax) and\n"
+    "$$\\mathcal{{L}} = \\sum_i \\ell(f(x_i), y_i) + \\lambda \\|w\\|^2$$\n\n"
+    "### Results\n\nAccuracy improves by 3.1% on **ImageNet** and *CIFAR-10*.\n\n"
+    "### Significance\n\nCheaper long-context models.\n\n"
+    "arxiv: http://arxiv.org/abs/{arxiv_id}\n\n---\n\n"
+)
+
+
+def make_synthetic_archive(root, years=3, papers_per_issue=(5, 20), seed=0):
+    '''Write weekly issues newsletter/<year>/n_<date>.md for `years` years'''
+    rng = random.Random(seed)
+    root = Path(root)
+    paths = []
+    for year in range(2024, 2024 + years):
+        (root / str(year)).mkdir(parents=True, exist_ok=True)
+        for week in range(52):
+            date = f"{year}-{1 + week // 5:02d}-{1 + week % 5 * 6:02d}"
+            entries = [
+                ISSUE_ENTRY.format(title=f"Paper {year}-{week}-{i}", arxiv_id=f"{year % 100}01.{week:02d}{i:03d}")
+                for i in range(rng.randint(*papers_per_issue))
+            ]
+            path = root / str(year) / f"n_{date}.md"
+            path.write_text(''.join(entries))
+            paths.append(path)
+    return paths
+
+
+def legacy_convert_markdown_section(markdown):
+    '''The multi-pass re.sub renderer this module replaced, kept as a baseline'''
+    markdown = re.sub(r'^###\s*(.*?)$', r'<strong>\1</strong>', markdown, flags=re.MULTILINE)
+    markdown = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', markdown)
+    markdown = re.sub(r'\*(.*?)\*', r'<em>\1</em>', markdown)
+    markdown = re.sub(r'\[(.*?)\]\(((?!http://arxiv\.org).*?)\)', r'<a href="\2">\1</a>', markdown)
+    markdown = re.sub(r'\$(.+?)\$', r'\\(\1\\)', markdown)
+    markdown = re.sub(r'\$\$(.*?)\$\$', r'\\[\1\\]', markdown, flags=re.DOTALL)
+    markdown = markdown.replace('\n\n', '</p><p>')
+    return f'<p>{markdown}</p>'
+
+
+def bench_markdown(years, repeat=3, worker_counts=(1, 4)):
+    workdir = Path(tempfile.mkdtemp(prefix='bench_md_'))
+    try:
+        paths = make_synthetic_archive(workdir / 'newsletter', years=years)
+        contents = [p.read_text() for p in paths]
+        n_bytes = sum(len(c) for c in contents)
+        print(f"{len(paths)} issues, {n_bytes / 1024:.0f} KiB of Markdown")
+
+        sections = [s for c in contents for s in c.split('\n---\n') if s.strip()]
+        for label, fn in (('legacy multi-pass', legacy_convert_markdown_section), ('single-pass', convert_markdown_section)):
+            seconds, _ = _measure(lambda: [fn(s) for s in sections], repeat, trace_memory=False)
+            print(f"{label:<28}{seconds * 1000:>10.1f} ms  ({len(sections)} sections)")
+        seconds, _ = _measure(lambda: [markdown_to_html(c) for c in contents], repeat, trace_memory=False)
+        print(f"{'markdown_to_html (all)':<28}{seconds * 1000:>10.1f} ms")
+
+        newsletter_dir = workdir / 'newsletter'
+        timings = []
+        for workers in worker_counts:
+            shutil.rmtree(newsletter_dir / 'html', ignore_errors=True)
+            start = time.perf_counter()
+            written = build_site(newsletter_dir, max_workers=workers)
+            timings.append((f'cold site build ({workers} proc)', time.perf_counter() - start, len(written)))
+        start = time.perf_counter()
+        written = build_site(newsletter_dir)
+        timings.append(('no-op rebuild', time.perf_counter() - start, len(written)))
+        paths[-1].write_text(contents[-1] + ISSUE_ENTRY.format(title='Late addition', arxiv_id='0000.00000'))
+        start = time.perf_counter()
+        written = build_site(newsletter_dir)
+        timings.append(('one issue changed', time.perf_counter() - start, len(written)))
+        for label, seconds, count in timings:
+            print(f"{label:<28}{seconds * 1000:>10.1f} ms  ({count} written)")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline benchmarks for the newsletter pipeline')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    tex = subparsers.add_parser('tex', help='TexSoup vs streaming section extraction')
+    tex.add_argument('--sections', type=int, nargs='+', default=[10, 50])
+    tex.add_argument('--repeat', type=int, default=3)
+    tex.add_argument('--parsers', nargs='+', choices=sorted(TEX_PARSERS), default=['texsoup', 'stream'])
+    functions = subparsers.add_parser('functions', help='find_main_tex_file, parse_tex_file, create_section_dict one by one')
+    functions.add_argument('--sections', type=int, nargs='+', default=[10, 50])
+    functions.add_argument('--depth', type=int, default=1, help='Levels of nested \\input per section')
+    functions.add_argument('--table-rows', type=int, default=40)
+    functions.add_argument('--repeat', type=int, default=3)
+    markdown = subparsers.add_parser('markdown', help='Markdown rendering and incremental archive builds')
+    markdown.add_argument('--years', type=int, default=3)
+    markdown.add_argument('--repeat', type=int, default=3)
+    markdown.add_argument('--workers', type=int, nargs='+', default=[1, 4], help='Render process counts to compare')
+    e2e = subparsers.add_parser('e2e', help='End-to-end throughput with a fake LLM client')
+    e2e.add_argument('--papers', type=int, default=20)
+    e2e.add_argument('--sections', type=int, default=8)
+    e2e.add_argument('--latency', type=float, default=0.1, help='Seconds per fake LLM call')
+    e2e.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake LLM calls that fail with a 429')
+    e2e.add_argument('--workers', type=int, nargs='+', default=[1, 4], help='Paper worker counts to compare')
+    e2e.add_argument('--modes', nargs='+', choices=['sync', 'async'], default=['sync', 'async'])
+    args = parser.parse_args()
+
+    if args.command == 'tex':
+        bench_tex(args.sections, repeat=args.repeat, parsers=args.parsers)
+    elif args.command == 'functions':
+        bench_functions(args.sections, depth=args.depth, table_rows=args.table_rows, repeat=args.repeat)
+    elif args.command == 'markdown':
+        bench_markdown(args.years, repeat=args.repeat, worker_counts=args.workers)
+    elif args.command == 'e2e':
+        bench_e2e(args.papers, n_sections=args.sections, latency=args.latency, error_rate=args.error_rate,
+                  worker_counts=args.workers, modes=args.modes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+'''Token-aware chunking and per-paper token budgets for section summarization.'''
+import re
+from functools import lru_cache
+from section_prompts import get_default_registry
+
+try:
+    import tiktoken
+except ImportError:  # optional: fall back to the ~4 characters per token estimate
+    tiktoken = None
+
+DEFAULT_CHUNK_TOKENS = 6000
+DEFAULT_PAPER_TOKEN_BUDGET = 48000
+MIN_SECTION_TOKENS = 200
+
+# Section kinds in the order they are trimmed when a paper is over budget (least valuable first)
+TRIM_ORDER = [
+    'appendix', 'related_work', None, 'background', 'theory', 'discussion', 'experiments',
+    'conclusion', 'results', 'methods', 'introduction', 'abstract',
+]
+
+PARAGRAPH_SPLIT_RE = re.compile(r'\n\s*\n')
+ENV_RE = re.compile(r'\\(begin|end)\s*\{[^}]*\}')
+
+
+@lru_cache(maxsize=8)
+def _encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+
+def count_tokens(text, model="gpt-4o-mini"):
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def _blocks(text):
+    '''Paragraphs, with any paragraph that opens an environment merged up to the one closing it'''
+    block, depth = [], 0
+    for paragraph in PARAGRAPH_SPLIT_RE.split(text):
+        block.append(paragraph)
+        for match in ENV_RE.finditer(paragraph):
+            depth += 1 if match.group(1) == 'begin' else -1
+        if depth <= 0:
+            depth = 0
+            yield '\n\n'.join(block)
+            block = []
+    if block:
+        yield '\n\n'.join(block)
+
+def _split_oversized(block, max_tokens, model):
+    # A single block larger than the budget is split on lines, then hard-split on characters
+    pieces, current, current_tokens = [], [], 0
+    for line in block.splitlines(keepends=True):
+        tokens = count_tokens(line, model)
+        if tokens > max_tokens:
+            step = max(1, len(line) * max_tokens // tokens)
+            for i in range(0, len(line), step):
+                pieces.append(line[i:i + step])
+            continue
+        if current and current_tokens + tokens > max_tokens:
+            pieces.append(''.join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += tokens
+    if current:
+        pieces.append(''.join(current))
+    return pieces
+
+def split_into_chunks(text, max_tokens=DEFAULT_CHUNK_TOKENS, model="gpt-4o-mini"):
+    '''Split text into chunks of at most `max_tokens`, breaking on paragraph and environment boundaries'''
+    if count_tokens(text, model) <= max_tokens:
+        return [text]
+    chunks, current, current_tokens = [], [], 0
+    for block in _blocks(text):
+        tokens = count_tokens(block, model)
+        if tokens > max_tokens:
+            pieces = _split_oversized(block, max_tokens, model)
+        else:
+            pieces = [block]
+        for piece in pieces:
+            piece_tokens = tokens if len(pieces) == 1 else count_tokens(piece, model)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append('\n\n'.join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
+
+
+def apply_token_budget(section_dict, budget=DEFAULT_PAPER_TOKEN_BUDGET, model="gpt-4o-mini"):
+    '''Trim a paper's sections to fit `budget` tokens. The least valuable kinds (appendix, related
+    work, ...) are cut first, each down to a prefix that ends on a paragraph boundary, or dropped
+    if less than MIN_SECTION_TOKENS would remain. Returns a new dict in the original order.
+    '''
+    texts = {name: str(contents) for name, contents in section_dict.items()}
+    tokens = {name: count_tokens(text, model) for name, text in texts.items()}
+    excess = sum(tokens.values()) - budget
+    if excess <= 0:
+        return texts
+
+    registry = get_default_registry()
+    kinds = {name: registry.kind_of(name) for name in texts}
+    rank = {kind: i for i, kind in enumerate(TRIM_ORDER)}
+    # Within a kind, later sections go first (e.g. the last appendix before the first). Kinds added
+    # in the persisted registry but missing from TRIM_ORDER rank with unknown sections.
+    order = sorted(texts, key=lambda name: (rank.get(kinds[name], rank[None]), -list(texts).index(name)))
+    for name in order:
+        if excess <= 0:
+            break
+        keep = tokens[name] - excess
+        if keep < MIN_SECTION_TOKENS:
+            print(f"**INFO: Dropping section {name} ({tokens[name]} tokens) to fit the token budget")
+            excess -= tokens[name]
+            del texts[name]
+        else:
+            print(f"**INFO: Trimming section {name} to {keep} tokens to fit the token budget")
+            texts[name] = split_into_chunks(texts[name], keep, model)[0]
+            excess -= tokens[name] - count_tokens(texts[name], model)
+    return texts
@@ -0,0 +1,231 @@
+'''Run configuration: stage models, concurrency, cache and output settings, and the topics of a run.
+
+    python generate_newsletter.py --config newsletter.toml
+
+Every key of a config file (TOML, or YAML when PyYAML is installed) is optional and overrides the
+defaults below. Each [[topics]] entry becomes its own newsletter, but all topics of a run share
+the arXiv fetch, the downloaded sources, the per-paper pipeline and the summary cache, so a paper
+picked by several topics is extracted, parsed and summarized once.
+
+    [fetch]
+    candidates = 200
+
+    [models.article]
+    model = "gpt-4o-mini"
+    temperature = 0.37
+    max_tokens = 300
+
+    [concurrency]
+    workers = 4
+    executor = "thread"   # or "process"
+    max_in_flight = 8
+
+    [summaries]
+    token_budget = 48000  # tokens of section text per paper; the least valuable sections are cut first
+    chunk_tokens = 6000   # longer sections are summarized chunk by chunk
+
+    [[topics]]
+    name = "language-models"
+    title = "Language Model Research Highlights"
+    query = "large language models"
+    categories = ["cs.CL", "cs.LG"]
+    papers = 5
+    profiles = { llm = "large language models pretraining instruction tuning alignment reasoning" }
+
+Relative paths are resolved against the directory of the config file.
+'''
+import re
+import copy
+import threading
+import tomllib
+from pathlib import Path
+from chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_PAPER_TOKEN_BUDGET
+
+try:
+    import yaml
+except ImportError:  # optional: only needed for .yaml/.yml config files
+    yaml = None
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Completion parameters per LLM call kind; changing them changes the summary cache keys
+DEFAULT_STAGE_PARAMS = {
+    'prompt': {'model': 'gpt-4o-mini'},
+    'section': {'model': 'gpt-4o-mini'},
+    'chunk': {'model': 'gpt-4o-mini'},
+    'article': {'model': 'gpt-4o-mini', 'temperature': 0.37, 'max_tokens': 300},
+}
+OUTPUT_FORMATS = ('markdown', 'html', 'rss')
+# Pools the per-paper pipeline can run in (see paper_summary_generator.generate_newsletter_content)
+EXECUTORS = ('thread', 'process')
+TOPIC_NAME_RE = re.compile(r'^[a-z0-9][a-z0-9_\-]*$')
+
+DEFAULT_CONFIG = {
+    'run': {
+        'parser': 'stream',
+        'extract_mode': 'memory',
+        'use_async': True,
+        'batch': False,
+        'batch_poll': 30.0,
+    },
+    'fetch': {
+        'candidates': 200,
+    },
+    'models': DEFAULT_STAGE_PARAMS,
+    'concurrency': {
+        'workers': 4,
+        'executor': 'thread',
+        'download_workers': 4,
+        'max_in_flight': 8,
+        'requests_per_minute': 500,
+        'tokens_per_minute': 200000,
+        'max_retries': 5,
+    },
+    'summaries': {
+        'token_budget': DEFAULT_PAPER_TOKEN_BUDGET,
+        'chunk_tokens': DEFAULT_CHUNK_TOKENS,
+    },
+    'cache': {
+        'dir': 'summary_cache',
+        'max_mb': 256,
+        'max_age_days': 365,
+    },
+    'output': {
+        'newsletter_dir': 'newsletter',
+        'formats': list(OUTPUT_FORMATS),
+        'site_url': 'https://mehrabiani.com/newsletter',
+    },
+    'topics': [],
+}
+
+# The newsletter as it was before topics existed: written straight into output.newsletter_dir
+DEFAULT_TOPIC = {
+    'name': 'machine-learning',
+    'title': 'Newsletter Mehrabiani',
+    'heading': 'Weekly Machine Learning Research Highlights',
+    'query': 'machine learning',
+    'categories': [],
+    'papers': 5,
+    # Ranked against the generic machine learning profiles (paper_filter.TOPIC_PROFILES)
+    'profiles': None,
+}
+
+
+def _merge(defaults, overrides, path=''):
+    merged = copy.deepcopy(defaults)
+    for key, value in overrides.items():
+        if key not in defaults:
+            raise ValueError(f"Unknown config key {path + key!r}")
+        if isinstance(defaults[key], dict) and key != 'models':
+            if not isinstance(value, dict):
+                raise ValueError(f"Config key {path + key!r} must be a table")
+            merged[key] = _merge(defaults[key], value, f"{path}{key}.")
+        else:
+            merged[key] = value
+    return merged
+
+def read_config_file(path):
+    path = Path(path)
+    if path.suffix.lower() in ('.yaml', '.yml'):
+        if yaml is None:
+            raise ValueError(f"PyYAML is not installed, can't read {path} (use a .toml config instead)")
+        with open(path, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+    with open(path, 'rb') as f:
+        return tomllib.load(f)
+
+def load_config(path=None):
+    '''Defaults merged with the config file at `path` (if any), with paths made absolute and the
+    topics normalized (see normalize_topic). Raises ValueError for unknown keys or bad values.
+    '''
+    overrides = read_config_file(path) if path else {}
+    config = _merge(DEFAULT_CONFIG, overrides)
+    root = Path(path).resolve().parent if path else BASE_DIR
+
+    models = copy.deepcopy(DEFAULT_STAGE_PARAMS)
+    for kind, params in config['models'].items():
+        if kind not in models:
+            raise ValueError(f"Unknown model stage {kind!r}, expected one of {list(models)}")
+        models[kind].update(params)
+    config['models'] = models
+
+    unknown = set(config['output']['formats']) - set(OUTPUT_FORMATS)
+    if unknown:
+        raise ValueError(f"Unknown output formats {sorted(unknown)}, expected some of {list(OUTPUT_FORMATS)}")
+    if config['concurrency']['executor'] not in EXECUTORS:
+        raise ValueError(f"Unknown executor {config['concurrency']['executor']!r}, expected one of {list(EXECUTORS)}")
+    for key, value in config['summaries'].items():
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            raise ValueError(f"Config key 'summaries.{key}' must be a positive integer, got {value!r}")
+    config['cache']['dir'] = root / config['cache']['dir']
+    config['output']['newsletter_dir'] = root / config['output']['newsletter_dir']
+
+    newsletter_dir = config['output']['newsletter_dir']
+    if config['topics']:
+        config['topics'] = [normalize_topic(topic, newsletter_dir / topic.get('name', ''), root) for topic in config['topics']]
+    else:
+        config['topics'] = [normalize_topic(DEFAULT_TOPIC, newsletter_dir, root)]
+    names = [topic['name'] for topic in config['topics']]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Topic names must be unique, got {names}")
+    return config
+
+def normalize_topic(topic, newsletter_dir, root=BASE_DIR):
+    '''Topic dict with every key filled in: name, title, heading (page headings, default: the title),
+    query, categories, papers, profiles, newsletter_dir, site_dir and site_url (None: output.site_url).
+
+    profiles is a table of profile name -> keywords the fetched papers are ranked against. Without
+    one a topic is ranked against its own query; a topic with only categories keeps arXiv's order.
+    None (DEFAULT_TOPIC) selects the generic machine learning profiles, paper_filter.TOPIC_PROFILES.
+    '''
+    unknown = set(topic) - {
+        'name', 'title', 'heading', 'query', 'categories', 'papers', 'profiles', 'newsletter_dir', 'site_dir', 'site_url'
+    }
+    if unknown:
+        raise ValueError(f"Unknown topic keys {sorted(unknown)}")
+    name = topic.get('name')
+    if not name or not TOPIC_NAME_RE.match(name):
+        raise ValueError(f"Topic name {name!r} must be lowercase letters, digits, '-' or '_'")
+    if not topic.get('query') and not topic.get('categories'):
+        raise ValueError(f"Topic {name!r} needs a query or categories")
+    if 'profiles' not in topic:
+        profiles = {name: topic['query']} if topic.get('query') else {}
+    else:
+        profiles = topic['profiles']
+        if profiles is not None and (not isinstance(profiles, dict) or not all(
+                isinstance(keywords, str) and keywords.strip() for keywords in profiles.values())):
+            raise ValueError(f"Topic {name!r} profiles must be a table of profile name -> keywords")
+    newsletter_dir = root / topic['newsletter_dir'] if topic.get('newsletter_dir') else Path(newsletter_dir)
+    return {
+        'name': name,
+        'title': topic.get('title', name),
+        'heading': topic.get('heading') or topic.get('title', name),
+        'query': topic.get('query', ''),
+        'categories': list(topic.get('categories', [])),
+        'papers': int(topic.get('papers', DEFAULT_TOPIC['papers'])),
+        'profiles': profiles,
+        'newsletter_dir': newsletter_dir,
+        'site_dir': root / topic['site_dir'] if topic.get('site_dir') else newsletter_dir / 'html',
+        'site_url': topic.get('site_url'),
+    }
+
+def engine_options(config):
+    '''AsyncSummaryEngine keyword arguments from the [concurrency] and [summaries] settings'''
+    concurrency = config['concurrency']
+    options = {key: concurrency[key] for key in ('max_in_flight', 'requests_per_minute', 'tokens_per_minute', 'max_retries')}
+    return {**options, **config['summaries']}
+
+
+_stage_params = copy.deepcopy(DEFAULT_STAGE_PARAMS)
+_stage_params_lock = threading.Lock()
+
+def get_stage_params(kind):
+    '''Completion parameters (model, temperature, ...) for one LLM call kind'''
+    with _stage_params_lock:
+        return dict(_stage_params.get(kind) or _stage_params['section'])
+
+def set_stage_params(params):
+    '''Replace the per-kind parameters, e.g. with load_config(...)['models']'''
+    global _stage_params
+    with _stage_params_lock:
+        _stage_params = {**copy.deepcopy(DEFAULT_STAGE_PARAMS), **copy.deepcopy(params)}
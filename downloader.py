@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from paper_store import paper_key
+from metrics import get_default_metrics
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: the manifest is then only safe within one process
+    fcntl = None
+
+MANIFEST_NAME = 'download_manifest.json'
+CHUNK_SIZE = 1 << 16
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# .part files untouched for this long belong to a download that died, not one still running
+STALE_PART_SECONDS = 3600
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DownloadManifest:
+    '''JSON record of completed downloads, keyed by arXiv ID, rewritten atomically after every file
+    so an interrupted batch can be resumed. Several processes (the weekly run and the service) can
+    download into the same directory: every write re-reads the manifest and merges into it under a
+    file lock.
+    '''
+    def __init__(self, dest_dir):
+        self.path = Path(dest_dir) / MANIFEST_NAME
+        self.lock_path = self.path.with_name(f"{MANIFEST_NAME}.lock")
+        self._lock = threading.Lock()
+        self.entries = self._read()
+
+    def _read(self):
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            print(f"**WARNING: Ignoring corrupt download manifest {self.path}")
+            return {}
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get(self, arxiv_id):
+        '''Manifest entry of a paper, including ones another process recorded since this one was read'''
+        entry = self.entries.get(arxiv_id)
+        if entry is None:
+            entry = self._read().get(arxiv_id)
+        return entry
+
+    def is_complete(self, arxiv_id, file_path):
+        entry = self.get(arxiv_id)
+        if entry is None or entry['filename'] != file_path.name or not file_path.exists():
+            return False
+        if file_path.stat().st_size != entry['size']:
+            return False
+        return file_sha256(file_path) == entry['sha256']
+
+    def record(self, arxiv_id, file_path, sha256, url):
+        entry = {'filename': file_path.name, 'sha256': sha256, 'size': file_path.stat().st_size, 'url': url}
+        with self._lock, self._file_lock():
+            self.entries = {**self._read(), arxiv_id: entry}
+            tmp_path = self.path.with_name(f".{MANIFEST_NAME}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=4)
+            os.replace(tmp_path, self.path)
+
+
+def recorded_sha256(file_path):
+    '''The sha256 the download manifest next to file_path recorded for it, or None if the file isn't
+    in it (or its size no longer matches), so callers don't have to hash the file again
+    '''
+    file_path = Path(file_path)
+    size = file_path.stat().st_size
+    for entry in DownloadManifest(file_path.parent).entries.values():
+        if entry['filename'] == file_path.name and entry['size'] == size:
+            return entry['sha256']
+    return None
+
+
+def make_session(max_workers):
+    # One pooled session shared by all workers, so connections to arxiv.org are kept alive and reused
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = 'ml-newsletter'
+    return session
+
+def download_file(session, url, file_path, timeout=60, retries=3, base_delay=1.0):
+    '''Stream url to a temp file next to file_path and rename it into place. Returns the sha256.'''
+    tmp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.{threading.get_ident()}.part")
+    for attempt in range(retries + 1):
+        try:
+            with session.get(url, stream=True, timeout=timeout) as response:
+                if response.status_code in RETRYABLE_STATUS_CODES and attempt < retries:
+                    raise requests.HTTPError(f"{response.status_code} for {url}", response=response)
+                response.raise_for_status()
+                digest = hashlib.sha256()
+                with open(tmp_path, 'wb') as f:
+                    for block in response.iter_content(CHUNK_SIZE):
+                        digest.update(block)
+                        f.write(block)
+            os.replace(tmp_path, file_path)
+            return digest.hexdigest()
+        except requests.RequestException as e:
+            tmp_path.unlink(missing_ok=True)
+            status = getattr(e.response, 'status_code', None)
+            if attempt == retries or (status is not None and status not in RETRYABLE_STATUS_CODES):
+                raise
+            delay = random.uniform(0, base_delay * 2 ** attempt)
+            get_default_metrics().count('download_retry')
+            print(f"**WARNING: Download of {url} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def remove_stale_parts(dest_dir, max_age=STALE_PART_SECONDS):
+    '''Delete the .part files of interrupted downloads; recent ones may be another process's'''
+    cutoff = time.time() - max_age
+    for part in Path(dest_dir).glob('.*.part'):
+        try:
+            if part.stat().st_mtime < cutoff:
+                part.unlink()
+        except FileNotFoundError:
+            pass
+
+def download_sources(jobs, dest_dir, max_workers=4, timeout=60, retries=3, base_delay=1.0, session=None):
+    '''Download (arxiv_id, url, filename) jobs concurrently into dest_dir.
+
+    Files already recorded in the manifest with a matching checksum are skipped. Returns a dict
+    mapping arxiv_id to the downloaded Path, or None where the download failed. A long-lived caller
+    can pass its own `session` (see make_session) to keep connections warm between calls.
+    '''
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    remove_stale_parts(dest_dir)
+    manifest = DownloadManifest(dest_dir)
+    owns_session = session is None
+    session = session or make_session(max_workers)
+
+    def fetch(job):
+        arxiv_id, url, filename = job
+        file_path = dest_dir / filename
+        if manifest.is_complete(arxiv_id, file_path):
+            print(f"**INFO: already downloaded {arxiv_id} -> {filename}")
+            return arxiv_id, file_path
+        try:
+            with get_default_metrics().span('download', paper=paper_key(arxiv_id)):
+                sha256 = download_file(session, url, file_path, timeout=timeout, retries=retries, base_delay=base_delay)
+        except Exception as e:
+            print(f"**ERROR: Failed to download {arxiv_id} from {url}: {e}")
+            return arxiv_id, None
+        manifest.record(arxiv_id, file_path, sha256, url)
+        print(f"MESSAGE -> Downloaded {arxiv_id} -> {filename}")
+        return arxiv_id, file_path
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return dict(pool.map(fetch, jobs))
+    finally:
+        if owns_session:
+            session.close()
@@ -1,7 +1,99 @@
-from postprocess import generate_newsletter
-from paper_summary_generator import run_generator
+'''Command line entry point: summarize the week's papers for every configured topic, then build
+each topic's site.
+
+    python generate_newsletter.py                            # the machine learning newsletter
+    python generate_newsletter.py --config newsletter.toml   # topics, models, limits, outputs
+    python generate_newsletter.py --config newsletter.toml --topic language-models --site-only
+
+See config.py for the config file format. Command line flags override the config file.
+'''
+import argparse
+from config import EXECUTORS, load_config, set_stage_params, engine_options
+from summary_cache import SummaryCache, set_default_cache
+from section_prompts import SectionPromptRegistry, set_default_registry
+from pipeline import STAGES
+from postprocess import build_site
+
+
+def apply_config(config):
+    '''Install the configured stage models, summary cache and prompt registry as the process defaults'''
+    set_stage_params(config['models'])
+    cache = config['cache']
+    set_default_cache(SummaryCache(
+        cache['dir'] / 'cache.sqlite', max_bytes=cache['max_mb'] * 1024 * 1024, max_age_days=cache['max_age_days']
+    ))
+    set_default_registry(SectionPromptRegistry(cache['dir'] / 'section_prompts.json'))
+
+def build_sites(config, topics, max_workers=None, force=False):
+    formats = [f for f in config['output']['formats'] if f != 'markdown']
+    if not formats:
+        return
+    for topic in topics:
+        build_site(
+            topic['newsletter_dir'], output_dir=topic['site_dir'], max_workers=max_workers, force=force,
+            site_url=topic['site_url'] or config['output']['site_url'], title=topic['title'], formats=formats,
+            heading=topic['heading'], model=config['models']['article']['model']
+        )
+
+def select_topics(config, names):
+    if not names:
+        return config['topics']
+    known = {topic['name']: topic for topic in config['topics']}
+    missing = [name for name in names if name not in known]
+    if missing:
+        raise SystemExit(f"** ERROR: unknown topic(s) {missing}, configured: {list(known)}")
+    return [known[name] for name in names]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate the weekly newsletters')
+    parser.add_argument('--config', help='TOML (or YAML) config file, see config.py')
+    parser.add_argument('--topic', action='append', dest='topics', help='Only run this topic (repeatable)')
+    parser.add_argument('--test', action='store_true', help='Use the papers in test/ instead of fetching from arXiv')
+    parser.add_argument('--resume', action='store_true', help='Skip work that already has a checkpoint')
+    stage_group = parser.add_mutually_exclusive_group()
+    stage_group.add_argument('--from-stage', choices=STAGES, help='Rerun this stage and the ones after it')
+    stage_group.add_argument('--only-stage', choices=STAGES, help='Rerun only this stage')
+    parser.add_argument('--run-id', help='Checkpoint run to use (default: latest when reusing, else today)')
+    parser.add_argument('--workers', type=int, help='Papers processed concurrently')
+    parser.add_argument('--executor', choices=EXECUTORS, help='Process papers in a thread or a process pool')
+    parser.add_argument('--papers', type=int, help='Papers per issue, for every topic')
+    parser.add_argument('--candidates', type=int, help='Papers fetched from arXiv per topic before filtering')
+    parser.add_argument('--token-budget', type=int, help='Tokens of section text summarized per paper')
+    parser.add_argument('--chunk-tokens', type=int, help='Sections longer than this are summarized in chunks')
+    parser.add_argument('--batch', action='store_true', default=None, help='Summarize through the OpenAI Batch API')
+    site_group = parser.add_mutually_exclusive_group()
+    site_group.add_argument('--site-only', action='store_true', help='Only rebuild the sites from existing issues')
+    site_group.add_argument('--no-site', action='store_true', help="Don't build the sites after the run")
+    parser.add_argument('--force-site', action='store_true', help='Re-render every issue page')
+    args = parser.parse_args(argv)
+
+    try:
+        config = load_config(args.config)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"** ERROR: invalid config {args.config}: {e}")
+    topics = select_topics(config, args.topics)
+    if args.papers is not None:
+        topics = [{**topic, 'papers': args.papers} for topic in topics]
+    run, concurrency, summaries = config['run'], config['concurrency'], config['summaries']
+
+    if not args.site_only:
+        # Imported here: the pipeline builds the OpenAI client on import, which --site-only doesn't need
+        from paper_summary_generator import run_generator
+        apply_config(config)
+        run_generator(
+            test=args.test, max_workers=args.workers or concurrency['workers'],
+            executor=args.executor or concurrency['executor'], use_async=run['use_async'],
+            parser=run['parser'], extract_mode=run['extract_mode'], resume=args.resume,
+            from_stage=args.from_stage, only_stage=args.only_stage, run_id=args.run_id,
+            n_candidates=args.candidates or config['fetch']['candidates'],
+            batch=run['batch'] if args.batch is None else args.batch, batch_poll_interval=run['batch_poll'],
+            topics=topics, download_workers=concurrency['download_workers'], engine_options=engine_options(config),
+            token_budget=args.token_budget or summaries['token_budget'],
+            chunk_tokens=args.chunk_tokens or summaries['chunk_tokens']
+        )
+    if not args.no_site:
+        build_sites(config, topics, force=args.force_site)
+
 
 if __name__ == "__main__":
-    # run the generator if need the summary
-    run_generator(test=False)
-    generate_newsletter()
\ No newline at end of file
+    main()
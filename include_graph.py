@@ -0,0 +1,232 @@
+'''Main-file detection and include-graph resolution for a paper's LaTeX sources.
+
+Every .tex file is probed with a bounded prefix read for \\documentclass. Each candidate root's
+include tree (\\input, \\include, \\subfile, \\import, \\subimport, followed recursively) is then
+resolved and the candidates are scored: a real document class, \\begin{document}, a large include
+tree and a conventional name count for a root; standalone figure files, files included by another
+candidate and deeply nested paths count against it. Ties break on the path, so the choice no
+longer depends on directory listing order.
+
+The resolved graph is a small JSON-serializable dict and can be cached per tarball hash:
+
+    {'root': 'main.tex', 'order': ['main.tex', 'sections/intro.tex', ...],
+     'includes': {'main.tex': ['sections/intro.tex', ...], ...}, 'missing': [...],
+     'candidates': [{'name': 'main.tex', 'score': 162.0}, ...], 'has_document': True}
+'''
+import os
+import json
+import posixpath
+from pathlib import Path
+import re
+from downloader import file_sha256, recorded_sha256
+
+PREFIX_CHARS = 4096
+MAX_INCLUDE_DEPTH = 16
+GRAPH_VERSION = 1
+
+INCLUDE_RE = re.compile(
+    r'\\(?:input|include|subfile)\s*\{(?P<path>[^}]*)\}'
+    r'|\\(?P<relative>sub)?import\*?\s*\{(?P<dir>[^}]*)\}\s*\{(?P<file>[^}]*)\}'
+)
+DOCUMENTCLASS_RE = re.compile(r'\\documentclass\s*(?:\[[^\]]*\])?\s*\{(?P<cls>[^}]*)\}')
+COMMENT_RE = re.compile(r'(?<!\\)%.*')
+BEGIN_DOCUMENT = '\\begin{document}'
+STANDALONE_CLASSES = {'standalone', 'subfiles', 'tikz'}
+MAIN_STEMS = {'main', 'ms', 'paper', 'article', 'manuscript', 'root'}
+
+
+def strip_comments(text):
+    return COMMENT_RE.sub('', text)
+
+
+class DirectorySource:
+    '''LaTeX sources in an extracted directory; names are POSIX paths relative to it'''
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def names(self):
+        return sorted(
+            path.relative_to(self.root).as_posix()
+            for path in self.root.rglob('*') if path.is_file() and path.suffix.lower() == '.tex'
+        )
+
+    def exists(self, name):
+        return (self.root / name).is_file()
+
+    def read_prefix(self, name, chars=PREFIX_CHARS):
+        with open(self.root / name, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read(chars)
+
+    def read(self, name):
+        with open(self.root / name, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+
+
+class MemorySource:
+    '''LaTeX sources already in memory, e.g. from tar_sources.read_tar_sources'''
+    def __init__(self, sources):
+        self.sources = sources
+
+    def names(self):
+        return sorted(name for name in self.sources if name.lower().endswith('.tex'))
+
+    def exists(self, name):
+        return name in self.sources
+
+    def read_prefix(self, name, chars=PREFIX_CHARS):
+        return self.sources[name][:chars]
+
+    def read(self, name):
+        return self.sources[name]
+
+
+def resolve_name(source, name, base_dir):
+    '''Path of an included file relative to the source root, like LaTeX: relative to base_dir,
+    with ".tex" appended when the file doesn't exist as written. None if it can't be found.
+    '''
+    name = name.strip()
+    if not name:
+        return None
+    path = posixpath.normpath(posixpath.join(base_dir, name))
+    for candidate in ([path] if path.endswith('.tex') else [f"{path}.tex", path]):
+        if source.exists(candidate):
+            return candidate
+    return None
+
+def find_includes(text, name, root_dir):
+    '''(command target, base directory) pairs in document order; \\subimport is relative to the
+    including file, everything else to the root file's directory
+    '''
+    includes = []
+    for match in INCLUDE_RE.finditer(strip_comments(text)):
+        if match.group('path') is not None:
+            includes.append((match.group('path'), root_dir))
+        else:
+            base = posixpath.dirname(name) if match.group('relative') else root_dir
+            includes.append((posixpath.join(match.group('dir').strip(), match.group('file')), base))
+    return includes
+
+def resolve_tree(source, root, read=None):
+    '''Follow every include from `root`, depth-first. Returns (order, includes, missing).
+    `read` lets callers share already-read file contents between several trees.
+    '''
+    read = read or source.read
+    root_dir = posixpath.dirname(root)
+    order, includes, missing = [], {}, []
+
+    def visit(name, depth):
+        if name in includes or depth > MAX_INCLUDE_DEPTH:
+            return
+        order.append(name)
+        includes[name] = []
+        for target, base in find_includes(read(name), name, root_dir):
+            child = resolve_name(source, target, base)
+            if child is None:
+                missing.append(target)
+                continue
+            includes[name].append(child)
+            visit(child, depth + 1)
+
+    visit(root, 0)
+    return order, includes, missing
+
+def score_candidate(name, prefix, text, order):
+    match = DOCUMENTCLASS_RE.search(strip_comments(prefix))
+    document_class = match.group('cls').strip() if match else None
+    score = 0.0
+    if document_class and document_class not in STANDALONE_CLASSES:
+        score += 100
+    if BEGIN_DOCUMENT in text:
+        score += 50
+    score += min(len(order) - 1, 50)
+    if posixpath.splitext(posixpath.basename(name))[0].lower() in MAIN_STEMS:
+        score += 5
+    score -= 2 * name.count('/')
+    return score
+
+def build_include_graph(source):
+    '''Pick the main file of `source` and resolve its include tree. Returns None if there are no
+    .tex files at all.
+    '''
+    names = source.names()
+    if not names:
+        return None
+    prefixes = {name: source.read_prefix(name) for name in names}
+    candidates = [name for name in names if DOCUMENTCLASS_RE.search(strip_comments(prefixes[name]))]
+    if not candidates:
+        # No \documentclass in any prefix: fall back to files that open a document at all
+        candidates = [name for name in names if BEGIN_DOCUMENT in source.read(name)] or names
+
+    contents = {}
+    def read(name):
+        if name not in contents:
+            contents[name] = source.read(name)
+        return contents[name]
+
+    trees = {name: resolve_tree(source, name, read) for name in candidates}
+    included = {child for order, _, _ in trees.values() for child in order[1:]}
+    scored = []
+    for name in candidates:
+        order = trees[name][0]
+        score = score_candidate(name, prefixes[name], read(name), order)
+        if name in included:
+            # \subfile'd chapters carry their own \documentclass but are not the root
+            score -= 100
+        scored.append({'name': name, 'score': score})
+    scored.sort(key=lambda c: (-c['score'], c['name']))
+    root = scored[0]['name']
+    order, includes, missing = trees[root]
+    return {
+        'version': GRAPH_VERSION, 'root': root, 'order': order, 'includes': includes,
+        'missing': missing, 'candidates': scored,
+        'has_document': any(BEGIN_DOCUMENT in read(name) for name in order),
+    }
+
+def cached_include_graph(tar_file, source, cache_dir):
+    '''build_include_graph, memoized on disk as cache_dir/<sha256 of the tarball>.json. The hash
+    comes from the download manifest, so the tarball isn't read a second time just to look it up.
+    '''
+    if tar_file is None or not Path(tar_file).is_file():
+        return build_include_graph(source)
+    digest = recorded_sha256(tar_file) or file_sha256(tar_file)
+    cache_path = Path(cache_dir) / f"{digest}.json"
+    if cache_path.exists():
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                graph = json.load(f)
+            if graph.get('version') == GRAPH_VERSION:
+                return graph
+        except ValueError:
+            print(f"**WARNING: Ignoring corrupt include graph {cache_path}")
+    graph = build_include_graph(source)
+    if graph is not None:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(graph, f, indent=4)
+        os.replace(tmp_path, cache_path)
+    return graph
+
+def flatten(source, graph, name):
+    '''Text of `name` with every include it (transitively) pulls in spliced in place'''
+    root_dir = posixpath.dirname(graph['root'])
+    seen = set()
+
+    def expand(current, depth):
+        seen.add(current)
+        text = strip_comments(source.read(current))
+
+        def splice(match):
+            if match.group('path') is not None:
+                target, base = match.group('path'), root_dir
+            else:
+                base = posixpath.dirname(current) if match.group('relative') else root_dir
+                target = posixpath.join(match.group('dir').strip(), match.group('file'))
+            child = resolve_name(source, target, base)
+            if child is None or child in seen or depth >= MAX_INCLUDE_DEPTH:
+                return ''
+            return expand(child, depth + 1)
+
+        return INCLUDE_RE.sub(splice, text)
+
+    return expand(name, 0)
@@ -0,0 +1,83 @@
+'''Streamed assembly of a newsletter issue.
+
+Entries are written to hidden .part files through a buffered writer as each paper finishes, and
+moved into place only when the issue is complete, so a crashed or interrupted run never leaves a
+half-written issue behind (the previous version stays untouched). A run that ends up with no
+papers at all, e.g. because every LLM call failed, leaves the previous version in place too.
+
+    with IssueWriter(NEWSLETTER_DIR / '2025' / 'n_2025-01-03.md') as issue:
+        issue.add(entry, {'arxiv_id': ..., 'title': ...})
+'''
+import os
+import json
+from pathlib import Path
+
+WRITE_BUFFER_BYTES = 1 << 16
+
+
+class IssueWriter:
+    '''Writes the issue Markdown to `path` and one JSON record per paper to `records_path`
+    (default: the same name with a .jsonl suffix).
+    '''
+    def __init__(self, path, records_path=None, buffer_size=WRITE_BUFFER_BYTES):
+        self.path = Path(path)
+        self.records_path = Path(records_path) if records_path else self.path.with_suffix('.jsonl')
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.records_path.parent.mkdir(parents=True, exist_ok=True)
+        self.count = 0
+        # arXiv IDs of the papers added, marked as published once the issue is finalized
+        self.arxiv_ids = []
+        self._parts = [self._part_path(self.path), self._part_path(self.records_path)]
+        self._markdown = open(self._parts[0], 'w', encoding='utf-8', buffering=buffer_size)
+        self._records = open(self._parts[1], 'w', encoding='utf-8', buffering=buffer_size)
+
+    @staticmethod
+    def _part_path(path):
+        return path.with_name(f".{path.name}.part")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.finalize()
+        else:
+            self.abort()
+
+    def add(self, entry, record=None):
+        '''Append one paper's Markdown entry and, optionally, its structured record'''
+        self._markdown.write(entry)
+        if record is not None:
+            self._records.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+            if record.get('arxiv_id'):
+                self.arxiv_ids.append(record['arxiv_id'])
+        self.count += 1
+
+    def finalize(self):
+        '''Flush both files to disk and atomically replace the previous issue. An issue without any
+        paper is discarded instead, so a failed rerun never replaces a good issue. Returns True if the
+        issue was written.
+        '''
+        if self.count == 0:
+            self._discard()
+            print(f"**WARNING: No papers for {self.path}, keeping the previous version (if any)")
+            return False
+        for f in (self._markdown, self._records):
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+        os.replace(self._parts[0], self.path)
+        os.replace(self._parts[1], self.records_path)
+        print(f"MESSAGE -> Wrote {self.count} paper(s) to {self.path}")
+        return True
+
+    def _discard(self):
+        for f in (self._markdown, self._records):
+            f.close()
+        for part in self._parts:
+            part.unlink(missing_ok=True)
+
+    def abort(self):
+        '''Drop the partial issue, leaving any previous version in place'''
+        self._discard()
+        print(f"**WARNING: Issue {self.path} was not completed, partial output discarded")
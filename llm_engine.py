@@ -0,0 +1,242 @@
+import os
+import time
+import random
+import asyncio
+import threading
+import openai
+from openai import AsyncOpenAI
+from summary_cache import cache_key, get_default_cache
+from metrics import get_default_metrics, current_labels
+from config import get_stage_params
+from section_prompts import get_default_registry, normalize_section_name
+from chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_PAPER_TOKEN_BUDGET, split_into_chunks
+from utils import (
+    estimate_tokens, summarizable_sections, section_prompt_messages, section_summary_messages,
+    reduce_summary_messages, article_summary_messages
+)
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    '''Token bucket refilled continuously at `rate_per_minute` units per minute
+    '''
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+def is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)):
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+def backoff_delay(attempt, base_delay=1.0, max_delay=30.0, error=None):
+    '''Exponential backoff with full jitter, honouring a Retry-After header when the server sends one
+    '''
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(max_delay, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class AsyncSummaryEngine:
+    '''Sends chat completions concurrently from a background event loop.
+
+    The loop is shared by every caller, so the in-flight limit and the requests/min and tokens/min
+    buckets apply globally, across all sections and all papers, even when the papers themselves are
+    processed from a thread pool. Completed outputs are stored in the on-disk summary cache, so a
+    rerun over already-summarized content makes no API calls.
+
+    Each paper is trimmed to `token_budget` tokens and sections longer than `chunk_tokens` are
+    summarized chunk by chunk (concurrently) and then reduced, so per-paper cost is bounded.
+    '''
+    def __init__(self, client=None, model=None, max_in_flight=8, requests_per_minute=500,
+                 tokens_per_minute=200000, max_retries=5, base_delay=1.0, max_delay=30.0, cache=None,
+                 prompt_registry=None, chunk_tokens=DEFAULT_CHUNK_TOKENS, token_budget=DEFAULT_PAPER_TOKEN_BUDGET):
+        # Retries are handled here so they share the rate limiter
+        self.client = client or AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        # None: each call uses the model configured for its kind (config.get_stage_params)
+        self.model = model
+        self.cache = cache or get_default_cache()
+        self.prompt_registry = prompt_registry or get_default_registry()
+        self.chunk_tokens = chunk_tokens
+        self.token_budget = token_budget
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self._prompts = {}
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def token_model(self):
+        '''Model whose tokenizer is used for chunking and budgets'''
+        return self.model or get_stage_params('section')['model']
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+        return self._loop
+
+    def run(self, coro):
+        '''Run a coroutine on the engine loop from synchronous code and wait for its result
+        '''
+        return asyncio.run_coroutine_threadsafe(self._with_labels(coro, current_labels()), self._ensure_loop()).result()
+
+    @staticmethod
+    async def _with_labels(coro, labels):
+        # Tasks on the loop thread don't inherit the caller's context; carry its metrics labels over
+        with get_default_metrics().labels(**labels):
+            return await coro
+
+    def close(self):
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop = None
+            self._thread = None
+
+    async def complete(self, messages, model=None, **kwargs):
+        model = model or self.token_model
+        estimated = sum(estimate_tokens(m['content']) for m in messages) + kwargs.get('max_tokens', 0)
+        for attempt in range(self.max_retries + 1):
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(estimated)
+            try:
+                async with self.semaphore:
+                    return await self.client.chat.completions.create(
+                        model=model, messages=messages, **kwargs
+                    )
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    get_default_metrics().count('llm_error')
+                    raise
+                delay = backoff_delay(attempt, self.base_delay, self.max_delay, error=e)
+                get_default_metrics().count('retry')
+                print(f"**WARNING: {e.__class__.__name__} on attempt {attempt + 1}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def complete_text(self, kind, messages, **kwargs):
+        '''Cached completion returning the message text, or None if the response had no choices or no
+        text (refusals, tool calls), which is not cached
+        '''
+        metrics = get_default_metrics()
+        kwargs = {**get_stage_params(kind), **kwargs}
+        stage_model = kwargs.pop('model')
+        model = self.model or stage_model
+        key = cache_key(model, messages, **kwargs)
+        content = self.cache.get(key)
+        if content is not None:
+            metrics.record_call(kind, model, 0.0, cached=True)
+            return content
+        start = time.perf_counter()
+        with metrics.labels(kind=kind):
+            response = await self.complete(messages, model, **kwargs)
+        metrics.record_call(kind, model, time.perf_counter() - start, usage=response.usage)
+        if not response.choices:
+            return None
+        content = response.choices[0].message.content
+        if content is None:
+            return None
+        self.cache.set(key, kind, content)
+        return content
+
+    async def section_prompt(self, section_name):
+        prompt = self.prompt_registry.lookup(section_name)
+        if prompt is not None:
+            return prompt
+        # Concurrent sections whose names the registry files under one key ("sec1", "sec10") share
+        # one prompt request, so they all use the prompt a later run looks up
+        name = normalize_section_name(section_name)
+        future = self._prompts.get(name)
+        if future is None:
+            future = self._prompts[name] = asyncio.ensure_future(self._generate_section_prompt(section_name))
+            # Once resolved the prompt is in the registry; the future isn't kept around
+            future.add_done_callback(lambda done: self._prompts.pop(name, None))
+        return await future
+
+    async def _generate_section_prompt(self, section_name):
+        prompt = await self.complete_text('prompt', section_prompt_messages(section_name))
+        if prompt is None:
+            raise ValueError(f"No prompt returned for section {section_name}")
+        prompt = prompt.strip()
+        self.prompt_registry.add(section_name, prompt)
+        return prompt
+
+    async def summarize_section(self, section_name, text):
+        with get_default_metrics().labels(section=section_name):
+            return await self._summarize_section(section_name, text)
+
+    async def _summarize_section(self, section_name, text):
+        try:
+            prompt = await self.section_prompt(section_name)
+            print(f"PROMPT -> {prompt}")
+            chunks = split_into_chunks(text, self.chunk_tokens, self.token_model)
+            if len(chunks) == 1:
+                summary = await self.complete_text('section', section_summary_messages(prompt, text))
+            else:
+                print(f"**INFO: Splitting section {section_name} into {len(chunks)} chunks")
+                partials = await asyncio.gather(
+                    *(self.complete_text('chunk', section_summary_messages(prompt, chunk)) for chunk in chunks)
+                )
+                partials = [partial for partial in partials if partial]
+                summary = None
+                if partials:
+                    summary = await self.complete_text(
+                        'section', reduce_summary_messages(prompt, section_name, partials)
+                    )
+        except Exception as e:
+            print(f"**ERROR: {section_name}: {e}")
+            return None
+        if summary is None:
+            print(f"**WARNING: No summary returned for section {section_name}")
+            return None
+        print(f"SUMMARY -> {summary}")
+        return summary
+
+    async def summarize_sections(self, section_dict, only=None):
+        texts = summarizable_sections(section_dict, self.token_budget, self.token_model)
+        names = [name for name in texts if only is None or name in only]
+        results = await asyncio.gather(*(self.summarize_section(name, texts[name]) for name in names))
+        return {name: summary for name, summary in zip(names, results) if summary is not None}
+
+    async def summarize_papers(self, section_dicts):
+        '''Summarize the sections of several papers at once, returning one summary dict per paper
+        '''
+        return list(await asyncio.gather(*(self.summarize_sections(d) for d in section_dicts)))
+
+    async def summarize_article(self, summary):
+        summary = await self.complete_text('article', article_summary_messages(summary))
+        return summary.strip() if summary is not None else None
@@ -0,0 +1,412 @@
+'''Local stand-ins for the external services the pipeline talks to, so it can be exercised offline.
+
+    server, base_url = start_fake_openai_server(fail_first=2)
+    engine = AsyncSummaryEngine(client=AsyncOpenAI(base_url=base_url, api_key="test", max_retries=0))
+    ...
+    assert server.max_in_flight <= 8  # the engine's max_in_flight held across every section and paper
+
+The fake OpenAI server also implements the Files and Batches endpoints used by batch_mode:
+uploaded .jsonl batches are answered with fake_chat_completion and report `completed` once
+`batch_delay` seconds have passed (`batch_failures` makes some of their requests fail).
+
+    server, base_url = start_fake_arxiv_server({"2401.00001v1": tarball_bytes})
+    download_sources([("2401.00001v1", f"{base_url}/src/2401.00001v1", "paper.tar.gz")], "papers")
+
+The fake arXiv server also answers id_list queries on the Atom API, so an arxiv.Client with
+query_url_format = f"{base_url}/api/query?{{}}" resolves the served papers (their PDF links, and so
+utils.source_url, point back at the fake server).
+
+Without any HTTP at all, FakeOpenAI / FakeAsyncOpenAI stand in for the SDK clients themselves:
+
+    utils.set_client(FakeOpenAI(latency=0.05))
+    engine = AsyncSummaryEngine(client=FakeAsyncOpenAI(latency=0.05, error_rate=0.1))
+'''
+import json
+import time
+import uuid
+import html
+import random
+import asyncio
+import threading
+from types import SimpleNamespace
+from email import policy
+from email.parser import BytesParser
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from openai.types.chat import ChatCompletion
+
+FAKE_ARTICLE_SUMMARY = (
+    "## Objective:\nFake objective.\n\n"
+    "## Method:\nFake method.\n\n"
+    "## Results:\nFake results.\n\n"
+    "## Significance:\nFake significance."
+)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length)
+
+    def _read_json(self):
+        return json.loads(self._read_body() or b'{}')
+
+    def _not_found(self):
+        self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        path = self.path.rstrip('/')
+        if path.endswith('/chat/completions'):
+            self._chat_completion(self._read_json())
+        elif path.endswith('/files'):
+            self._upload_file()
+        elif path.endswith('/batches'):
+            self._create_batch(self._read_json())
+        else:
+            self._not_found()
+
+    def do_GET(self):
+        parts = self.path.rstrip('/').split('/')
+        if len(parts) >= 3 and parts[-3] == 'files' and parts[-1] == 'content':
+            self._file_content(parts[-2])
+        elif len(parts) >= 2 and parts[-2] == 'batches':
+            self._retrieve_batch(parts[-1])
+        else:
+            self._not_found()
+
+    def _chat_completion(self, request):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            fail = server.request_count <= server.fail_first
+        if server.latency:
+            time.sleep(server.latency)
+        # Counted down before the response goes out, so a client can't overlap its next request with it
+        with server.lock:
+            server.in_flight -= 1
+        if fail:
+            self._send_json(server.fail_status, {"error": {"message": "Fake failure", "type": "fake_error"}},
+                            headers={'Retry-After': '0'})
+            return
+        self._send_json(200, fake_chat_completion(request))
+
+
+    def _upload_file(self):
+        # multipart/form-data with a `purpose` field and a `file` part
+        message = BytesParser(policy=policy.default).parsebytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode('utf-8') + self._read_body()
+        )
+        fields, filename, data = {}, 'upload.jsonl', b''
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'file':
+                filename = part.get_filename() or filename
+                data = part.get_payload(decode=True)
+            else:
+                fields[name] = part.get_content().strip()
+        file_object = store_fake_file(self.server, data, filename, fields.get('purpose', 'batch'))
+        self._send_json(200, file_object)
+
+    def _file_content(self, file_id):
+        with self.server.lock:
+            entry = self.server.files.get(file_id)
+        if entry is None:
+            self._not_found()
+            return
+        data = entry['data']
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _create_batch(self, request):
+        server = self.server
+        with server.lock:
+            entry = server.files.get(request.get('input_file_id'))
+        if entry is None:
+            self._send_json(400, {"error": {"message": "Unknown input_file_id"}})
+            return
+        lines = [json.loads(line) for line in entry['data'].decode('utf-8').splitlines() if line.strip()]
+        # The first `batch_failures` requests of every batch fail, and go to the error file like the API's
+        failed, succeeded = lines[:server.batch_failures], lines[server.batch_failures:]
+        output = ''.join(
+            json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                "custom_id": line['custom_id'],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex, "body": fake_chat_completion(line['body'])},
+                "error": None,
+            }) + '\n'
+            for line in succeeded
+        )
+        errors = ''.join(
+            json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                "custom_id": line['custom_id'],
+                "response": {"status_code": 500, "request_id": uuid.uuid4().hex,
+                             "body": {"error": {"message": "Fake batch failure", "type": "server_error"}}},
+                "error": None,
+            }) + '\n'
+            for line in failed
+        )
+        output_file = store_fake_file(server, output.encode('utf-8'), 'batch_output.jsonl', 'batch_output')
+        error_file = store_fake_file(server, errors.encode('utf-8'), 'batch_errors.jsonl', 'batch_output') if failed else None
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex[:12]}",
+            "object": "batch",
+            "endpoint": request.get('endpoint', '/v1/chat/completions'),
+            "input_file_id": request['input_file_id'],
+            "completion_window": request.get('completion_window', '24h'),
+            "created_at": int(time.time()),
+            "output_file_id": output_file['id'],
+            "error_file_id": error_file['id'] if error_file else None,
+            "request_counts": {"total": len(lines), "completed": len(succeeded), "failed": len(failed)},
+        }
+        with server.lock:
+            server.batch_count += 1
+            server.batches[batch['id']] = (time.monotonic() + server.batch_delay, batch)
+        self._send_json(200, fake_batch_view(batch, ready=server.batch_delay <= 0))
+
+    def _retrieve_batch(self, batch_id):
+        with self.server.lock:
+            entry = self.server.batches.get(batch_id)
+        if entry is None:
+            self._not_found()
+            return
+        ready_at, batch = entry
+        self._send_json(200, fake_batch_view(batch, ready=time.monotonic() >= ready_at))
+
+
+def store_fake_file(server, data, filename, purpose):
+    file_object = {
+        "id": f"file-{uuid.uuid4().hex[:12]}",
+        "object": "file",
+        "bytes": len(data),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+    }
+    with server.lock:
+        server.files[file_object['id']] = {'data': data, **file_object}
+    return file_object
+
+def fake_batch_view(batch, ready):
+    '''The batch as the API reports it: in progress (no output yet) until it is ready'''
+    if ready:
+        return {**batch, "status": "completed"}
+    return {**batch, "status": "in_progress", "output_file_id": None, "error_file_id": None,
+            "request_counts": {"total": batch['request_counts']['total'], "completed": 0, "failed": 0}}
+
+
+def fake_chat_completion(request):
+    '''Deterministic chat.completion payload for a chat request
+    '''
+    messages = request.get('messages', [])
+    user_content = messages[-1]['content'] if messages else ''
+    if '## Objective:' in user_content:
+        content = FAKE_ARTICLE_SUMMARY
+    else:
+        content = f"- Summary of {len(user_content)} characters"
+    prompt_tokens = sum(len(m['content']) // 4 + 1 for m in messages)
+    completion_tokens = len(content) // 4 + 1
+    return {
+        "id": f"chatcmpl-fake-{abs(hash(user_content))}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get('model', 'fake-model'),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+class FakeArxivHandler(BaseHTTPRequestHandler):
+    '''Serves e-print tarballs at /src/<arxiv id> from the server's `sources` dict'''
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connection_count += 1
+
+    def do_GET(self):
+        if urlsplit(self.path).path.rstrip('/').endswith('/api/query'):
+            self._api_query()
+            return
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            fail = server.request_count <= server.fail_first
+        if server.latency:
+            time.sleep(server.latency)
+        arxiv_id = self.path.rsplit('/', 1)[-1]
+        body = server.sources.get(arxiv_id)
+        status = server.fail_status if fail else (200 if body is not None else 404)
+        if status != 200:
+            body = b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _api_query(self):
+        server = self.server
+        with server.lock:
+            server.api_count += 1
+        query = parse_qs(urlsplit(self.path).query)
+        ids = [i for value in query.get('id_list', []) for i in value.split(',') if i]
+        base_url = f"http://{server.server_address[0]}:{server.server_address[1]}"
+        entries = [fake_atom_entry(versioned, server.papers.get(versioned, {}), base_url)
+                   for versioned in filter(None, (resolve_fake_id(server.sources, i) for i in ids))]
+        body = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:arxiv="http://arxiv.org/schemas/atom" '
+            'xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">\n'
+            f'<opensearch:totalResults>{len(entries)}</opensearch:totalResults>\n'
+            '<opensearch:startIndex>0</opensearch:startIndex>\n'
+            f'<opensearch:itemsPerPage>{len(entries)}</opensearch:itemsPerPage>\n'
+            + ''.join(entries) + '</feed>\n'
+        ).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/atom+xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def resolve_fake_id(sources, arxiv_id):
+    '''Versioned ID of a served paper: arxiv_id itself, or its latest version when unversioned'''
+    if arxiv_id in sources:
+        return arxiv_id
+    versions = [key for key in sources if key.rsplit('v', 1)[0] == arxiv_id]
+    return max(versions, key=lambda key: int(key.rsplit('v', 1)[1])) if versions else None
+
+def fake_atom_entry(arxiv_id, paper, base_url):
+    '''Atom API <entry> for a served paper; `paper` may override title, summary and authors'''
+    title = html.escape(paper.get('title', f"Fake paper {arxiv_id}"))
+    summary = html.escape(paper.get('summary', f"Abstract of fake paper {arxiv_id}."))
+    authors = ''.join(f"<author><name>{html.escape(name)}</name></author>"
+                      for name in paper.get('authors', ['Fake Author']))
+    return (
+        f"<entry><id>http://arxiv.org/abs/{arxiv_id}</id>"
+        "<updated>2024-01-01T00:00:00Z</updated><published>2024-01-01T00:00:00Z</published>"
+        f"<title>{title}</title><summary>{summary}</summary>{authors}"
+        f'<link href="http://arxiv.org/abs/{arxiv_id}" rel="alternate" type="text/html"/>'
+        f'<link title="pdf" href="{base_url}/pdf/{arxiv_id}" rel="related" type="application/pdf"/>'
+        '<arxiv:primary_category term="cs.LG"/><category term="cs.LG"/>'
+        "</entry>\n"
+    )
+
+
+def _serve(handler_class, port=0, **attrs):
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler_class)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    for key, value in attrs.items():
+        setattr(server, key, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def start_fake_openai_server(port=0, latency=0.0, fail_first=0, fail_status=429, batch_delay=0.0, batch_failures=0):
+    '''Start an OpenAI-compatible server in a daemon thread. Returns (server, base_url).
+    The first `fail_first` chat requests get `fail_status` so retry paths can be exercised;
+    server.max_in_flight is the most chat requests it ever handled at once. Batches report
+    completed `batch_delay` seconds after they are created, with their first `batch_failures`
+    requests failed.
+    '''
+    server, url = _serve(FakeOpenAIHandler, port, latency=latency, fail_first=fail_first,
+                         fail_status=fail_status, request_count=0, in_flight=0, max_in_flight=0,
+                         batch_delay=batch_delay, batch_failures=batch_failures, batch_count=0, files={},
+                         batches={})
+    return server, f"{url}/v1"
+
+
+def start_fake_arxiv_server(sources, port=0, latency=0.0, fail_first=0, fail_status=503, papers=None):
+    '''Start an arXiv e-print stand-in serving `sources` ({arxiv_id: bytes}). Returns (server, base_url);
+    source URLs are f"{base_url}/src/{arxiv_id}". `papers` ({arxiv_id: {title, summary, authors}})
+    sets the metadata the Atom API returns. fail_first only applies to source downloads.
+    '''
+    return _serve(FakeArxivHandler, port, sources=sources, latency=latency, fail_first=fail_first,
+                  fail_status=fail_status, request_count=0, connection_count=0, api_count=0,
+                  papers=papers or {})
+
+
+class FakeRateLimitError(Exception):
+    '''Raised by the fake clients; carries a 429 status_code so the engine treats it as retryable'''
+    status_code = 429
+    response = None
+
+
+class _FakeClient:
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.request_count = 0
+        self.error_count = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _respond(self, request):
+        with self._lock:
+            self.request_count += 1
+            fail = self._rng.random() < self.error_rate
+            if fail:
+                self.error_count += 1
+        if fail:
+            raise FakeRateLimitError("Fake rate limit")
+        return ChatCompletion.model_validate(fake_chat_completion(request))
+
+
+class FakeOpenAI(_FakeClient):
+    '''In-process stand-in for openai.OpenAI: chat.completions.create sleeps `latency` seconds and
+    returns a fake_chat_completion; a fraction `error_rate` of calls raise FakeRateLimitError.
+    '''
+    def _create(self, **request):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(request)
+
+    def close(self):
+        pass
+
+
+class FakeAsyncOpenAI(_FakeClient):
+    '''In-process stand-in for openai.AsyncOpenAI, see FakeOpenAI'''
+    async def _create(self, **request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(request)
+
+    async def close(self):
+        pass
@@ -0,0 +1,251 @@
+'''Run metrics: stage timings, LLM token usage and cost, cache hits and retries.
+
+    metrics = Metrics()
+    set_default_metrics(metrics)
+    with metrics.labels(paper='2401.00001v1'):
+        with metrics.span('parse'):
+            ...
+    metrics.write_report('reports/run.json')
+    print(metrics.summary_table())
+
+Labels (paper, section) are carried in a context variable, so spans and LLM calls made further
+down the call stack are attributed to the paper and section they belong to without threading
+them through every function. Worker threads and engine coroutines each see their caller's labels.
+Metrics recorded inside process-pool workers stay in those processes and are not reported.
+'''
+import json
+import math
+import time
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+
+# USD per million tokens (input, output)
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+}
+# Batch API requests are billed at half price
+BATCH_DISCOUNT = 0.5
+PERCENTILES = (50, 90, 99)
+
+_labels = contextvars.ContextVar('metrics_labels', default={})
+
+
+def current_labels():
+    return _labels.get()
+
+def percentile(values, q):
+    '''Nearest-rank percentile of a non-empty list'''
+    ordered = sorted(values)
+    # q * n / 100 rather than q / 100 * n: exact whenever the rank is a whole number
+    index = max(0, min(len(ordered) - 1, math.ceil(q * len(ordered) / 100) - 1))
+    return ordered[index]
+
+def model_cost(model, prompt_tokens, completion_tokens):
+    prices = next((p for name, p in sorted(MODEL_PRICES.items(), key=lambda x: -len(x[0])) if model.startswith(name)), None)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+def _timing_stats(durations):
+    stats = {'count': len(durations), 'total_s': round(sum(durations), 4)}
+    if durations:
+        stats.update({f'p{q}_s': round(percentile(durations, q), 4) for q in PERCENTILES})
+        stats['max_s'] = round(max(durations), 4)
+    return stats
+
+
+class Metrics:
+    '''Thread-safe collector for one run.
+
+    max_records caps each of the span, call and counter logs, for long-running processes such as
+    the service: the oldest records are dropped and the report covers the most recent ones.
+    '''
+    def __init__(self, max_records=None):
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = deque(maxlen=max_records)
+        self.calls = deque(maxlen=max_records)
+        self.counters = deque(maxlen=max_records)
+        self.dropped = 0
+
+    def _append(self, records, record):
+        with self._lock:
+            if records.maxlen is not None and len(records) == records.maxlen:
+                self.dropped += 1
+            records.append(record)
+
+    @contextmanager
+    def labels(self, **labels):
+        '''Attach labels to everything recorded inside the block'''
+        token = _labels.set({**_labels.get(), **labels})
+        try:
+            yield
+        finally:
+            _labels.reset(token)
+
+    @contextmanager
+    def span(self, name, **labels):
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            record = {'name': name, 'seconds': time.perf_counter() - start, 'ok': ok, **current_labels(), **labels}
+            self._append(self.spans, record)
+
+    def count(self, name, n=1, **labels):
+        '''Increment a counter such as cache_hit or retry'''
+        self._append(self.counters, {'name': name, 'n': n, **current_labels(), **labels})
+
+    def record_call(self, kind, model, seconds, usage=None, cached=False, **labels):
+        '''Record one LLM completion; `usage` is the response.usage object (None for cache hits)'''
+        record = {
+            'kind': kind, 'model': model, 'seconds': seconds, 'cached': cached,
+            'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+            'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+            **current_labels(), **labels
+        }
+        self._append(self.calls, record)
+
+    def _counter_total(self, name, records):
+        return sum(c['n'] for c in records if c['name'] == name)
+
+    def _usage(self, calls, counters):
+        api_calls = [c for c in calls if not c['cached']]
+        prompt_tokens = sum(c['prompt_tokens'] for c in api_calls)
+        completion_tokens = sum(c['completion_tokens'] for c in api_calls)
+        costs = [
+            (model_cost(c['model'], c['prompt_tokens'], c['completion_tokens']) or 0.0)
+            * (BATCH_DISCOUNT if c.get('batch') else 1.0)
+            for c in api_calls
+        ]
+        return {
+            'api_calls': len(api_calls),
+            'cache_hits': len(calls) - len(api_calls),
+            'retries': self._counter_total('retry', counters),
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cost_usd': round(sum(costs), 6),
+        }
+
+    def report(self):
+        '''Machine-readable summary of the run'''
+        with self._lock:
+            spans, calls, counters = list(self.spans), list(self.calls), list(self.counters)
+            dropped = self.dropped
+
+        stage_durations = defaultdict(list)
+        for span in spans:
+            stage_durations[span['name']].append(span['seconds'])
+        by_kind = defaultdict(list)
+        for call in calls:
+            by_kind[call['kind']].append(call)
+        llm = self._usage(calls, counters)
+        llm['latency'] = _timing_stats([c['seconds'] for c in calls if not c['cached']])
+        llm['by_kind'] = {
+            kind: {**self._usage(kind_calls, [c for c in counters if c.get('kind') == kind]),
+                   'latency': _timing_stats([c['seconds'] for c in kind_calls if not c['cached']])}
+            for kind, kind_calls in sorted(by_kind.items())
+        }
+
+        # Grouped in one pass over the records, not one pass per paper
+        by_paper = defaultdict(lambda: ([], [], []))
+        for index, records in enumerate((spans, calls, counters)):
+            for record in records:
+                if record.get('paper'):
+                    by_paper[record['paper']][index].append(record)
+        papers = {}
+        for key in sorted(by_paper):
+            paper_spans, paper_calls, paper_counters = by_paper[key]
+            section_calls, section_counters = defaultdict(list), defaultdict(list)
+            for call in paper_calls:
+                if call.get('section'):
+                    section_calls[call['section']].append(call)
+            for counter in paper_counters:
+                if counter.get('section'):
+                    section_counters[counter['section']].append(counter)
+            sections = {
+                name: {
+                    **self._usage(section_calls[name], section_counters[name]),
+                    'seconds': round(sum(c['seconds'] for c in section_calls[name]), 4),
+                }
+                for name in sorted(section_calls)
+            }
+            papers[key] = {
+                'stages': {s['name']: round(s['seconds'], 4) for s in paper_spans if not s.get('section')},
+                **self._usage(paper_calls, paper_counters),
+                'sections': sections,
+            }
+
+        totals = defaultdict(int)
+        for counter in counters:
+            totals[counter['name']] += counter['n']
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'duration_s': round(time.perf_counter() - self._start, 4),
+            'stages': {name: _timing_stats(d) for name, d in stage_durations.items()},
+            'llm': llm,
+            'counters': dict(totals),
+            'papers': papers,
+            'dropped_records': dropped,
+        }
+
+    def write_report(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        report = self.report()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        return report
+
+    def summary_table(self, report=None):
+        '''Human-readable version of report()'''
+        report = report or self.report()
+        lines = [f"Run {report['started']} ({report['duration_s']:.1f}s)", '']
+        header = f"{'stage':<22}{'count':>7}{'total s':>10}{'p50 s':>9}{'p90 s':>9}{'p99 s':>9}"
+        lines += [header, '-' * len(header)]
+        for name, stats in report['stages'].items():
+            if not stats['count']:
+                continue
+            lines.append(
+                f"{name:<22}{stats['count']:>7}{stats['total_s']:>10.2f}{stats['p50_s']:>9.2f}"
+                f"{stats['p90_s']:>9.2f}{stats['p99_s']:>9.2f}"
+            )
+        lines.append('')
+        header = f"{'llm calls':<22}{'api':>7}{'cached':>8}{'retries':>9}{'prompt tok':>12}{'compl tok':>11}{'cost $':>10}"
+        lines += [header, '-' * len(header)]
+        rows = list(report['llm']['by_kind'].items()) + [('total', report['llm'])]
+        for kind, usage in rows:
+            lines.append(
+                f"{kind:<22}{usage['api_calls']:>7}{usage['cache_hits']:>8}{usage['retries']:>9}"
+                f"{usage['prompt_tokens']:>12}{usage['completion_tokens']:>11}{usage['cost_usd']:>10.4f}"
+            )
+        latency = report['llm']['latency']
+        if latency['count']:
+            lines.append(f"API latency p50 {latency['p50_s']:.2f}s  p90 {latency['p90_s']:.2f}s  p99 {latency['p99_s']:.2f}s")
+        return '\n'.join(lines)
+
+
+_default_metrics = None
+_default_metrics_lock = threading.Lock()
+
+def get_default_metrics():
+    '''The collector for the current run; a fresh one is created on first use'''
+    global _default_metrics
+    with _default_metrics_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
+
+def set_default_metrics(metrics):
+    global _default_metrics
+    with _default_metrics_lock:
+        _default_metrics = metrics
@@ -0,0 +1,112 @@
+'''Cheap local filter applied to fetched papers before any source is downloaded or summarized.
+
+Titles and abstracts are turned into TF-IDF vectors (NumPy, no model calls). Papers that are
+near-duplicates of each other or of papers published in previous issues are dropped, and the rest
+are ranked by cosine similarity to the topic profiles so only the top K go on to the LLM stages.
+'''
+import re
+import json
+from collections import Counter
+import numpy as np
+
+TOKEN_RE = re.compile(r'[a-z][a-z0-9\-]+')
+STOPWORDS = frozenset('''
+    a an and are as at be by can do for from has have in into is it its of on or our over such than
+    that the their these this those through to under using via we which while with without within
+    paper propose proposed present show shows study approach method methods based new results
+'''.split())
+
+DUPLICATE_THRESHOLD = 0.85
+
+# Short keyword descriptions of what the newsletter covers, scored against each abstract
+TOPIC_PROFILES = {
+    'machine learning': (
+        'machine learning deep learning neural networks training generalization optimization '
+        'representation learning supervised unsupervised self-supervised benchmark'
+    ),
+    'language models': (
+        'large language models llm transformer pretraining fine-tuning instruction tuning '
+        'reasoning alignment in-context learning tokens attention'
+    ),
+    'generative models': (
+        'diffusion models generative image generation video generation variational autoencoder '
+        'gan score-based sampling'
+    ),
+    'reinforcement learning': (
+        'reinforcement learning policy reward agent environment exploration offline rl planning'
+    ),
+}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+def paper_text(paper):
+    return f"{paper.get('title', '')} {paper.get('summary', '')}"
+
+def tfidf_matrix(documents):
+    '''Rows are L2-normalized TF-IDF vectors (sublinear tf, smoothed idf), so row dot products are
+    cosine similarities.
+    '''
+    counts = [Counter(tokenize(doc)) for doc in documents]
+    vocabulary = {}
+    for count in counts:
+        for token in count:
+            vocabulary.setdefault(token, len(vocabulary))
+    matrix = np.zeros((len(documents), max(len(vocabulary), 1)), dtype=np.float32)
+    for row, count in enumerate(counts):
+        if count:
+            columns = [vocabulary[token] for token in count]
+            matrix[row, columns] = 1.0 + np.log(np.fromiter(count.values(), dtype=np.float32))
+    document_frequency = np.count_nonzero(matrix, axis=0)
+    matrix *= np.log((1 + len(documents)) / (1 + document_frequency)) + 1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+def published_papers(store):
+    '''Metadata of every paper a PaperStore has seen published in an issue'''
+    if store is None:
+        return []
+    return [json.loads(row['metadata']) for row in store.papers(published=True) if row['metadata']]
+
+def select_papers(papers, top_k=None, profiles=None, previous=(), threshold=DUPLICATE_THRESHOLD):
+    '''Indices of the papers to summarize, best first.
+
+    - papers whose title and abstract are near-duplicates (cosine >= threshold) of a paper
+      published in an earlier issue are dropped
+    - of a near-duplicate group among the candidates, only the most relevant one is kept
+    - the rest are ranked by their best similarity to any topic profile and cut to top_k
+    '''
+    if not papers:
+        return []
+    profiles = TOPIC_PROFILES if profiles is None else profiles
+    previous = list(previous)
+    documents = [paper_text(p) for p in papers] + [paper_text(p) for p in previous] + list(profiles.values())
+    vectors = tfidf_matrix(documents)
+    n, n_previous = len(papers), len(previous)
+    candidates = vectors[:n]
+    similarity = candidates @ candidates.T
+
+    if profiles:
+        relevance = (candidates @ vectors[n + n_previous:].T).max(axis=1)
+    else:
+        relevance = np.zeros(n, dtype=np.float32)
+    if n_previous:
+        seen_before = (candidates @ vectors[n:n + n_previous].T).max(axis=1) >= threshold
+    else:
+        seen_before = np.zeros(n, dtype=bool)
+
+    selected = []
+    # Greedy in relevance order: a paper is kept unless it duplicates one already kept
+    for index in np.argsort(-relevance, kind='stable'):
+        if seen_before[index]:
+            print(f"**INFO: dropping {papers[index]['title']!r}, near-duplicate of a previous issue")
+            continue
+        duplicate_of = next((kept for kept in selected if similarity[index, kept] >= threshold), None)
+        if duplicate_of is not None:
+            print(f"**INFO: dropping {papers[index]['title']!r}, near-duplicate of {papers[duplicate_of]['title']!r}")
+            continue
+        selected.append(int(index))
+        if top_k is not None and len(selected) == top_k:
+            break
+    return selected
@@ -0,0 +1,136 @@
+import re
+import json
+import time
+import sqlite3
+import threading
+from pathlib import Path
+
+ARXIV_ID_RE = re.compile(r'^(?P<base>.+?)(?:v(?P<version>\d+))?$')
+
+
+def split_arxiv_id(arxiv_id):
+    '''"2401.01234v2" -> ("2401.01234", 2); IDs without a version get version 1'''
+    match = ARXIV_ID_RE.match(arxiv_id.strip())
+    return match.group('base'), int(match.group('version') or 1)
+
+def paper_key(arxiv_id):
+    '''Filesystem-safe stem for a versioned arXiv ID; old-style IDs ("hep-th/9901001v1") contain a slash'''
+    base, version = split_arxiv_id(arxiv_id)
+    return f"{base.replace('/', '_')}v{version}"
+
+
+class PaperStore:
+    '''SQLite index of fetched papers keyed by arXiv ID and version.
+
+    Holds the metadata, source path, extraction state and summary status of every paper, so an
+    incremental run can check in O(1) whether a paper (or this revision of it) was already processed.
+    Being summarized (by the weekly run or a service job) and being published in an issue are
+    tracked separately: only published papers are left out of later issues.
+    '''
+    def __init__(self, path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS papers ("
+                "arxiv_id TEXT, version INTEGER, title TEXT, metadata TEXT, source_path TEXT, "
+                "extract_state TEXT DEFAULT 'pending', summary_status TEXT DEFAULT 'pending', "
+                "summary_path TEXT, updated_at REAL, published_at REAL, PRIMARY KEY (arxiv_id, version))"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(papers)")}
+            if 'published_at' not in columns:
+                # Indexes from before the service only hold papers summarized by the weekly run
+                conn.execute("ALTER TABLE papers ADD COLUMN published_at REAL")
+                conn.execute("UPDATE papers SET published_at = updated_at WHERE summary_status = 'done'")
+
+    def __getstate__(self):
+        # Connections stay per thread/process; a pickled store (process pools) reconnects lazily
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.path = state['path']
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def upsert(self, paper, source_path=None):
+        '''Record a paper's metadata (the dict built by fetch_latest_ml_papers), keeping any progress
+        already recorded for the same version.
+        '''
+        arxiv_id, version = split_arxiv_id(paper['arxiv_id'])
+        metadata = json.dumps(paper, default=str, ensure_ascii=False)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO papers (arxiv_id, version, title, metadata, source_path, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (arxiv_id, version) DO UPDATE SET "
+                "title = excluded.title, metadata = excluded.metadata, "
+                "source_path = COALESCE(excluded.source_path, source_path), updated_at = excluded.updated_at",
+                (arxiv_id, version, paper['title'], metadata, str(source_path) if source_path else None, time.time())
+            )
+
+    def get(self, arxiv_id):
+        base, version = split_arxiv_id(arxiv_id)
+        row = self._connect().execute(
+            "SELECT * FROM papers WHERE arxiv_id = ? AND version = ?", (base, version)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def latest(self, arxiv_id):
+        '''Most recent version recorded for an arXiv ID (with or without a version suffix)'''
+        base, _ = split_arxiv_id(arxiv_id)
+        row = self._connect().execute(
+            "SELECT * FROM papers WHERE arxiv_id = ? ORDER BY version DESC LIMIT 1", (base,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def is_published(self, arxiv_id, any_version=False):
+        '''True if this version (or, with any_version, any version) of the paper was in an issue'''
+        base, version = split_arxiv_id(arxiv_id)
+        query, params = "SELECT 1 FROM papers WHERE arxiv_id = ? AND published_at IS NOT NULL", (base,)
+        if not any_version:
+            query, params = query + " AND version = ?", (base, version)
+        return self._connect().execute(query + " LIMIT 1", params).fetchone() is not None
+
+    def _update(self, arxiv_id, **fields):
+        base, version = split_arxiv_id(arxiv_id)
+        fields['updated_at'] = time.time()
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE papers SET {assignments} WHERE arxiv_id = ? AND version = ?",
+                (*fields.values(), base, version)
+            )
+
+    def set_extract_state(self, arxiv_id, state):
+        self._update(arxiv_id, extract_state=state)
+
+    def set_summary(self, arxiv_id, status, summary_path=None):
+        self._update(arxiv_id, summary_status=status, summary_path=str(summary_path) if summary_path else None)
+
+    def set_published(self, arxiv_ids):
+        '''Mark these versioned IDs as published in a finished issue'''
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "UPDATE papers SET published_at = ?, updated_at = ? WHERE arxiv_id = ? AND version = ?",
+                [(now, now, *split_arxiv_id(arxiv_id)) for arxiv_id in arxiv_ids]
+            )
+
+    def papers(self, summary_status=None, published=False):
+        '''Every recorded paper, or only those with this summary status and/or published in an issue'''
+        conditions, params = [], []
+        if summary_status is not None:
+            conditions.append("summary_status = ?")
+            params.append(summary_status)
+        if published:
+            conditions.append("published_at IS NOT NULL")
+        query = "SELECT * FROM papers" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+        return [dict(row) for row in self._connect().execute(query + " ORDER BY arxiv_id, version", params)]
@@ -1,12 +1,23 @@
 import time
+import utils
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from datetime import datetime
-from openai import OpenAI
 from pathlib import Path
+from llm_engine import AsyncSummaryEngine
+from chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_PAPER_TOKEN_BUDGET
+from tex_extract import extract_sections
+from paper_store import PaperStore, paper_key
+from pipeline import PAPER_STAGES, Checkpoints, StagePlan, latest_run_dir, run_stages
+from tar_sources import read_tar_sources, find_main_tex_member, make_line_reader
+from issue_writer import IssueWriter
+from include_graph import DirectorySource, MemorySource, build_include_graph, cached_include_graph
+from metrics import Metrics, get_default_metrics, set_default_metrics
+from batch_mode import run_in_batches
+from config import DEFAULT_TOPIC, normalize_topic
 from utils import (
-    initialize_directories, fetch_latest_ml_papers, extract_tarfile, find_main_tex_file, parse_tex_file,
-    find_tex_command, create_sections_from_main_tex, create_section_dict,
-    section_summary_generator, article_summary_generator, template_newsletter, save_raw_summary,
-    format_to_markdown, save_newsletter 
+    initialize_directories, fetch_topic_papers, extract_tarfile, find_main_tex_file,
+    create_section_dict_from_graph, summarizable_sections, section_summary_generator, article_summary_generator,
+    template_newsletter, save_raw_summary, format_to_markdown, append_newsletter
 )
 
 BASE_DIR = Path(__file__).resolve().parent
@@ -14,96 +25,416 @@ PAPERS_DIR = BASE_DIR / 'papers'
 NEWSLETTER_DIR = BASE_DIR / 'newsletter'
 SUMMARY_DIR = BASE_DIR / 'summary_cache'
 TEST_DIR = BASE_DIR / 'test'
+PAPER_INDEX = PAPERS_DIR / 'index.sqlite'
+CHECKPOINT_DIR = BASE_DIR / 'checkpoints'
+REPORT_DIR = BASE_DIR / 'reports'
+# Section summaries of a paper published without some of its sections; --resume sends those again
+PARTIAL_SUMMARIES = 'section_summarize_partial'
+# Resolved include graphs, one JSON file per source tarball hash, kept next to the tarballs
+INCLUDE_GRAPH_DIR_NAME = 'include_graphs'
 
-def generate_newsletter_content(paper_info_list, paper_source_folder_list, papers_path, test=False):
-    client = OpenAI()
-    print(f"*** Number of Papers: {len(paper_info_list)}")
-    print(f"*** Papers Path: {papers_path}")
-    print(f"*** Paper Info List: {paper_info_list}")
-    print(f"*** Mode: {['Test' if test else 'Production']}")
+def process_paper(paper, source_folder, papers_path, test=False, engine=None, parser='stream', store=None,
+                  extract_mode='memory', checkpoints=None, plan=None, on_stage=None, summary_dir=None,
+                  token_budget=DEFAULT_PAPER_TOKEN_BUDGET, chunk_tokens=DEFAULT_CHUNK_TOKENS):
+    '''Run a single paper through the extract -> parse -> section_summarize -> article_summarize -> render
+    stages and return the render output: {'entry': newsletter Markdown, 'summary': article summary,
+    'summary_path': cached raw summary}.
+
+    parser='stream' uses the single-pass extractor in tex_extract, parser='texsoup' the TexSoup tree.
+    extract_mode='memory' reads the sources out of the tarball in memory (stream parser only);
+    extract_mode='disk' extracts the tarball next to it first. Each stage's output is checkpointed if
+    `checkpoints` is given, and `plan` decides which stages run or come from checkpoints. Progress is
+    recorded in the PaperStore, if one is given. The raw summary and the day's entries are saved in
+    summary_dir (default: SUMMARY_DIR). Sections are trimmed to token_budget tokens per paper and
+    summarized in chunks of chunk_tokens (the engine's own settings when an engine is given).
+    '''
+    plan = plan or StagePlan()
+    tar_file = papers_path / source_folder
+    graph_dir = papers_path / INCLUDE_GRAPH_DIR_NAME
+    extract_path = papers_path / source_folder.replace('.tar.gz', '')
+    arxiv_id = paper.get('arxiv_id')
+    key = paper_checkpoint_key(paper, source_folder)
+    track = store is not None and arxiv_id is not None
+    in_memory = {}
+    print(f"Title: {paper['title']}")
+
+    def extract(_):
+        if extract_mode == 'memory' and parser == 'stream' and tar_file.is_file():
+            print(f"\n\n**Reading sources in memory: {tar_file}")
+            sources = read_tar_sources(tar_file)
+            graph = cached_include_graph(tar_file, MemorySource(sources), graph_dir) if sources else None
+            main_member = find_main_tex_member(sources, graph=graph) if graph else None
+            if track:
+                store.set_extract_state(arxiv_id, 'in_memory' if main_member is not None else 'failed')
+            if main_member is None:
+                print(f"**WARNING: Main tex file not found for {paper['title']}\nmoving on to next paper...")
+                return None
+            # Handed straight to the parse stage when it runs in the same pass
+            in_memory['sources'] = sources
+            return {'mode': 'memory', 'main': str(main_member)}
 
-    newsletter_content = []
-    
-    for idx, paper in enumerate(paper_info_list):
-        tar_file = papers_path / paper_source_folder_list[idx]
-        extract_path = papers_path / paper_source_folder_list[idx].replace('.tar.gz', '')
         print(f"\n\n**Extract Path: {extract_path}")
-        
         if not extract_path.exists():
-            extract_tarfile(tar_file, extract_path)
+            extracted = extract_tarfile(tar_file, extract_path)
+            if track:
+                store.set_extract_state(arxiv_id, 'extracted' if extracted else 'failed')
         else:
             print(f"**INFO: already extracted {paper['title']}.")
 
-        main_text = find_main_tex_file(extract_path, test=test)
+        graph = cached_include_graph(tar_file, DirectorySource(extract_path), graph_dir)
+        main_text = find_main_tex_file(extract_path, test=test, graph=graph) if graph else None
         if main_text is None:
             print(f"**WARNING: Main tex file not found for {paper['title']}\nmoving on to next paper...")
-            continue
-        
+            return None
         print(f"Main text file: {main_text}")
-        tex_soup = parse_tex_file(main_text)
-        if tex_soup is None:
-            print(f"**WARNING: Unable to parse tex file for {paper['title']}\nmoving on to next paper...")
-            continue
+        return {'mode': 'disk', 'main': str(main_text), 'graph': graph}
+
+    def parse(extracted):
+        if extracted['mode'] == 'memory':
+            sources = in_memory.get('sources') or read_tar_sources(tar_file)
+            section_dict = extract_sections(extracted['main'], read_lines=make_line_reader(sources)) if sources else None
+        elif parser == 'texsoup':
+            section_dict = parse_sections_texsoup(Path(extracted['main']), extract_path, extracted.get('graph'))
+        else:
+            section_dict = extract_sections(extracted['main'])
 
-        print(f"Title: {paper['title']}")
-        
-        input_list = find_tex_command(tex_soup, 'input')
-        print(input_list)
-        
-        section_filepaths = [main_text] if not input_list else create_sections_from_main_tex(input_list, extract_path)
-        section_dict = create_section_dict(section_filepaths)
-        
         if not section_dict:
             print(f"**WARNING: No sections found for {paper['title']}\nmoving on to next paper...")
-            continue
+            return None
         print(section_dict.keys())
-        
-        summaries = section_summary_generator(section_dict)
+        return {'sections': {name: str(contents) for name, contents in section_dict.items()}}
 
-        # Join all the summaries into a single string, put into json format, and add to newsletter content
-        concat_summary = "\n".join(f"{summary}" for summary in summaries.values())
-        summary = article_summary_generator(concat_summary)
-        formatted_summary = format_to_markdown(summary)
+    def section_summarize(parsed):
+        sections = parsed['sections']
+        # The sections the summarizer will attempt: trimmed to the budget it uses
+        budget, model = (engine.token_budget, engine.token_model) if engine is not None else (token_budget, None)
+        names = list(summarizable_sections(sections, budget, model))
+        # Only the sections that failed in an earlier attempt are sent again
+        partial = None
+        if checkpoints is not None and plan.reuses('section_summarize'):
+            partial = checkpoints.load(PARTIAL_SUMMARIES, key)
+        done = partial['summaries'] if partial else {}
+        only = [name for name in names if name not in done] if partial else None
+        summaries = {**done, **section_summary_generator(
+            sections, engine=engine, chunk_tokens=chunk_tokens, token_budget=budget, only=only
+        )}
+        summaries = {name: summaries[name] for name in names if name in summaries}
+        missing = [name for name in names if name not in summaries]
+        if not summaries:
+            print(f"**WARNING: Nothing summarized for {paper['title']}\nmoving on to next paper...")
+            return None
+        if missing:
+            # The paper goes out with the sections that worked; --resume sends the missing ones again
+            print(f"**WARNING: No summary for section(s) {missing} of {paper['title']}")
+            if checkpoints is not None:
+                checkpoints.save(PARTIAL_SUMMARIES, {'summaries': summaries, 'missing': missing}, key)
+        elif checkpoints is not None:
+            checkpoints.discard(PARTIAL_SUMMARIES, key)
+        return {'summaries': summaries}
+
+    def article_summarize(summarized):
+        if not summarized['summaries']:
+            # Checkpoints written before failed sections were tracked can be empty
+            print(f"**WARNING: No section summaries for {paper['title']}\nmoving on to next paper...")
+            return None
+        summary = article_summary_generator(article_input(summarized['summaries']), engine=engine)
+        if not summary:
+            print(f"**WARNING: No article summary returned for {paper['title']}\nmoving on to next paper...")
+            return None
+        return {'summary': format_to_markdown(summary)}
+
+    def render(article):
         # Cache the raw summary
         cdate = time.strftime("%Y-%m-%d")
-        SUMMARY_DIR.mkdir(parents=True, exist_ok=True)
-        save_raw_summary(formatted_summary, SUMMARY_DIR / f"{cdate}_{paper['title']}.md")
-        news_template = template_newsletter(formatted_summary, paper)
-        save_newsletter(news_template, SUMMARY_DIR / f"{cdate}.md")
+        summaries_dir = Path(summary_dir or SUMMARY_DIR)
+        summaries_dir.mkdir(parents=True, exist_ok=True)
+        summary_path = summaries_dir / f"{cdate}_{key}.md"
+        save_raw_summary(article['summary'], summary_path)
+        if track:
+            store.set_summary(arxiv_id, 'done', summary_path)
+        news_template = template_newsletter(article['summary'], paper)
+        append_newsletter(news_template, summaries_dir / f"{cdate}.md")
+        return {'entry': news_template, 'summary': article['summary'], 'summary_path': str(summary_path)}
+
+    functions = {
+        'extract': extract, 'parse': parse, 'section_summarize': section_summarize,
+        'article_summarize': article_summarize, 'render': render,
+    }
+    if checkpoints is not None and plan.resume and plan.runs('section_summarize') \
+            and checkpoints.load(PARTIAL_SUMMARIES, key) is not None:
+        # Sections are missing from the last attempt: summarize them again and redo the stages after
+        for stage in PAPER_STAGES[PAPER_STAGES.index('section_summarize'):]:
+            checkpoints.discard(stage, key)
+    with get_default_metrics().labels(paper=key):
+        result = run_stages(PAPER_STAGES, functions, checkpoints, plan, key, label=paper['title'], on_stage=on_stage)
+    if result is None or not plan.includes('render'):
+        return None
+    return result
+
+def paper_checkpoint_key(paper, source_folder):
+    '''Checkpoint directory name of a paper: its versioned arXiv ID, or the source name for test papers'''
+    arxiv_id = paper.get('arxiv_id')
+    return paper_key(arxiv_id) if arxiv_id else Path(source_folder.replace('.tar.gz', '')).name
+
+def article_input(summaries):
+    # Join all the section summaries into a single string for the article summary
+    return "\n".join(f"{summary}" for summary in summaries.values())
+
+def parse_sections_texsoup(main_text, extract_path, graph=None):
+    # Checkpoints written before the include graph existed carry only the main file
+    if graph is None or Path(extract_path) / graph['root'] != Path(main_text):
+        graph = build_include_graph(DirectorySource(extract_path))
+    if graph is None:
+        print(f"**WARNING: Unable to parse tex file {main_text}")
+        return None
+    print(graph['includes'].get(graph['root']))
+    return create_section_dict_from_graph(extract_path, graph)
+
+def _process_paper_safely(paper, source_folder, papers_path, **kwargs):
+    # Failures are isolated per paper so one bad tarball doesn't take down the batch
+    try:
+        result = process_paper(paper, source_folder, papers_path, **kwargs)
+    except Exception as e:
+        print(f"**ERROR: Failed to process {paper['title']}: {e}\nmoving on to next paper...")
+        result = None
+    store = kwargs.get('store')
+    plan = kwargs.get('plan')
+    finished = plan is None or plan.includes('render')
+    if result is None and finished and store is not None and paper.get('arxiv_id'):
+        store.set_summary(paper['arxiv_id'], 'failed')
+    return result
+
+def _iter_results(jobs, papers_path, max_workers, executor, paper_kwargs):
+    '''Yield (paper, render output or None) in submission order, each as soon as it and the papers
+    before it are done, so finished entries can be written out while later papers are still running.
+    '''
+    if max_workers <= 1:
+        for paper, folder in jobs:
+            yield paper, _process_paper_safely(paper, folder, papers_path, **paper_kwargs)
+        return
+    pool_class = ProcessPoolExecutor if executor == 'process' else ThreadPoolExecutor
+    with pool_class(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(_process_paper_safely, paper, folder, papers_path, **paper_kwargs)
+            for paper, folder in jobs
+        ]
+        for (paper, _), future in zip(jobs, futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"**ERROR: Worker failed for {paper['title']}: {e}")
+                result = None
+            yield paper, result
+
+def paper_record(paper, result):
+    '''Structured JSON-lines record written alongside each issue entry'''
+    return {
+        'arxiv_id': paper.get('arxiv_id'),
+        'title': paper['title'],
+        'arxiv_url': paper.get('arxiv_url'),
+        'authors': paper.get('authors', []),
+        'date': paper.get('date'),
+        'summary': result.get('summary'),
+        'summary_path': result.get('summary_path'),
+    }
+
+def generate_newsletter_content(paper_info_list, paper_source_folder_list, papers_path, test=False,
+                                max_workers=1, executor='thread', engine=None, parser='stream', store=None,
+                                extract_mode='memory', checkpoints=None, plan=None, writer=None, writers=None,
+                                summary_dir=None, token_budget=DEFAULT_PAPER_TOKEN_BUDGET, chunk_tokens=DEFAULT_CHUNK_TOKENS):
+    '''Summarize every paper in the original arXiv order. With an IssueWriter each entry (and its
+    record) is streamed to the issue as soon as it is ready and the number of papers written is
+    returned; without one the list of entries is returned. `writers` is a list of (IssueWriter,
+    paper indices) pairs, one per topic, each getting only the entries of its own papers.
+    With max_workers > 1 papers are processed concurrently in a thread or process pool.
+    An AsyncSummaryEngine sends the LLM calls of all papers concurrently under one rate limit.
+    Raw summaries go to summary_dir (default: SUMMARY_DIR). Without an engine, papers are trimmed to
+    token_budget tokens and sections summarized in chunks of chunk_tokens.
+    '''
+    print(f"*** Number of Papers: {len(paper_info_list)}")
+    print(f"*** Papers Path: {papers_path}")
+    print(f"*** Paper Info List: {paper_info_list}")
+    print(f"*** Mode: {['Test' if test else 'Production']}")
+    print(f"*** Workers: {max_workers} ({executor})")
+
+    if engine is not None and executor == 'process':
+        # The engine's event loop can't be shared across processes
+        print("**WARNING: AsyncSummaryEngine is not used with the process executor")
+        engine = None
+
+    jobs = list(zip(paper_info_list, paper_source_folder_list))
+    paper_kwargs = dict(
+        test=test, engine=engine, parser=parser, store=store, extract_mode=extract_mode,
+        checkpoints=checkpoints, plan=plan, summary_dir=summary_dir, token_budget=token_budget,
+        chunk_tokens=chunk_tokens
+    )
+    routes = ([(writer, None)] if writer is not None else []) + list(writers or [])
+    entries, count = [], 0
+    for index, (paper, result) in enumerate(_iter_results(jobs, papers_path, max_workers, executor, paper_kwargs)):
+        if result is None:
+            continue
+        count += 1
+        if not routes:
+            entries.append(result['entry'])
+        for issue, indices in routes:
+            if indices is None or index in indices:
+                issue.add(result['entry'], paper_record(paper, result))
+    print(f"*** Final Newsletter Papers: {count}")
+    return entries if not routes else count
+
+def run_batch_phases(paper_info_list, paper_source_folder_list, papers_path, checkpoints, resume=False,
+                     poll_interval=30.0, **paper_kwargs):
+    '''Fill the summary cache through the OpenAI Batch API before the regular run.
+
+    Every paper is extracted and parsed (checkpointed), then all section requests of the week go
+    out as batches (see batch_mode), the section summaries are assembled from the cache, and the
+    article requests go out as a second batch. The run that follows reuses these checkpoints and
+    only hits the cache; anything a batch failed to return is sent live there.
+    '''
+    jobs = (paper_info_list, paper_source_folder_list, papers_path)
+    keys = [paper_checkpoint_key(paper, folder) for paper, folder in zip(paper_info_list, paper_source_folder_list)]
+
+    generate_newsletter_content(*jobs, checkpoints=checkpoints, plan=StagePlan(resume=resume, to_stage='parse'),
+                                **paper_kwargs)
+    parsed = [checkpoints.load('parse', key) for key in keys]
+    # The same budget and chunks as the run that replays them, or its requests would miss the cache
+    sizes = {key: paper_kwargs[key] for key in ('token_budget', 'chunk_tokens') if key in paper_kwargs}
+    run_in_batches(lambda sections: section_summary_generator(sections, **sizes), [p['sections'] for p in parsed if p],
+                   utils.client, poll_interval=poll_interval)
+
+    generate_newsletter_content(*jobs, checkpoints=checkpoints, plan=StagePlan(resume=True, to_stage='section_summarize'),
+                                **paper_kwargs)
+    summarized = [checkpoints.load('section_summarize', key) for key in keys]
+    run_in_batches(lambda summaries: article_summary_generator(article_input(summaries)),
+                   [s['summaries'] for s in summarized if s and s['summaries']], utils.client, poll_interval=poll_interval)
 
-        newsletter_content += news_template
-    print(f"*** Final Newsletter Papers: {len(newsletter_content)}")
-    return newsletter_content
+def select_run_dir(test=False, run_id=None, reuse=False):
+    '''Checkpoint directory for this run: the given run id, the latest run when reusing checkpoints,
+    otherwise a new run named after today's date.
+    '''
+    checkpoint_root = CHECKPOINT_DIR / ('test' if test else 'runs')
+    if run_id:
+        return checkpoint_root / run_id
+    if reuse:
+        latest = latest_run_dir(checkpoint_root)
+        if latest is not None:
+            return latest
+    return checkpoint_root / time.strftime("%Y-%m-%d")
+
+def issue_path(date=None, newsletter_dir=NEWSLETTER_DIR):
+    '''newsletter/<year>/n_<date>.md for the given datetime (default: now)'''
+    date = date or datetime.now()
+    return Path(newsletter_dir) / str(date.year) / f"n_{date.strftime('%Y-%m-%d')}.md"
+
+def run_generator(test=False, max_workers=4, executor='thread', use_async=True, parser='stream',
+                  extract_mode='memory', resume=False, from_stage=None, only_stage=None, run_id=None, n_papers=5,
+                  n_candidates=200, batch=False, batch_poll_interval=30.0, topics=None, download_workers=4, engine_options=None,
+                  token_budget=DEFAULT_PAPER_TOKEN_BUDGET, chunk_tokens=DEFAULT_CHUNK_TOKENS):
+    '''Run the pipeline, checkpointing every stage. resume skips work that already has a checkpoint;
+    from_stage/only_stage rerun from (or just) one stage using checkpoints for the stages before it,
+    e.g. only_stage='render' rebuilds the issue without calling the LLM.
+
+    The fetch stage queries n_candidates papers and keeps the n_papers most relevant ones that are
+    not near-duplicates of each other or of earlier issues (see paper_filter).
+
+    `topics` (normalized topic dicts, see config) produce one issue each from a single run: every
+    topic picks its own papers, but the union goes through the pipeline once. The default is the
+    machine learning newsletter with n_papers papers. Papers are processed by max_workers workers of
+    a thread or process `executor`. engine_options are passed to AsyncSummaryEngine (in-flight and
+    rate limits); the engine is not used with the process executor. Every paper is trimmed to
+    token_budget tokens and long sections are summarized in chunks of chunk_tokens, with or without
+    the engine.
+
+    batch=True sends the section and article summaries through the OpenAI Batch API (half price, no
+    per-minute limits, but it can take hours) before the regular run, which then reads them from
+    the summary cache. Only full runs use batches.
+    '''
+    metrics = Metrics()
+    set_default_metrics(metrics)
+    plan = StagePlan(resume=resume, from_stage=from_stage, only_stage=only_stage)
+    checkpoints = Checkpoints(select_run_dir(test, run_id, reuse=resume or plan.reuses('fetch')))
+    print(f"*** Checkpoints: {checkpoints.run_dir}")
+    topics = topics or [normalize_topic({**DEFAULT_TOPIC, 'papers': n_papers}, NEWSLETTER_DIR)]
 
-def run_generator(test=False):
     # Initialize directories
     papers_dir = TEST_DIR if test else PAPERS_DIR
-    initialize_directories(papers_dir, NEWSLETTER_DIR)
-
-    if not test:
-        # Fetch latest machine learning papers
-        n_papers = 5
-        paper_info_list, paper_source_folder_list = fetch_latest_ml_papers(
-            max_results=n_papers, download=True, 
-            paperspath=papers_dir, extension='tar.gz', 
-            subject_query='machine learning'
-        )
+    initialize_directories(papers_dir, *(topic['newsletter_dir'] for topic in topics))
+    store = None if test else PaperStore(PAPER_INDEX)
+
+    fetched = checkpoints.load('fetch') if plan.reuses('fetch') else None
+    if fetched is None and not plan.runs('fetch'):
+        print(f"** ERROR: no fetch checkpoint in {checkpoints.run_dir}, run the fetch stage first")
+        return
+    if fetched is None:
+        with metrics.span('fetch'):
+            if not test:
+                # Fetch the latest papers of every topic, skipping versions already summarized
+                paper_info_list, paper_source_folder_list, selections = fetch_topic_papers(
+                    topics, max_results=n_candidates, paperspath=papers_dir, extension='tar.gz',
+                    max_workers=download_workers, store=store
+                )
+            else:
+                # Test data
+                paper_info_list = [
+                    {'title': 'Sample Paper 1', 'arxiv_url': 'http://arxiv.org/'},
+                    {'title': 'Sample Paper 2', 'arxiv_url': 'http://arxiv.org/'}
+                ]
+                paper_source_folder_list = ['test1', 'test2']
+                selections = {topic['name']: [0, 1] for topic in topics}
+        checkpoints.save('fetch', {'papers': paper_info_list, 'files': paper_source_folder_list, 'topics': selections})
     else:
-        # Test data
-        paper_info_list = [
-            {'title': 'Sample Paper 1', 'arxiv_url': 'http://arxiv.org/'},
-            {'title': 'Sample Paper 2', 'arxiv_url': 'http://arxiv.org/'}
-        ]
-        paper_source_folder_list = ['test1', 'test2']
+        print("**INFO: fetch loaded from checkpoint")
+        paper_info_list, paper_source_folder_list = fetched['papers'], fetched['files']
+        selections = fetched.get('topics') or {}
+    if not plan.includes('extract'):
+        return
 
-    newsletter_content = generate_newsletter_content(paper_info_list, paper_source_folder_list, papers_dir, test=test)
+    if batch and (from_stage or only_stage):
+        print("**WARNING: batch mode only applies to full runs, sending requests live")
+    elif batch:
+        run_batch_phases(
+            paper_info_list, paper_source_folder_list, papers_dir, checkpoints, resume=resume,
+            poll_interval=batch_poll_interval, test=test, max_workers=max_workers, executor=executor, parser=parser,
+            store=store, extract_mode=extract_mode, token_budget=token_budget, chunk_tokens=chunk_tokens
+        )
+        plan = StagePlan(resume=True)
+
+    sizes = {'token_budget': token_budget, 'chunk_tokens': chunk_tokens}
+    engine = AsyncSummaryEngine(**{**(engine_options or {}), **sizes}) if use_async and executor != 'process' else None
+    writers = []
+    try:
+        # Only a run that reaches the render stage produces new issues
+        if plan.includes('render'):
+            for topic in topics:
+                # Checkpoints from before topics existed hold a single topic's papers
+                indices = selections.get(topic['name'], range(len(paper_info_list)))
+                writers.append((IssueWriter(issue_path(newsletter_dir=topic['newsletter_dir'])), set(indices)))
+        generate_newsletter_content(
+            paper_info_list, paper_source_folder_list, papers_dir, test=test, max_workers=max_workers,
+            executor=executor, engine=engine, parser=parser, store=store, extract_mode=extract_mode,
+            checkpoints=checkpoints, plan=plan, writers=writers, **sizes
+        )
+    except BaseException:
+        for writer, _ in writers:
+            writer.abort()
+        raise
+    finally:
+        if engine is not None:
+            engine.close()
+    for writer, _ in writers:
+        if writer.finalize() and store is not None:
+            # Papers are left out of later issues once they are in one; summarized alone isn't enough
+            store.set_published(writer.arxiv_ids)
+    write_run_report(metrics, checkpoints.run_dir.name)
 
-    current_year = datetime.now().year
-    current_date = time.strftime("%Y-%m-%d")
-    output_folder = NEWSLETTER_DIR / str(current_year)
-    output_folder.mkdir(parents=True, exist_ok=True)
-    file_path = output_folder / f"n_{current_date}.md"
-    save_newsletter(newsletter_content, file_path)
+def write_run_report(metrics, run_name):
+    '''Save the run's metrics to reports/<run>_<time>.json and print the summary table'''
+    report_path = REPORT_DIR / f"{run_name}_{time.strftime('%H%M%S')}.json"
+    report = metrics.write_report(report_path)
+    print(metrics.summary_table(report))
+    print(f"MESSAGE -> Run report: {report_path}")
 
 if __name__ == "__main__":
-    run_generator(test=False)  # Set to True for testing
\ No newline at end of file
+    # The command line lives in generate_newsletter.py (config file, topics, stage flags)
+    from generate_newsletter import main
+    main()
@@ -0,0 +1,110 @@
+'''Stage graph and durable checkpoints for the newsletter run.
+
+    fetch -> extract -> parse -> section_summarize -> article_summarize -> render
+
+fetch is recorded once per run; every other stage writes one JSON checkpoint per paper under
+checkpoints/<run id>/<paper key>/<stage>.json as soon as it finishes.
+'''
+import os
+import json
+from pathlib import Path
+from metrics import get_default_metrics
+
+STAGES = ['fetch', 'extract', 'parse', 'section_summarize', 'article_summarize', 'render']
+PAPER_STAGES = STAGES[1:]
+
+
+class Checkpoints:
+    def __init__(self, run_dir):
+        self.run_dir = Path(run_dir)
+
+    def _path(self, stage, key=None):
+        return self.run_dir / (key or '_run') / f"{stage}.json"
+
+    def load(self, stage, key=None):
+        path = self._path(stage, key)
+        if not path.exists():
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            print(f"**WARNING: Ignoring corrupt checkpoint {path}")
+            return None
+
+    def save(self, stage, data, key=None):
+        path = self._path(stage, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=4, default=str)
+        os.replace(tmp_path, path)
+
+    def discard(self, stage, key=None):
+        self._path(stage, key).unlink(missing_ok=True)
+
+
+def latest_run_dir(checkpoint_dir):
+    runs = sorted(p for p in Path(checkpoint_dir).glob('*') if p.is_dir()) if Path(checkpoint_dir).exists() else []
+    return runs[-1] if runs else None
+
+
+class StagePlan:
+    '''Which stages a run executes and which it may take from checkpoints.
+
+    - default: run every stage, ignore existing checkpoints
+    - resume: run every stage, but skip work whose checkpoint already exists
+    - from_stage: load checkpoints for the stages before it, rerun it and everything after
+    - only_stage: load checkpoints for the stages before it, rerun only it
+    - to_stage: stop after this stage
+    '''
+    def __init__(self, resume=False, from_stage=None, only_stage=None, to_stage=None):
+        for stage in (from_stage, only_stage, to_stage):
+            if stage is not None and stage not in STAGES:
+                raise ValueError(f"Unknown stage {stage!r}, expected one of {STAGES}")
+        if from_stage and only_stage:
+            raise ValueError("from_stage and only_stage are mutually exclusive")
+        self.resume = resume
+        start = from_stage or only_stage or STAGES[0]
+        self.first = STAGES.index(start)
+        self.last = STAGES.index(only_stage or to_stage or STAGES[-1])
+
+    def runs(self, stage):
+        return self.first <= STAGES.index(stage) <= self.last
+
+    def reuses(self, stage):
+        '''Stages before the active range must come from checkpoints; inside it only when resuming'''
+        return STAGES.index(stage) < self.first or (self.resume and self.runs(stage))
+
+    def includes(self, stage):
+        return STAGES.index(stage) <= self.last
+
+
+def run_stages(stages, functions, checkpoints, plan, key, label='', on_stage=None):
+    '''Run per-paper stages in order, threading each stage's output into the next.
+
+    functions[stage](previous_output) returns the stage output (JSON-serializable) or None on failure.
+    Returns the output of the last stage reached, or None if the paper dropped out.
+    on_stage(stage) is called as each stage starts (or is loaded from its checkpoint).
+    '''
+    data = None
+    for stage in stages:
+        if not plan.includes(stage):
+            break
+        if on_stage is not None:
+            on_stage(stage)
+        cached = checkpoints.load(stage, key) if checkpoints is not None and plan.reuses(stage) else None
+        if cached is not None:
+            print(f"**INFO: {label} {stage} loaded from checkpoint")
+            data = cached
+            continue
+        if not plan.runs(stage):
+            print(f"**WARNING: {label} has no {stage} checkpoint, skipping paper")
+            return None
+        with get_default_metrics().span(stage):
+            data = functions[stage](data)
+        if data is None:
+            return None
+        if checkpoints is not None:
+            checkpoints.save(stage, data, key)
+    return data
@@ -1,95 +1,80 @@
 import re
 import os
-from datetime import datetime
-
-
-def generate_newsletter():
-    BASE_NEWSLETTER_FOLDER = os.path.join("newsletter")
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    markdown_file = os.path.join(BASE_NEWSLETTER_FOLDER, "2024", f"n_{current_date}.md")
-    
-    try:
-        # Read the markdown file
-        with open(markdown_file, 'r', encoding='utf-8') as file:
-            markdown_content = file.read()
-        
-        # Convert markdown to HTML
-        html_content = markdown_to_html(markdown_content, date=current_date)
-        font = "https://fonts.googleapis.com/css2?family=Lato:wght@300;400;700&display=swap"
-        
-        # Create the full HTML document
-        full_html = f"""
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Newsletter Mehrabiani</title>
-    <link rel="stylesheet" href="/static/css/styles.css">
-    <link rel="preconnect" href="https://fonts.googleapis.com">
-    <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
-    <link href="{font}" rel="stylesheet">
-    <script src="https://polyfill.io/v3/polyfill.min.js?features=es6"></script>
-    <script id="MathJax-script" async src="https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-mml-chtml.js"></script>
-</head>
-<body>
-    <header>
-        <h1>newsletter.mehrabiani</h1>
-        <nav>
-            <input type="checkbox" id="sidebar-active">
-            <label for="sidebar-active" class="open-sidebar-button">
-                <svg xmlns="http://www.w3.org/2000/svg" height="24px" viewBox="0 -960 960 960" width="24px" fill="#000000"><path d="M120-240v-80h720v80H120Zm0-200v-80h720v80H120Zm0-200v-80h720v80H120Z"/></svg>
-            </label>
-            <label id="overlay" for="sidebar-active"></label>
-            <div class="links-container">
-                <label for="sidebar-active" class="close-sidebar-button">
-                    <svg xmlns="http://www.w3.org/2000/svg" height="24px" viewBox="0 -960 960 960" width="24px" fill="#000000"><path d="m256-200-56-56 224-224-224-224 56-56 224 224 224-224 56 56-224 224 224 224-56 56-224-224-224 224Z"/></svg>
-                </label>    
-                <a class="home-link" href="/">home</a>
-                <a class="home-link" href="/about.html">about</a>
-                <a class="home-link" href="/projects.html">projects</a>
-                <a class="home-link" href="/newsletter.html">newsletter</a>
-            </div>
-        </nav>
-    </header>
-            {html_content}
-    <footer>
-        <a href="https://github.com/nissmogt" class="footer-link">github</a> |
-        <a href="https://linkedin.com/in/kareemmehrabiani" class="footer-link">linkedin</a> |
-        <a href="mailto:kareem@mehrabiani.com" class="footer-link">email</a>
-        <p class="copyright">Copyright 2024</p>
-    </footer>
-</body>
-</html>
-        """
-        
-        # Save the newsletter
-        newsletter_path = os.path.join(BASE_NEWSLETTER_FOLDER, "html", f"final_newsletter_{current_date}.html")
-        with open(newsletter_path, "w", encoding='utf-8') as f:
-            f.write(full_html)
-        
-        print(f"Newsletter generated successfully: {newsletter_path}")
-        
-    except Exception as e:
-        print(f"Error generating newsletter: {e}")
+import html
+import json
+import hashlib
+import argparse
+from pathlib import Path
+from string import Template
+from functools import lru_cache
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from xml.sax.saxutils import escape as xml_escape
+from concurrent.futures import ProcessPoolExecutor
+
+
+BASE_DIR = Path(__file__).resolve().parent
+NEWSLETTER_DIR = BASE_DIR / "newsletter"
+TEMPLATE_DIR = BASE_DIR / "templates"
+PAGE_TITLE = "Newsletter Mehrabiani"
+# Page headings and feed item titles; each topic's site uses its own (see config.normalize_topic)
+HEADING = "Weekly Machine Learning Research Highlights"
+# Model named in the page footer: the one that wrote the article summaries
+SUMMARY_MODEL = "gpt-4o-mini"
+
+
+@lru_cache(maxsize=None)
+def load_template(name='page.html'):
+    '''Read and compile a page template once per process'''
+    return Template((TEMPLATE_DIR / name).read_text(encoding='utf-8'))
+
+def render_page(markdown_content, date, title=PAGE_TITLE, heading=HEADING, model=SUMMARY_MODEL):
+    return render_html_page(
+        markdown_to_html(markdown_content, date=date, heading=heading, model=model), year=date[:4], title=title
+    )
 
+def render_html_page(html_content, year=None, title=PAGE_TITLE):
+    return load_template().substitute(
+        content=html_content, title=title, year=year or datetime.now().strftime("%Y")
+    )
 
-def markdown_to_html(markdown_content, date=None):
+
+SECTION_SPLIT_RE = re.compile(r'\n---\n')
+ARXIV_URL_RE = re.compile(r'https?://arxiv\.org')
+ARXIV_RE = re.compile(r'arxiv:\s*(https?://arxiv\.org/\S+)')
+
+# One alternation, scanned once per section. Math comes first so nothing inside it is touched,
+# and display math is tried before inline math.
+MARKDOWN_TOKEN_RE = re.compile(
+    # Cheap first-character check so the scan skips plain text quickly
+    r'(?=[$#\n*\[])'
+    r'(?:(?P<display>\$\$.+?\$\$)'
+    r'|(?P<inline>(?<![\\$])\$[^$\n]+?(?<!\\)\$)'
+    r'|^###[ \t]*(?P<header>[^\n]*?)[ \t]*$'
+    r'|(?P<para>\n[ \t]*\n\s*)'
+    r'|\*\*(?P<bold>[^\n]+?)\*\*'
+    r'|(?<![*\w])\*(?P<italic>[^*\s](?:[^*\n]*?[^*\s])?)\*(?![*\w])'
+    r'|\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>[^)\s]+)\))',
+    re.MULTILINE | re.DOTALL
+)
+
+
+def markdown_to_html(markdown_content, date=None, heading=HEADING, model=SUMMARY_MODEL):
     if date is None:
         date = datetime.now().strftime("%B %d, %Y").lower()
 
     # Split the content into sections
-    sections = re.split(r'\n---\n', markdown_content)
+    sections = SECTION_SPLIT_RE.split(markdown_content)
 
-    html_content = f"""
+    parts = [f"""
     <div class="container">
-        <h1>Weekly Machine Learning Research Highlights 🤖</h1>
+        <h1>{html.escape(heading, quote=False)} 🤖</h1>
         <h2>
             Updates on Friday.
             <p>updated: {date}</p> </br> 
-            Click titles below to view article summaries. Generated using a custom pipeline with OpenAI's <strong>gpt-4o-mini</strong>.
+            Click titles below to view article summaries. Generated using a custom pipeline with OpenAI's <strong>{html.escape(model, quote=False)}</strong>.
         </h2>
-    """
+    """]
 
     for section in sections:
         section = section.strip()
@@ -101,49 +86,215 @@ def markdown_to_html(markdown_content, date=None):
         content = '\n'.join(lines[1:])
 
         # Extract arxiv link
-        arxiv_match = re.search(r'arxiv:\s*(http://arxiv\.org/\S+)', content)
+        arxiv_match = ARXIV_RE.search(content)
         arxiv_link = arxiv_match.group(1) if arxiv_match else ''
         
         # Remove ArXiv link from content
-        content = re.sub(r'arxiv:\s*http://arxiv\.org/\S+', '', content).strip()
+        content = ARXIV_RE.sub('', content).strip()
 
-        html_content += f"""
+        parts.append(f"""
         <details>
-            <summary>{title}</summary>
+            <summary>{html.escape(title, quote=False)}</summary>
             <div class="newsletter">
                 {convert_markdown_section(content)}
                 <p><a href="{arxiv_link}" target="_blank">ArXiv Link</a></p>
             </div>
         </details>
-        """
+        """)
 
-    html_content += "</div>"
-    return html_content
+    parts.append("</div>")
+    return ''.join(parts)
+
+
+def _render_token(match):
+    kind = match.lastgroup
+    if kind == 'display':
+        return f"\\[{match.group(0)[2:-2]}\\]"
+    if kind == 'inline':
+        return f"\\({match.group(0)[1:-1]}\\)"
+    if kind == 'header':
+        return f"<strong>{_render_inline(match.group('header'))}</strong>"
+    if kind == 'para':
+        return '</p><p>'
+    if kind == 'bold':
+        return f"<strong>{_render_inline(match.group('bold'))}</strong>"
+    if kind == 'italic':
+        return f"<em>{_render_inline(match.group('italic'))}</em>"
+    url = match.group('link_url')
+    if ARXIV_URL_RE.match(url):
+        return match.group(0)
+    return f'<a href="{url.replace(chr(34), "&quot;")}">{_render_inline(match.group("link_text"))}</a>'
+
+def _render_inline(escaped):
+    return MARKDOWN_TOKEN_RE.sub(_render_token, escaped)
 
 
 def convert_markdown_section(markdown):
-    # Convert headers
-    markdown = re.sub(r'^###\s*(.*?)$', r'<strong>\1</strong>', markdown, flags=re.MULTILINE)
-    
-    # Convert bold
-    markdown = re.sub(r'\*\*(.*?)\*\*', r'<strong>\1</strong>', markdown)
-    
-    # Convert italic
-    markdown = re.sub(r'\*(.*?)\*', r'<em>\1</em>', markdown)
-    
-    # Convert links
-    markdown = re.sub(r'\[(.*?)\]\(((?!http://arxiv\.org).*?)\)', r'<a href="\2">\1</a>', markdown)
-
-    # Handle inline TeX
-    markdown = re.sub(r'\$(.+?)\$', r'\\(\1\\)', markdown)
-    # Handle display TeX
-    markdown = re.sub(r'\$\$(.*?)\$\$', r'\\[\1\\]', markdown, flags=re.DOTALL)
-    
-    # Convert paragraphs
-    markdown = markdown.replace('\n\n', '</p><p>')
-    markdown = f'<p>{markdown}</p>'
-    
-    return markdown
+    '''Render a section body in a single pass over the text: headers, bold, italic, links and
+    paragraphs. $...$ and $$...$$ spans are passed through untouched as MathJax \\(...\\) / \\[...\\].
+    The text is HTML-escaped once up front; none of the markup tokens contain &, < or >.
+    '''
+    return f"<p>{_render_inline(html.escape(markdown, quote=False))}</p>"
+
+
+# Bump when the renderer or page template changes so archive builds re-render every issue
+RENDERER_VERSION = '3'
+BUILD_MANIFEST_NAME = '.build_manifest.json'
+ISSUE_DIR_RE = re.compile(r'^\d{4}$')
+ISSUE_TITLE_RE = re.compile(r'^##[ \t]+(.+?)[ \t]*$', re.MULTILINE)
+SITE_URL = 'https://mehrabiani.com/newsletter'
+FEED_ITEMS = 20
+
+
+def issue_date(markdown_path):
+    '''"newsletter/2024/n_2024-05-03.md" -> "2024-05-03"'''
+    return Path(markdown_path).stem.removeprefix('n_')
+
+def issue_html_name(date):
+    return f"final_newsletter_{date}.html"
+
+def discover_issues(newsletter_dir=NEWSLETTER_DIR):
+    '''All issue files newsletter/<year>/n_<date>.md, oldest first'''
+    newsletter_dir = Path(newsletter_dir)
+    if not newsletter_dir.exists():
+        return []
+    paths = [
+        path for year_dir in newsletter_dir.iterdir() if year_dir.is_dir() and ISSUE_DIR_RE.match(year_dir.name)
+        for path in year_dir.glob('n_*.md')
+    ]
+    return sorted(paths, key=issue_date)
+
+def _render_issue(job):
+    markdown_path, html_path, title, heading, model = job
+    markdown = Path(markdown_path).read_text(encoding='utf-8')
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(render_page(markdown, date=issue_date(markdown_path), title=title, heading=heading, model=model))
+    return html_path
+
+def render_archive(markdown_paths, output_dir, manifest_path=None, force=False, max_workers=None, title=PAGE_TITLE,
+                   heading=HEADING, model=SUMMARY_MODEL):
+    '''Render many issues to output_dir/final_newsletter_<date>.html. A build manifest records the
+    hash of each issue's Markdown, so only new or changed issues are re-rendered on the next build;
+    those are split across a process pool. Returns the paths that were written.
+    '''
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    manifest_path = Path(manifest_path) if manifest_path else output_dir / BUILD_MANIFEST_NAME
+    manifest = {}
+    if manifest_path.exists() and not force:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    jobs, digests = [], {}
+    for markdown_path in markdown_paths:
+        data = Path(markdown_path).read_bytes()
+        digest = hashlib.sha256(f"{RENDERER_VERSION}\0{title}\0{heading}\0{model}\0".encode() + data).hexdigest()
+        html_path = output_dir / issue_html_name(issue_date(markdown_path))
+        if manifest.get(str(markdown_path)) == digest and html_path.exists():
+            continue
+        jobs.append((str(markdown_path), html_path, title, heading, model))
+        digests[str(markdown_path)] = digest
+
+    # Issues that disappeared since the last build lose their page too
+    for removed in set(manifest) - {str(path) for path in markdown_paths}:
+        (output_dir / issue_html_name(issue_date(removed))).unlink(missing_ok=True)
+        del manifest[removed]
+
+    max_workers = min(max_workers or os.cpu_count() or 1, len(jobs))
+    if max_workers > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            written = list(pool.map(_render_issue, jobs, chunksize=max(1, len(jobs) // (max_workers * 4))))
+    else:
+        written = [_render_issue(job) for job in jobs]
+    manifest.update(digests)
+
+    tmp_path = manifest_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, manifest_path)
+    return written
+
+
+def issue_titles(markdown_path):
+    return ISSUE_TITLE_RE.findall(Path(markdown_path).read_text(encoding='utf-8'))
+
+def render_index(issues, title=PAGE_TITLE, heading=HEADING):
+    '''Archive page body: one entry per issue, newest first, grouped by year. issues is a list of
+    (date, titles) pairs.
+    '''
+    parts = [f'''
+    <div class="container">
+        <h1>{html.escape(heading, quote=False)} 🤖</h1>
+        <h2>Archive of past issues. Click a date to read that week's summaries.</h2>
+    ''']
+    year = None
+    for date, titles in sorted(issues, reverse=True):
+        if date[:4] != year:
+            year = date[:4]
+            parts.append(f"<h3>{year}</h3>")
+        parts.append(
+            f'<p><a href="{issue_html_name(date)}">{date}</a> ({len(titles)} paper{"s" if len(titles) != 1 else ""})</p>'
+        )
+    parts.append("</div>")
+    return render_html_page('\n        '.join(parts), title=title)
+
+def render_feed(issues, site_url=SITE_URL, limit=FEED_ITEMS, title=PAGE_TITLE, heading=HEADING):
+    '''RSS 2.0 feed of the latest `limit` issues; each item lists that issue's paper titles'''
+    items = []
+    for date, titles in sorted(issues, reverse=True)[:limit]:
+        link = f"{site_url}/{issue_html_name(date)}"
+        published = format_datetime(datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc))
+        description = ''.join(f"<li>{html.escape(paper, quote=False)}</li>" for paper in titles)
+        items.append(
+            f"    <item>\n"
+            f"      <title>{xml_escape(heading)} {date}</title>\n"
+            f"      <link>{xml_escape(link)}</link>\n"
+            f"      <guid>{xml_escape(link)}</guid>\n"
+            f"      <pubDate>{published}</pubDate>\n"
+            f"      <description>{xml_escape(f'<ul>{description}</ul>')}</description>\n"
+            f"    </item>\n"
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0">\n  <channel>\n'
+        f"    <title>{xml_escape(title)}</title>\n"
+        f"    <link>{xml_escape(site_url)}/</link>\n"
+        f"    <description>{xml_escape(heading)} from arXiv</description>\n"
+        + ''.join(items) +
+        "  </channel>\n</rss>\n"
+    )
+
+def _write_if_changed(path, text):
+    path = Path(path)
+    if path.exists() and path.read_text(encoding='utf-8') == text:
+        return False
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    return True
+
+def build_site(newsletter_dir=NEWSLETTER_DIR, output_dir=None, max_workers=None, force=False, site_url=SITE_URL,
+               title=PAGE_TITLE, formats=('html', 'rss'), heading=HEADING, model=SUMMARY_MODEL):
+    '''Render every issue under newsletter_dir/<year>/ into output_dir (default newsletter_dir/html),
+    then write the archive index.html ('html' format) and feed.xml ('rss' format). Unchanged issues
+    are skipped via the build manifest. Returns the paths that were written. `heading` titles the
+    pages and feed items, `model` is the summary model named in the page footer.
+    '''
+    output_dir = Path(output_dir) if output_dir else Path(newsletter_dir) / 'html'
+    paths = discover_issues(newsletter_dir)
+    issues = [(issue_date(path), issue_titles(path)) for path in paths]
+    written = []
+    if 'html' in formats:
+        written += render_archive(
+            paths, output_dir, force=force, max_workers=max_workers, title=title, heading=heading, model=model
+        )
+        if _write_if_changed(output_dir / 'index.html', render_index(issues, title=title, heading=heading)):
+            written.append(output_dir / 'index.html')
+    if 'rss' in formats:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        if _write_if_changed(output_dir / 'feed.xml', render_feed(issues, site_url=site_url, title=title, heading=heading)):
+            written.append(output_dir / 'feed.xml')
+    print(f"MESSAGE -> {len(paths)} issue(s), {len(written)} file(s) written to {output_dir}")
+    return written
+
 
 # Test using a markdown string
 def test1():
@@ -164,13 +315,19 @@ def test2():
         markdown = f.read()
     print(markdown_to_html(markdown))
 
-# use argparse to convert markdown file to html
-# if __name__ == '__main__':
-#     parser = argparse.ArgumentParser(description='Convert markdown to HTML')
-#     parser.add_argument('file', type=str, help='Path to the markdown file')
-#     args = parser.parse_args()
-#     with open(args.file, 'r') as f:
-#         markdown = f.read()
-#     # save to html file and format accordingly
-#     with open('md_to_output.html', 'w') as f:
-#         f.write(markdown_to_html(markdown))
\ No newline at end of file
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the newsletter site from newsletter/<year>/n_<date>.md')
+    parser.add_argument('--newsletter-dir', default=str(NEWSLETTER_DIR))
+    parser.add_argument('--output-dir', default=None, help='Defaults to <newsletter-dir>/html')
+    parser.add_argument('--workers', type=int, default=None, help='Render processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Re-render every issue, ignoring the build manifest')
+    parser.add_argument('--site-url', default=SITE_URL, help='Absolute URL the feed links to')
+    parser.add_argument('--title', default=PAGE_TITLE, help='Page and feed title')
+    parser.add_argument('--heading', default=HEADING, help='Page heading and feed item title')
+    parser.add_argument('--model', default=SUMMARY_MODEL, help='Summary model named in the page footer')
+    parser.add_argument('--formats', nargs='+', choices=('html', 'rss'), default=('html', 'rss'))
+    args = parser.parse_args()
+    build_site(args.newsletter_dir, output_dir=args.output_dir, max_workers=args.workers,
+               force=args.force, site_url=args.site_url, title=args.title, formats=args.formats,
+               heading=args.heading, model=args.model)
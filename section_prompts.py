@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import difflib
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: the registry file is then only safe within one process
+    fcntl = None
+
+DEFAULT_REGISTRY_PATH = Path(__file__).resolve().parent / 'summary_cache' / 'section_prompts.json'
+
+_STYLE = (
+    " Cover all key points but be concise, using markdown bullet points. "
+    "Keep technical terms, model names, datasets and numbers exactly as written."
+)
+
+# Canonical prompts for the section kinds that make up most papers
+SECTION_PROMPTS = {
+    'abstract': "Summarize the abstract of a scientific article: the problem, the proposed approach and the headline result." + _STYLE,
+    'introduction': "Summarize the introduction of a scientific article: the problem being addressed, why it matters, the gap in prior work and the stated contributions." + _STYLE,
+    'related_work': "Summarize the related work section of a scientific article: the main lines of prior work and how this paper differs from them." + _STYLE,
+    'background': "Summarize the background section of a scientific article: the concepts, notation and prior results the paper builds on." + _STYLE,
+    'methods': "Summarize the methods section of a scientific article: the proposed model or procedure, its key components, and the tools, data and assumptions it relies on." + _STYLE,
+    'theory': "Summarize the theoretical section of a scientific article: the main definitions, assumptions and results (theorems, bounds) and what they imply." + _STYLE,
+    'experiments': "Summarize the experimental setup of a scientific article: datasets, baselines, metrics, training details and evaluation protocol." + _STYLE,
+    'results': "Summarize the results section of a scientific article: the key quantitative findings, comparisons to baselines and any ablations." + _STYLE,
+    'discussion': "Summarize the discussion section of a scientific article: how the authors interpret the results, their limitations and open questions." + _STYLE,
+    'conclusion': "Summarize the conclusion of a scientific article: the main takeaways and the future work the authors propose." + _STYLE,
+    'appendix': "Summarize this appendix of a scientific article, keeping only details that add to the main text (extra experiments, proofs, implementation details)." + _STYLE,
+}
+
+# Words that identify each kind in file stems such as "02_methods" or titles such as "Experimental Setup"
+SECTION_ALIASES = {
+    'abstract': ['abstract', 'summary'],
+    'introduction': ['introduction', 'intro', 'motivation', 'overview'],
+    'related_work': ['related', 'prior', 'literature', 'previous'],
+    'background': ['background', 'preliminaries', 'prelim', 'preliminary', 'notation', 'setting'],
+    'methods': ['methods', 'method', 'methodology', 'approach', 'model', 'models', 'framework', 'architecture', 'algorithm', 'proposed'],
+    'theory': ['theory', 'theoretical', 'analysis', 'proofs', 'proof', 'theorem', 'theorems', 'bounds'],
+    'experiments': ['experiments', 'experiment', 'experimental', 'setup', 'evaluation', 'eval', 'implementation', 'datasets', 'data'],
+    'results': ['results', 'result', 'findings', 'ablation', 'ablations', 'benchmark', 'benchmarks'],
+    'discussion': ['discussion', 'limitations', 'limitation', 'broader', 'impact'],
+    'conclusion': ['conclusion', 'conclusions', 'concluding', 'future', 'outlook'],
+    'appendix': ['appendix', 'appendices', 'supplementary', 'supplement', 'app', 'appx', 'supp'],
+}
+
+
+def normalize_section_name(name):
+    '''Lowercase words of a file stem or \\section title: "02_Related-Work" -> "related work"'''
+    name = re.sub(r'([a-z])([A-Z])', r'\1 \2', name)
+    words = re.findall(r'[a-z]+', name.lower())
+    return ' '.join(words)
+
+
+class SectionPromptRegistry:
+    '''Maps section names to system prompts without an LLM round trip.
+
+    Names are matched to a canonical kind by alias words, falling back to fuzzy matching for
+    misspellings and abbreviations. Prompts generated live for unknown names are stored back and
+    persisted, so each unknown name costs at most one call ever.
+    '''
+    def __init__(self, path=DEFAULT_REGISTRY_PATH):
+        self.path = Path(path)
+        self.prompts = dict(SECTION_PROMPTS)
+        self.aliases = {alias: kind for kind, words in SECTION_ALIASES.items() for alias in words}
+        self.generated = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def _read(self):
+        if not self.path.exists():
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"**WARNING: Could not load section prompt registry {self.path}: {e}")
+            return {}
+
+    def load(self):
+        data = self._read()
+        self.prompts.update(data.get('prompts', {}))
+        self.aliases.update(data.get('aliases', {}))
+        self.generated.update(data.get('generated', {}))
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(self.path.with_name(f"{self.path.name}.lock"), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def save(self):
+        '''Write the registry, merged into what other processes (workers of the process pool, the
+        service) saved since it was loaded, so none of their generated prompts are lost
+        '''
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Only overrides are persisted so edits to the built-in tables still take effect
+        builtin_aliases = {alias: kind for kind, words in SECTION_ALIASES.items() for alias in words}
+        with self._file_lock():
+            saved = self._read()
+            data = {
+                'prompts': {**saved.get('prompts', {}),
+                            **{k: v for k, v in self.prompts.items() if SECTION_PROMPTS.get(k) != v}},
+                'aliases': {**saved.get('aliases', {}),
+                            **{k: v for k, v in self.aliases.items() if builtin_aliases.get(k) != v}},
+                'generated': {**saved.get('generated', {}), **self.generated},
+            }
+            tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+        self.generated = data['generated']
+
+    def kind_of(self, section_name):
+        '''Canonical section kind for a file stem or section title, or None if nothing matches'''
+        words = normalize_section_name(section_name).split()
+        for word in words:
+            if word in self.aliases:
+                return self.aliases[word]
+        for word in words:
+            match = difflib.get_close_matches(word, self.aliases.keys(), n=1, cutoff=0.85)
+            if match:
+                return self.aliases[match[0]]
+        return None
+
+    def lookup(self, section_name):
+        kind = self.kind_of(section_name)
+        if kind is not None:
+            return self.prompts[kind]
+        return self.generated.get(normalize_section_name(section_name))
+
+    def add(self, section_name, prompt):
+        with self._lock:
+            self.generated[normalize_section_name(section_name)] = prompt
+            self.save()
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+def get_default_registry():
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = SectionPromptRegistry()
+        return _default_registry
+
+def set_default_registry(registry):
+    global _default_registry
+    with _default_registry_lock:
+        _default_registry = registry
@@ -0,0 +1,418 @@
+'''Long-running summary service: submit an arXiv ID over HTTP, then poll or stream its summary.
+
+    python service.py [--port 8765] [--workers 2] [--config newsletter.toml]
+
+    POST /jobs                   {"arxiv_id": "2401.00001"} -> 202 new job, 200 job already known
+    GET  /jobs/<job id>          job: status (queued, running, done, failed), stage, summary, error
+    GET  /jobs/<job id>/events   text/event-stream of job updates, closed once the job finishes
+    GET  /summaries/<arxiv id>   latest finished summary of a paper, 404 if there is none
+    GET  /health                 queue and worker counts
+    GET  /metrics                metrics.Metrics report since startup
+
+Jobs run on a small worker pool around process_paper, the per-paper pipeline of the weekly run,
+with everything kept warm between jobs: one AsyncSummaryEngine (pooled async OpenAI client, shared
+rate limits), one arXiv client, one pooled requests session for source downloads, and the shared
+summary cache, prompt registry and PaperStore. Finished summaries are also kept in memory, so
+repeated requests are answered without any work, and papers the weekly run already summarized are
+served from their saved summary. A paper that is already queued or running is not queued twice.
+Finished jobs are forgotten after a day (JOB_TTL_SECONDS), and /metrics covers the most recent
+METRICS_MAX_RECORDS records, so a long-running service doesn't grow without bound.
+
+Jobs record their summaries in the PaperStore but never mark a paper as published, so a paper a
+teammate asked about can still make the next issue; their raw summaries and entries are written to
+summary_cache/service/, apart from the weekly run's.
+
+For tests, point it at the local_servers stand-ins:
+
+    arxiv_server, arxiv_url = start_fake_arxiv_server({'2401.00001v1': tarball})
+    service = SummaryService(engine=AsyncSummaryEngine(client=FakeAsyncOpenAI()), arxiv_url=arxiv_url)
+    server, base_url = serve(service, port=0)
+'''
+import json
+import uuid
+import time
+import queue
+import argparse
+import threading
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+import arxiv
+from llm_engine import AsyncSummaryEngine
+from downloader import download_sources, make_session
+from paper_store import PaperStore, split_arxiv_id, paper_key
+from pipeline import Checkpoints, StagePlan
+from metrics import Metrics, set_default_metrics, get_default_metrics
+from utils import paper_metadata, source_url
+from config import load_config, engine_options
+from generate_newsletter import apply_config
+from paper_summary_generator import PAPERS_DIR, PAPER_INDEX, CHECKPOINT_DIR, SUMMARY_DIR, _process_paper_safely
+
+FINISHED = ('done', 'failed')
+MEMORY_CACHE_SIZE = 512
+# Finished jobs are forgotten after JOB_TTL_SECONDS, or sooner (oldest first) beyond MAX_JOBS
+JOB_TTL_SECONDS = 24 * 3600
+MAX_JOBS = 10000
+# /metrics covers the most recent records only
+METRICS_MAX_RECORDS = 50000
+KEEPALIVE_SECONDS = 15.0
+
+
+def normalize_arxiv_id(value):
+    '''"arXiv:2401.00001v2", "https://arxiv.org/abs/2401.00001v2" -> "2401.00001v2"; None if empty'''
+    value = (value or '').strip()
+    for prefix in ('https://arxiv.org/abs/', 'http://arxiv.org/abs/', 'arxiv.org/abs/', 'arXiv:', 'arxiv:'):
+        value = value.removeprefix(prefix)
+    return value.strip('/') or None
+
+def is_versioned(arxiv_id):
+    base, _ = split_arxiv_id(arxiv_id)
+    return base != arxiv_id
+
+
+class Job:
+    def __init__(self, arxiv_id):
+        self.id = uuid.uuid4().hex[:12]
+        self.arxiv_id = arxiv_id
+        self.status = 'queued'
+        self.stage = None
+        self.paper = None
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        # Bumped on every change; event streams wait for it to move
+        self.version = 0
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'arxiv_id': self.arxiv_id, 'status': self.status, 'stage': self.stage,
+            'title': self.paper['title'] if self.paper else None,
+            'summary': self.result['summary'] if self.result else None,
+            'entry': self.result['entry'] if self.result else None,
+            'error': self.error, 'created': self.created, 'updated': self.updated,
+        }
+
+
+class SummaryService:
+    '''Job queue and warm pipeline state behind the HTTP endpoints; usable without HTTP too:
+
+        job, created = service.submit('2401.00001')
+        job, _ = service.wait(job['id'])
+    '''
+    def __init__(self, workers=2, engine=None, store=None, papers_dir=PAPERS_DIR, checkpoint_dir=CHECKPOINT_DIR / 'service',
+                 summary_dir=SUMMARY_DIR / 'service', arxiv_url=None, parser='stream', extract_mode='memory',
+                 memory_cache_size=MEMORY_CACHE_SIZE, job_ttl=JOB_TTL_SECONDS, max_jobs=MAX_JOBS):
+        self.workers = workers
+        self.engine = engine or AsyncSummaryEngine()
+        self.store = store or PaperStore(PAPER_INDEX)
+        self.papers_dir = Path(papers_dir)
+        self.checkpoints = Checkpoints(checkpoint_dir)
+        self.paper_kwargs = dict(parser=parser, extract_mode=extract_mode, summary_dir=summary_dir)
+        self.arxiv = arxiv.Client()
+        if arxiv_url:
+            self.arxiv.delay_seconds = 0
+            self.arxiv.query_url_format = f"{arxiv_url}/api/query?{{}}"
+        self.session = make_session(workers)
+        self.memory_cache_size = memory_cache_size
+        self.job_ttl = job_ttl
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self.active = {}
+        self.summaries = OrderedDict()
+        self.queue = queue.Queue()
+        self.changed = threading.Condition()
+        # arxiv.Client keeps its own rate-limit clock and isn't meant for concurrent callers
+        self._arxiv_lock = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        set_default_metrics(Metrics(max_records=METRICS_MAX_RECORDS))
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._worker, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def close(self):
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.engine.close()
+        self.session.close()
+
+    def submit(self, arxiv_id):
+        '''Queue a paper, or return the job that already covers it. Returns (job dict, created).'''
+        arxiv_id = normalize_arxiv_id(arxiv_id)
+        if arxiv_id is None:
+            raise ValueError("arxiv_id is required")
+        with self.changed:
+            self._prune()
+            job_id = self.active.get(arxiv_id)
+            if job_id is not None:
+                return self.jobs[job_id].to_dict(), False
+            job = Job(arxiv_id)
+            self.jobs[job.id] = job
+            cached = self.summaries.get(arxiv_id)
+            if cached is not None:
+                self.summaries.move_to_end(arxiv_id)
+                job.paper, job.result, job.status = cached['paper'], cached['result'], 'done'
+                return job.to_dict(), True
+            self.active[arxiv_id] = job.id
+        self.queue.put(job)
+        return job.to_dict(), True
+
+    def get(self, job_id):
+        with self.changed:
+            job = self.jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def summary(self, arxiv_id):
+        '''Finished summary of a paper from memory or the PaperStore, or None'''
+        arxiv_id = normalize_arxiv_id(arxiv_id)
+        with self.changed:
+            cached = self.summaries.get(arxiv_id)
+        if cached is None:
+            cached = self._stored_summary(arxiv_id)
+        if cached is None:
+            return None
+        return {'arxiv_id': cached['paper']['arxiv_id'], 'title': cached['paper']['title'], **cached['result']}
+
+    def wait(self, job_id, version=None, timeout=None):
+        '''Block until the job changes past `version`, or until it finishes when no version is given.
+        Returns (job dict, version), or (None, version) for an unknown job.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.changed:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None, version
+            while (version is None or job.version <= version) and job.status not in FINISHED:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self.changed.wait(remaining)
+            return job.to_dict(), job.version
+
+    def health(self):
+        with self.changed:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            'workers': len(self._threads), 'queued': statuses.count('queued'), 'running': statuses.count('running'),
+            'done': statuses.count('done'), 'failed': statuses.count('failed'), 'cached_summaries': len(self.summaries),
+        }
+
+    def _prune(self):
+        # Called with self.changed held; queued and running jobs are never dropped
+        cutoff = time.time() - self.job_ttl
+        excess = len(self.jobs) - self.max_jobs
+        for job in [job for job in self.jobs.values() if job.status in FINISHED]:
+            if job.updated < cutoff or excess > 0:
+                del self.jobs[job.id]
+                excess -= 1
+
+    def _update(self, job, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(job, name, value)
+            job.updated = time.time()
+            job.version += 1
+            if job.status in FINISHED:
+                self.active.pop(job.arxiv_id, None)
+            self.changed.notify_all()
+
+    def _remember(self, paper, result, *aliases):
+        with self.changed:
+            for key in {paper['arxiv_id'], *aliases}:
+                self.summaries[key] = {'paper': paper, 'result': result}
+                self.summaries.move_to_end(key)
+            while len(self.summaries) > self.memory_cache_size:
+                self.summaries.popitem(last=False)
+
+    def _stored_summary(self, arxiv_id):
+        '''Summary the weekly run (or an earlier job) saved for this exact version'''
+        if not is_versioned(arxiv_id):
+            return None
+        row = self.store.get(arxiv_id)
+        if not row or row['summary_status'] != 'done' or not row['summary_path'] or not row['metadata']:
+            return None
+        path = Path(row['summary_path'])
+        if not path.exists():
+            return None
+        paper = json.loads(row['metadata'])
+        summary = path.read_text(encoding='utf-8')
+        return {'paper': paper, 'result': {'entry': None, 'summary': summary, 'summary_path': str(path)}}
+
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            except Exception as e:
+                print(f"**ERROR: Job {job.id} ({job.arxiv_id}) failed: {e}")
+                self._update(job, status='failed', error=str(e))
+
+    def _finish(self, job, paper, result):
+        self._remember(paper, result, job.arxiv_id)
+        self._update(job, status='done', stage=None, paper=paper, result=result)
+
+    def _run(self, job):
+        self._update(job, status='running', stage='lookup')
+        stored = self._stored_summary(job.arxiv_id)
+        if stored is not None:
+            self._finish(job, stored['paper'], stored['result'])
+            return
+
+        with self._arxiv_lock:
+            results = list(self.arxiv.results(arxiv.Search(id_list=[job.arxiv_id])))
+        if not results:
+            self._update(job, status='failed', error=f"{job.arxiv_id} not found on arXiv")
+            return
+        result = results[0]
+        paper = paper_metadata(result)
+        # An unversioned request resolves to the latest version, which may already be summarized
+        stored = self._stored_summary(paper['arxiv_id'])
+        if stored is not None:
+            self._finish(job, stored['paper'], stored['result'])
+            return
+
+        self._update(job, stage='download', paper=paper)
+        fileout = f"{paper_key(paper['arxiv_id'])}.tar.gz"
+        downloaded = download_sources(
+            [(paper['arxiv_id'], source_url(result), fileout)], self.papers_dir, max_workers=1, session=self.session
+        )
+        if downloaded.get(paper['arxiv_id']) is None:
+            self._update(job, status='failed', error=f"could not download the sources of {paper['arxiv_id']}")
+            return
+        self.store.upsert(paper, downloaded[paper['arxiv_id']])
+
+        output = _process_paper_safely(
+            paper, fileout, self.papers_dir, engine=self.engine, store=self.store, checkpoints=self.checkpoints,
+            plan=StagePlan(resume=True), on_stage=lambda stage: self._update(job, stage=stage), **self.paper_kwargs
+        )
+        if output is None:
+            self._update(job, status='failed', error=f"{paper['arxiv_id']} could not be summarized, see the service log")
+            return
+        self._finish(job, paper, output)
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self, message=None):
+        self._send_json(404, {'error': message or f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/jobs':
+            self._not_found()
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            job, created = self.server.service.submit(request.get('arxiv_id'))
+        except (ValueError, AttributeError) as e:
+            self._send_json(400, {'error': str(e) or 'invalid request'})
+            return
+        self._send_json(202 if created else 200, job)
+
+    def do_GET(self):
+        service = self.server.service
+        parts = [part for part in self.path.split('?', 1)[0].split('/') if part]
+        if parts == ['health']:
+            self._send_json(200, service.health())
+        elif parts == ['metrics']:
+            self._send_json(200, get_default_metrics().report())
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            job = service.get(parts[1])
+            if job is None:
+                self._not_found(f"Unknown job {parts[1]}")
+            else:
+                self._send_json(200, job)
+        elif len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'events':
+            self._stream_events(parts[1])
+        elif len(parts) >= 2 and parts[0] == 'summaries':
+            arxiv_id = '/'.join(parts[1:])
+            summary = service.summary(arxiv_id)
+            if summary is None:
+                self._not_found(f"No summary for {arxiv_id}")
+            else:
+                self._send_json(200, summary)
+        else:
+            self._not_found()
+
+    def _stream_events(self, job_id):
+        '''Server-sent events: one "data:" line with the job per change, until it finishes'''
+        service = self.server.service
+        job, version = service.wait(job_id, timeout=0)
+        if job is None:
+            self._not_found(f"Unknown job {job_id}")
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            last_sent = -1
+            while True:
+                if version != last_sent:
+                    self.wfile.write(f"event: {job['status']}\ndata: {json.dumps(job, default=str)}\n\n".encode('utf-8'))
+                    last_sent = version
+                else:
+                    self.wfile.write(b": keepalive\n\n")
+                self.wfile.flush()
+                if job['status'] in FINISHED:
+                    return
+                job, version = service.wait(job_id, version, timeout=KEEPALIVE_SECONDS)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def serve(service, host='127.0.0.1', port=8765):
+    '''Start the service's workers and its HTTP server in a daemon thread. Returns (server, base_url).'''
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service.start()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve on-demand paper summaries over HTTP')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=2, help='Papers processed concurrently')
+    parser.add_argument('--config', help='Config file for models, limits and cache location, see config.py')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    apply_config(config)
+    service = SummaryService(
+        workers=args.workers, engine=AsyncSummaryEngine(**engine_options(config)),
+        parser=config['run']['parser'], extract_mode=config['run']['extract_mode']
+    )
+    server, base_url = serve(service, args.host, args.port)
+    print(f"MESSAGE -> Serving summaries on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("MESSAGE -> Shutting down")
+    finally:
+        server.shutdown()
+        service.close()
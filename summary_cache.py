@@ -0,0 +1,113 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+DEFAULT_CACHE_PATH = Path(__file__).resolve().parent / 'summary_cache' / 'cache.sqlite'
+
+
+def cache_key(model, messages, **params):
+    '''Content address for a completion: hash of the model, every message (prompt + text) and sampling params
+    '''
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SummaryCache:
+    '''On-disk SQLite cache of LLM outputs (section summaries, article summaries, section prompts).
+
+    Entries older than `max_age_days` are dropped, and once the stored text exceeds `max_bytes`
+    the least recently used entries are evicted first.
+    '''
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=256 * 1024 * 1024, max_age_days=365,
+                 evict_every=100):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 24 * 3600 if max_age_days else None
+        self.evict_every = evict_every
+        self._writes = 0
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, kind TEXT, value TEXT, size INTEGER, "
+                "created_at REAL, accessed_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed_at)")
+
+    def _connect(self):
+        # One connection per thread; WAL lets concurrent workers read while another writes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        now = time.time()
+        with conn:
+            if self.max_age and now - created_at > self.max_age:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key, kind, value):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, value, len(value.encode('utf-8')), now, now)
+            )
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        conn = self._connect()
+        with conn:
+            if self.max_age:
+                conn.execute("DELETE FROM entries WHERE created_at < ?", (time.time() - self.max_age,))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            excess = total - self.max_bytes
+            if excess <= 0:
+                return
+            stale = []
+            for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed_at"):
+                stale.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM entries WHERE key = ?", stale)
+
+    def stats(self):
+        rows = self._connect().execute(
+            "SELECT kind, COUNT(*), COALESCE(SUM(size), 0) FROM entries GROUP BY kind"
+        ).fetchall()
+        return {kind: {"entries": count, "bytes": size} for kind, count, size in rows}
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = SummaryCache()
+        return _default_cache
+
+def set_default_cache(cache):
+    global _default_cache
+    with _default_cache_lock:
+        _default_cache = cache
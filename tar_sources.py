@@ -0,0 +1,83 @@
+'''Read a paper's LaTeX sources straight out of its .tar.gz without extracting to disk.
+
+Only text members (.tex/.bbl/.sty/.cls) are kept, in memory; figures and PDFs in the bundle are
+skipped as the archive streams past.
+'''
+import io
+import gzip
+import zlib
+import tarfile
+import posixpath
+from pathlib import PurePosixPath
+from include_graph import MemorySource, build_include_graph
+
+SOURCE_SUFFIXES = ('.tex', '.bbl', '.sty', '.cls')
+MAX_MEMBER_BYTES = 16 * 1024 * 1024
+
+
+def _decode(data):
+    return data.decode('utf-8', errors='replace')
+
+def read_tar_sources(tar_file, suffixes=SOURCE_SUFFIXES, max_member_bytes=MAX_MEMBER_BYTES):
+    '''Map of normalized member path -> text for the source members of a tarball. arXiv serves
+    single-file submissions as a bare gzipped .tex, which comes back as {"main.tex": text}.
+    Returns None if the file is neither, is corrupt or empty, or is a single file over the size cap.
+    '''
+    try:
+        # Stream mode reads the archive once, front to back, without seeking
+        tar = tarfile.open(tar_file, 'r|*')
+    except tarfile.ReadError:
+        # Not a tar archive; maybe a bare gzipped .tex
+        return _read_gzip_source(tar_file, max_member_bytes)
+    except (OSError, EOFError, zlib.error):
+        print(f"Skipping {tar_file} as it is not a valid gzip file.")
+        return None
+
+    sources = {}
+    try:
+        with tar:
+            for member in tar:
+                if not member.isfile() or not member.name.lower().endswith(suffixes):
+                    continue
+                if member.size > max_member_bytes:
+                    print(f"**WARNING: Skipping oversized member {member.name} ({member.size} bytes)")
+                    continue
+                sources[posixpath.normpath(member.name)] = _decode(tar.extractfile(member).read())
+    except (tarfile.TarError, OSError, EOFError, zlib.error) as e:
+        print(f"Skipping {tar_file} as it is a corrupt archive: {e}")
+        return None
+    return sources
+
+def _read_gzip_source(tar_file, max_member_bytes):
+    try:
+        with gzip.open(tar_file, 'rb') as f:
+            # One byte over the cap tells a file at the cap from a larger one
+            data = f.read(max_member_bytes + 1)
+    except (OSError, EOFError, zlib.error):
+        data = b''
+    if not data:
+        print(f"Skipping {tar_file} as it is not a valid gzip file.")
+        return None
+    if len(data) > max_member_bytes:
+        print(f"**WARNING: Skipping {tar_file}, its source is over {max_member_bytes} bytes")
+        return None
+    return {'main.tex': _decode(data)}
+
+def find_main_tex_member(sources, graph=None):
+    '''Name of the member most likely to be the main file, picked by include_graph so standalone
+    figure files and \\subfile'd chapters lose. `graph` is an already resolved include graph.
+    '''
+    graph = graph or build_include_graph(MemorySource(sources))
+    if graph is None or not graph['has_document']:
+        return None
+    print(f"MESSAGE -> Found a likely main .tex file: {graph['root']}")
+    return PurePosixPath(graph['root'])
+
+def make_line_reader(sources):
+    '''read_lines callable for tex_extract.extract_sections backed by the in-memory sources'''
+    def read_lines(path):
+        text = sources.get(posixpath.normpath(str(path)))
+        if text is None:
+            return None
+        return io.StringIO(text)
+    return read_lines
@@ -0,0 +1,72 @@
+'''Shared fixtures. The tests only talk to the local_servers stand-ins, never to OpenAI or arXiv.'''
+import io
+import os
+import sys
+import tarfile
+from pathlib import Path
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+# utils builds its OpenAI client at import time
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import utils
+from summary_cache import SummaryCache, set_default_cache
+from section_prompts import SectionPromptRegistry, set_default_registry
+from metrics import Metrics, set_default_metrics
+from local_servers import start_fake_openai_server, start_fake_arxiv_server
+
+
+@pytest.fixture
+def isolated(tmp_path):
+    '''Fresh summary cache, prompt registry and metrics under tmp_path; returns the metrics'''
+    client = utils.client
+    set_default_cache(SummaryCache(tmp_path / 'cache.sqlite'))
+    set_default_registry(SectionPromptRegistry(tmp_path / 'section_prompts.json'))
+    metrics = Metrics()
+    set_default_metrics(metrics)
+    yield metrics
+    # The defaults are created again lazily; the real ones would live in the repo's summary_cache/
+    set_default_cache(None)
+    set_default_registry(None)
+    set_default_metrics(None)
+    utils.set_client(client)
+
+
+def _shutdown(server):
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def openai_server():
+    '''Factory for fake OpenAI servers: start(**options) -> (server, base_url)'''
+    servers = []
+    def start(**options):
+        server, base_url = start_fake_openai_server(**options)
+        servers.append(server)
+        return server, base_url
+    yield start
+    for server in servers:
+        _shutdown(server)
+
+@pytest.fixture
+def arxiv_server():
+    '''Factory for fake arXiv servers: start(sources, **options) -> (server, base_url)'''
+    servers = []
+    def start(sources, **options):
+        server, base_url = start_fake_arxiv_server(sources, **options)
+        servers.append(server)
+        return server, base_url
+    yield start
+    for server in servers:
+        _shutdown(server)
+
+@pytest.fixture(scope='session')
+def paper_tarball():
+    '''test/test2 as the gzipped e-print tarball arXiv would serve'''
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for path in sorted((ROOT / 'test' / 'test2').rglob('*.tex')):
+            tar.add(path, arcname=str(path.relative_to(ROOT / 'test' / 'test2')))
+    return buffer.getvalue()
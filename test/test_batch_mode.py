@@ -0,0 +1,68 @@
+import pytest
+from openai import OpenAI
+import utils
+from batch_mode import submit_batch, run_in_batches
+from utils import section_summary_generator, article_summary_generator
+from paper_summary_generator import article_input
+
+PAPERS = [
+    {'Introduction': 'We study a problem. ' * 20, 'Methods': 'We propose a method. ' * 20},
+    # Not a known section kind: its prompt is generated first, in a round of its own
+    {'Frobnication': 'We frobnicate. ' * 20},
+]
+
+
+@pytest.fixture
+def live(openai_server, isolated):
+    '''Start a fake OpenAI server and make it the synchronous client. Returns start(**options) -> (server, client)'''
+    clients = []
+    def start(**options):
+        server, base_url = openai_server(**options)
+        client = OpenAI(base_url=base_url, api_key='test', max_retries=0)
+        clients.append(client)
+        utils.set_client(client)
+        return server, client
+    yield start
+    for client in clients:
+        client.close()
+
+
+def request(text):
+    return {'kind': 'section', 'model': 'gpt-4o-mini', 'messages': [{'role': 'user', 'content': text}], 'params': {}}
+
+def test_submit_batch_polls_until_completed(live):
+    server, client = live(batch_delay=0.2)
+    results = submit_batch(client, {'a': request('first'), 'b': request('second')}, poll_interval=0.05)
+    assert set(results) == {'a', 'b'}
+    assert results['a']['choices'][0]['message']['content']
+    assert server.batch_count == 1
+    assert server.request_count == 0
+
+def test_submit_batch_gives_up_after_timeout(live):
+    _, client = live(batch_delay=10)
+    assert submit_batch(client, {'a': request('first')}, poll_interval=0.05, timeout=0.1) == {}
+
+def test_replay_after_batches_makes_no_live_requests(live):
+    server, client = live()
+    # Round 1: the Frobnication prompt and the known sections; round 2: the Frobnication section
+    assert run_in_batches(section_summary_generator, PAPERS, client, poll_interval=0.01) == 2
+    assert server.batch_count == 2
+
+    summaries = [section_summary_generator(sections) for sections in PAPERS]
+    assert [list(s) for s in summaries] == [['Introduction', 'Methods'], ['Frobnication']]
+
+    summarize_article = lambda summaries: article_summary_generator(article_input(summaries))
+    assert run_in_batches(summarize_article, summaries, client, poll_interval=0.01) == 1
+    assert all(summarize_article(s) for s in summaries)
+    assert server.request_count == 0
+    assert run_in_batches(section_summary_generator, PAPERS, client, poll_interval=0.01) == 0
+
+def test_failed_batch_requests_are_sent_live(live):
+    server, client = live(batch_failures=1)
+    # The first request of every batch fails, until a batch comes back with nothing usable
+    run_in_batches(section_summary_generator, PAPERS[:1], client, poll_interval=0.01)
+    assert server.batch_count == 2
+    assert server.request_count == 0
+
+    assert list(section_summary_generator(PAPERS[0])) == ['Introduction', 'Methods']
+    assert server.request_count == 1
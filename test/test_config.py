@@ -0,0 +1,49 @@
+import pytest
+from config import DEFAULT_CONFIG, load_config, engine_options
+
+
+def write(tmp_path, text):
+    path = tmp_path / 'newsletter.toml'
+    path.write_text(text, encoding='utf-8')
+    return path
+
+
+def test_token_budget_and_chunk_size_reach_the_engine(tmp_path):
+    config = load_config(write(tmp_path, "[summaries]\ntoken_budget = 1900\nchunk_tokens = 500\n"))
+    options = engine_options(config)
+    assert (options['token_budget'], options['chunk_tokens']) == (1900, 500)
+    assert options['max_in_flight'] == DEFAULT_CONFIG['concurrency']['max_in_flight']
+
+@pytest.mark.parametrize('value', ['0', '-5', '"many"', 'true'])
+def test_token_budget_must_be_a_positive_integer(tmp_path, value):
+    with pytest.raises(ValueError, match='summaries.token_budget'):
+        load_config(write(tmp_path, f"[summaries]\ntoken_budget = {value}\n"))
+
+def test_topics_rank_against_their_own_query_by_default(tmp_path):
+    config = load_config(write(tmp_path, '''
+[[topics]]
+name = "language-models"
+query = "large language models"
+
+[[topics]]
+name = "vision"
+categories = ["cs.CV"]
+
+[[topics]]
+name = "rl"
+query = "reinforcement learning"
+profiles = { rl = "policy reward agent environment" }
+'''))
+    profiles = {topic['name']: topic['profiles'] for topic in config['topics']}
+    assert profiles == {
+        'language-models': {'language-models': 'large language models'},
+        'vision': {},
+        'rl': {'rl': 'policy reward agent environment'},
+    }
+    # The default newsletter keeps the generic machine learning profiles
+    assert load_config()['topics'][0]['profiles'] is None
+
+@pytest.mark.parametrize('profiles', ['"llm"', '["llm"]', '{ llm = 3 }', '{ llm = "" }'])
+def test_profiles_must_be_a_table_of_keywords(tmp_path, profiles):
+    with pytest.raises(ValueError, match='profiles'):
+        load_config(write(tmp_path, f'[[topics]]\nname = "llm"\nquery = "llm"\nprofiles = {profiles}\n'))
@@ -0,0 +1,82 @@
+import os
+import time
+import pytest
+from downloader import MANIFEST_NAME, DownloadManifest, download_sources, file_sha256
+
+SOURCES = {f"2401.0000{i}v1": f"fake tarball {i}".encode() * 100 for i in range(1, 5)}
+
+
+def jobs(base_url, ids=SOURCES):
+    return [(arxiv_id, f"{base_url}/src/{arxiv_id}", f"{arxiv_id}.tar.gz") for arxiv_id in ids]
+
+def download(base_url, dest, ids=SOURCES, **options):
+    options.setdefault('base_delay', 0.01)
+    return download_sources(jobs(base_url, ids), dest, max_workers=4, **options)
+
+
+def test_downloads_concurrently_over_shared_connections(arxiv_server, tmp_path, isolated):
+    server, base_url = arxiv_server(SOURCES, latency=0.1)
+    start = time.monotonic()
+    downloaded = download(base_url, tmp_path)
+    assert time.monotonic() - start < 0.1 * len(SOURCES)
+    for arxiv_id, data in SOURCES.items():
+        assert downloaded[arxiv_id].read_bytes() == data
+    assert server.request_count == len(SOURCES)
+    assert server.connection_count <= 4
+    manifest = DownloadManifest(tmp_path)
+    assert set(manifest.entries) == set(SOURCES)
+    assert not list(tmp_path.glob('.*.part'))
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_rate_limits_and_server_errors_are_retried(arxiv_server, tmp_path, isolated, status):
+    server, base_url = arxiv_server(SOURCES, fail_first=2, fail_status=status)
+    downloaded = download(base_url, tmp_path, ids=['2401.00001v1'])
+    assert downloaded['2401.00001v1'].read_bytes() == SOURCES['2401.00001v1']
+    assert server.request_count == 3
+    assert isolated.report()['counters']['download_retry'] == 2
+
+def test_gives_up_after_retries(arxiv_server, tmp_path, isolated):
+    server, base_url = arxiv_server(SOURCES, fail_first=10, fail_status=503)
+    downloaded = download(base_url, tmp_path, ids=['2401.00001v1'], retries=2)
+    assert downloaded == {'2401.00001v1': None}
+    assert server.request_count == 3
+    assert not (tmp_path / '2401.00001v1.tar.gz').exists()
+
+def test_missing_papers_are_not_retried(arxiv_server, tmp_path, isolated):
+    server, base_url = arxiv_server(SOURCES)
+    downloaded = download(base_url, tmp_path, ids=['2401.00009v1', '2401.00001v1'])
+    assert downloaded['2401.00009v1'] is None
+    assert downloaded['2401.00001v1'] is not None
+    assert server.request_count == 2
+
+def test_complete_downloads_are_skipped(arxiv_server, tmp_path, isolated):
+    server, base_url = arxiv_server(SOURCES)
+    first = download(base_url, tmp_path)
+    assert download(base_url, tmp_path) == first
+    assert server.request_count == len(SOURCES)
+
+def test_corrupt_or_unrecorded_files_are_downloaded_again(arxiv_server, tmp_path, isolated):
+    server, base_url = arxiv_server(SOURCES)
+    download(base_url, tmp_path)
+    # Same size, different bytes: only the checksum catches it
+    corrupt = tmp_path / '2401.00001v1.tar.gz'
+    corrupt.write_bytes(b'x' * corrupt.stat().st_size)
+    # On disk, but not in the manifest (e.g. copied in by hand)
+    (tmp_path / 'extra.tar.gz').write_bytes(b'partial')
+    downloaded = download(base_url, tmp_path, ids=['2401.00001v1', '2401.00002v1'])
+    assert server.request_count == len(SOURCES) + 1
+    assert file_sha256(downloaded['2401.00001v1']) == DownloadManifest(tmp_path).entries['2401.00001v1']['sha256']
+
+    extra = [('2401.00003v1', f"{base_url}/src/2401.00003v1", 'extra.tar.gz')]
+    assert download_sources(extra, tmp_path)['2401.00003v1'].read_bytes() == SOURCES['2401.00003v1']
+
+def test_stale_part_files_are_removed(arxiv_server, tmp_path, isolated):
+    _, base_url = arxiv_server(SOURCES)
+    stale, recent = tmp_path / '.old.tar.gz.1.2.part', tmp_path / '.new.tar.gz.3.4.part'
+    for part in (stale, recent):
+        part.write_bytes(b'partial')
+    os.utime(stale, (time.time() - 7200, time.time() - 7200))
+    download(base_url, tmp_path, ids=['2401.00001v1'])
+    assert not stale.exists()
+    assert recent.exists()
+    assert (tmp_path / MANIFEST_NAME).exists()
@@ -0,0 +1,92 @@
+import json
+import include_graph
+from include_graph import MemorySource, build_include_graph, cached_include_graph
+from downloader import DownloadManifest, file_sha256
+
+DOCUMENT = '\\documentclass{article}\n\\begin{document}\n%s\n\\end{document}\n'
+
+
+def graph_of(sources):
+    return build_include_graph(MemorySource(sources))
+
+
+def test_root_with_the_include_tree_wins_over_drafts_and_figures():
+    graph = graph_of({
+        'old_draft.tex': DOCUMENT % 'Nothing here.',
+        'paper.tex': DOCUMENT % '\\input{sections/intro}\n\\include{sections/method}\n% \\input{sections/unused}',
+        'sections/intro.tex': 'Intro.',
+        'sections/method.tex': '\\input{sections/details}',
+        'sections/details.tex': 'Details.',
+        'sections/unused.tex': 'Commented out.',
+        'figures/plot.tex': '\\documentclass{standalone}\n\\begin{document}x\\end{document}',
+    })
+    assert graph['root'] == 'paper.tex'
+    assert graph['order'] == ['paper.tex', 'sections/intro.tex', 'sections/method.tex', 'sections/details.tex']
+    assert graph['includes']['sections/method.tex'] == ['sections/details.tex']
+    assert graph['has_document']
+    assert [c['name'] for c in graph['candidates']] == ['paper.tex', 'old_draft.tex', 'figures/plot.tex']
+
+def test_subfiles_are_not_the_root():
+    graph = graph_of({
+        'chapters/one.tex': '\\documentclass[../thesis.tex]{subfiles}\n\\begin{document}\nOne.\n\\end{document}',
+        'thesis.tex': DOCUMENT % '\\subfile{chapters/one}',
+    })
+    assert graph['root'] == 'thesis.tex'
+    assert graph['order'] == ['thesis.tex', 'chapters/one.tex']
+
+def test_conventional_name_then_path_break_ties():
+    assert graph_of({'b.tex': DOCUMENT % '', 'main.tex': DOCUMENT % ''})['root'] == 'main.tex'
+    assert graph_of({'b.tex': DOCUMENT % '', 'a.tex': DOCUMENT % ''})['root'] == 'a.tex'
+
+def test_import_paths_and_missing_includes():
+    graph = graph_of({
+        'main.tex': DOCUMENT % '\\import{parts/}{a}\n\\input{nowhere}',
+        'parts/a.tex': '\\subimport{sub/}{b}',
+        'parts/sub/b.tex': 'B.',
+    })
+    assert graph['order'] == ['main.tex', 'parts/a.tex', 'parts/sub/b.tex']
+    assert graph['missing'] == ['nowhere']
+
+def test_no_tex_files():
+    assert graph_of({'README.md': 'hello'}) is None
+
+
+class CountingSource(MemorySource):
+    def __init__(self, sources):
+        super().__init__(sources)
+        self.reads = 0
+
+    def read(self, name):
+        self.reads += 1
+        return super().read(name)
+
+
+def test_cached_graph_is_keyed_by_the_tarball_hash(tmp_path, monkeypatch):
+    tar_file = tmp_path / '2401.00001v1.tar.gz'
+    tar_file.write_bytes(b'fake tarball')
+    cache_dir = tmp_path / 'include_graphs'
+    source = CountingSource({'main.tex': DOCUMENT % 'Hi.'})
+    graph = cached_include_graph(tar_file, source, cache_dir)
+    assert (cache_dir / f"{file_sha256(tar_file)}.json").exists()
+
+    # The second lookup reads neither the sources nor, with a manifest entry, the tarball
+    DownloadManifest(tmp_path).record('2401.00001v1', tar_file, file_sha256(tar_file), 'http://arxiv.org')
+    monkeypatch.setattr(include_graph, 'file_sha256', lambda path: 1 / 0)
+    reads = source.reads
+    assert cached_include_graph(tar_file, source, cache_dir) == graph
+    assert source.reads == reads
+
+def test_changed_tarball_or_corrupt_cache_is_rebuilt(tmp_path):
+    tar_file = tmp_path / 'paper.tar.gz'
+    cache_dir = tmp_path / 'include_graphs'
+    tar_file.write_bytes(b'version 1')
+    cached_include_graph(tar_file, MemorySource({'main.tex': DOCUMENT % ''}), cache_dir)
+    tar_file.write_bytes(b'version 2')
+    graph = cached_include_graph(tar_file, MemorySource({'paper.tex': DOCUMENT % ''}), cache_dir)
+    assert graph['root'] == 'paper.tex'
+    assert len(list(cache_dir.glob('*.json'))) == 2
+
+    cache_path = cache_dir / f"{file_sha256(tar_file)}.json"
+    cache_path.write_text('{not json')
+    assert cached_include_graph(tar_file, MemorySource({'paper.tex': DOCUMENT % ''}), cache_dir)['root'] == 'paper.tex'
+    assert json.loads(cache_path.read_text())['root'] == 'paper.tex'
@@ -0,0 +1,121 @@
+import time
+import asyncio
+import openai
+import pytest
+from openai import AsyncOpenAI
+from llm_engine import AsyncSummaryEngine, TokenBucket
+from local_servers import FakeAsyncOpenAI
+from summary_cache import SummaryCache
+from section_prompts import SectionPromptRegistry
+
+MESSAGES = [{'role': 'user', 'content': 'Summarize this.'}]
+
+
+@pytest.fixture
+def make_engine(tmp_path, isolated):
+    '''Engines against a fake OpenAI base URL (or a given client), closed after the test'''
+    engines = []
+    def make(base_url=None, client=None, **options):
+        client = client or AsyncOpenAI(base_url=base_url, api_key='test', max_retries=0)
+        options.setdefault('cache', SummaryCache(tmp_path / 'cache.sqlite'))
+        options.setdefault('prompt_registry', SectionPromptRegistry(tmp_path / 'section_prompts.json'))
+        engine = AsyncSummaryEngine(client=client, base_delay=0.01, **options)
+        engines.append(engine)
+        return engine
+    yield make
+    for engine in engines:
+        engine.close()
+
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_retries_rate_limits_and_server_errors(openai_server, make_engine, isolated, status):
+    server, base_url = openai_server(fail_first=2, fail_status=status)
+    engine = make_engine(base_url)
+    response = engine.run(engine.complete(MESSAGES))
+    assert response.choices[0].message.content
+    assert server.request_count == 3
+    assert isolated.report()['llm']['retries'] == 2
+
+def test_gives_up_after_max_retries(openai_server, make_engine):
+    server, base_url = openai_server(fail_first=10)
+    engine = make_engine(base_url, max_retries=2)
+    with pytest.raises(openai.RateLimitError):
+        engine.run(engine.complete(MESSAGES))
+    assert server.request_count == 3
+
+def test_client_errors_are_not_retried(openai_server, make_engine):
+    server, base_url = openai_server(fail_first=1, fail_status=400)
+    engine = make_engine(base_url)
+    with pytest.raises(openai.BadRequestError):
+        engine.run(engine.complete(MESSAGES))
+    assert server.request_count == 1
+
+def test_in_flight_limit_holds_across_calls(openai_server, make_engine):
+    server, base_url = openai_server(latency=0.1)
+    engine = make_engine(base_url, max_in_flight=3)
+
+    async def burst():
+        messages = [[{'role': 'user', 'content': f"Request {i}"}] for i in range(12)]
+        return await asyncio.gather(*(engine.complete(m) for m in messages))
+
+    assert len(engine.run(burst())) == 12
+    assert server.request_count == 12
+    assert server.max_in_flight == 3
+
+def test_request_bucket_paces_requests(openai_server, make_engine):
+    server, base_url = openai_server()
+    engine = make_engine(base_url)
+    # 10 requests/s with room for a single burst request
+    engine.request_bucket = TokenBucket(600, capacity=1)
+
+    async def burst():
+        return await asyncio.gather(*(engine.complete([{'role': 'user', 'content': str(i)}]) for i in range(6)))
+
+    start = time.monotonic()
+    engine.run(burst())
+    assert time.monotonic() - start >= 0.45
+    assert server.request_count == 6
+
+def test_token_bucket_waits_for_refill():
+    async def drain():
+        bucket = TokenBucket(6000, capacity=100)
+        await bucket.acquire(100)
+        start = time.monotonic()
+        # 50 tokens at 100 tokens/s
+        await bucket.acquire(50)
+        return time.monotonic() - start
+    assert asyncio.run(drain()) >= 0.45
+
+def test_token_bucket_caps_oversized_requests():
+    async def oversized():
+        bucket = TokenBucket(60, capacity=10)
+        await asyncio.wait_for(bucket.acquire(1000), timeout=1)
+        return bucket.tokens
+    assert asyncio.run(oversized()) == pytest.approx(0, abs=1)
+
+def test_summarize_sections_is_cached(openai_server, make_engine):
+    server, base_url = openai_server()
+    sections = {'Introduction': 'We study things. ' * 20, 'Methods': 'We did things. ' * 20}
+    engine = make_engine(base_url)
+    summaries = engine.run(engine.summarize_sections(sections))
+    assert list(summaries) == ['Introduction', 'Methods']
+    assert server.request_count == 2
+
+    engine = make_engine(base_url)
+    assert engine.run(engine.summarize_sections(sections)) == summaries
+    assert server.request_count == 2
+
+def test_names_that_normalize_alike_share_one_prompt(make_engine):
+    # "sec1" and "sec10" are both stored under "sec" in the prompt registry
+    sections = {'sec1': 'First part. ' * 20, 'sec10': 'Second part. ' * 20}
+    client = FakeAsyncOpenAI(latency=0.05)
+    engine = make_engine(client=client)
+    assert len(engine.run(engine.summarize_sections(sections))) == 2
+    # One prompt and two section summaries
+    assert client.request_count == 3
+    assert engine._prompts == {}
+
+    rerun_client = FakeAsyncOpenAI()
+    engine = make_engine(client=rerun_client)
+    assert len(engine.run(engine.summarize_sections(sections))) == 2
+    assert rerun_client.request_count == 0
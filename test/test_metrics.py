@@ -0,0 +1,22 @@
+import pytest
+from metrics import Metrics, percentile
+
+
+@pytest.mark.parametrize('values, q, expected', [
+    ([1, 2], 50, 1),
+    (list(range(1, 11)), 90, 9),
+    (list(range(1, 11)), 99, 10),
+    (list(range(1, 101)), 7, 7),
+    (list(range(1, 101)), 99, 99),
+    ([5], 50, 5),
+    ([3, 1, 2], 0, 1),
+    ([3, 1, 2], 100, 3),
+])
+def test_nearest_rank_percentile(values, q, expected):
+    assert percentile(values, q) == expected
+
+def test_report_timing_percentiles():
+    metrics = Metrics()
+    metrics.spans.extend({'name': 'parse', 'seconds': float(s), 'ok': True} for s in range(1, 11))
+    stats = metrics.report()['stages']['parse']
+    assert (stats['count'], stats['p50_s'], stats['p90_s'], stats['p99_s'], stats['max_s']) == (10, 5.0, 9.0, 10.0, 10.0)
@@ -0,0 +1,35 @@
+from paper_filter import select_papers, published_papers
+from paper_store import PaperStore
+
+DIFFUSION = {'title': 'Diffusion models for video generation',
+             'summary': 'We train diffusion models for video generation with score-based sampling.'}
+LLM = {'title': 'Scaling large language models',
+       'summary': 'Large language models pretraining, instruction tuning and reasoning with transformers.'}
+# The same abstract as LLM with a few words changed, e.g. a resubmission under a new ID
+LLM_AGAIN = {**LLM, 'summary': LLM['summary'] + ' At scale.'}
+SOIL = {'title': 'Soil moisture in vineyards', 'summary': 'Field measurements of soil moisture across vineyards in spring.'}
+PAPERS = [DIFFUSION, LLM, LLM_AGAIN, SOIL]
+
+
+def test_near_duplicates_keep_one_paper():
+    selected = select_papers(PAPERS)
+    assert len(selected) == 3
+    assert len({1, 2} & set(selected)) == 1
+
+def test_ranked_by_relevance_and_cut_to_top_k():
+    assert select_papers(PAPERS, profiles={'soil': 'soil moisture vineyards'})[0] == 3
+    # The off-topic paper ranks last against the machine learning profiles
+    assert select_papers(PAPERS)[-1] == 3
+    assert len(select_papers(PAPERS, top_k=2)) == 2
+    # No profiles: arXiv order
+    assert select_papers(PAPERS, profiles={}) == [0, 1, 3]
+
+def test_papers_of_previous_issues_are_dropped(tmp_path):
+    store = PaperStore(tmp_path / 'index.sqlite')
+    store.upsert({**DIFFUSION, 'arxiv_id': '2401.00001v1'})
+    store.upsert({**SOIL, 'arxiv_id': '2401.00002v1'})
+    store.set_published(['2401.00001v1'])
+    previous = published_papers(store)
+    assert [p['title'] for p in previous] == [DIFFUSION['title']]
+    assert 0 not in select_papers(PAPERS, previous=previous)
+    assert 3 in select_papers(PAPERS, previous=previous)
@@ -0,0 +1,92 @@
+import shutil
+import pytest
+import utils
+import paper_summary_generator
+from paper_summary_generator import PARTIAL_SUMMARIES, process_paper
+from pipeline import Checkpoints, StagePlan
+from llm_engine import AsyncSummaryEngine
+from local_servers import FakeOpenAI, FakeAsyncOpenAI, FakeRateLimitError
+
+PAPER = {'title': 'Sample Paper 2', 'arxiv_url': 'http://arxiv.org/'}
+# Text that only appears in one section of test/test2
+METHODS = 'Data Preprocessing'
+INTRODUCTION = 'information age'
+# Leaves the Introduction of test/test2, but not its Methods section
+SMALL_BUDGET = 600
+
+
+class FailingSections(FakeOpenAI):
+    '''FakeOpenAI whose section calls fail for the sections whose text contains one of `failing`'''
+    def __init__(self, failing):
+        super().__init__()
+        self.failing = set(failing)
+
+    def _create(self, **request):
+        if any(text in request['messages'][-1]['content'] for text in self.failing):
+            raise FakeRateLimitError("Fake rate limit")
+        return super()._create(**request)
+
+
+@pytest.fixture
+def run(tmp_path, isolated):
+    '''process_paper over a copy of test/test2 with checkpoints; run(failing, resume, **options) -> (result, client)'''
+    shutil.copytree(paper_summary_generator.TEST_DIR / 'test2', tmp_path / 'papers' / 'test2')
+    checkpoints = Checkpoints(tmp_path / 'checkpoints')
+    def run_paper(failing=(), resume=False, **options):
+        client = FailingSections(failing)
+        utils.set_client(client)
+        result = process_paper(PAPER, 'test2', tmp_path / 'papers', checkpoints=checkpoints,
+                               plan=StagePlan(resume=resume), summary_dir=tmp_path / 'summaries', **options)
+        return result, client
+    run_paper.checkpoints = checkpoints
+    return run_paper
+
+
+def test_paper_is_published_without_a_failed_section(run):
+    result, _ = run(failing=[METHODS])
+    assert result is not None
+    partial = run.checkpoints.load(PARTIAL_SUMMARIES, 'test2')
+    assert partial['missing'] == ['Methods']
+    assert list(run.checkpoints.load('section_summarize', 'test2')['summaries']) == ['Introduction']
+
+def test_resume_sends_only_the_missing_sections(run):
+    run(failing=[METHODS])
+    result, client = run(resume=True)
+    assert result is not None
+    # The Methods section, then the article with both sections
+    assert client.request_count == 2
+    assert list(run.checkpoints.load('section_summarize', 'test2')['summaries']) == ['Introduction', 'Methods']
+    assert run.checkpoints.load(PARTIAL_SUMMARIES, 'test2') is None
+
+def test_paper_without_any_section_summary_is_dropped(run):
+    result, _ = run(failing=[METHODS, INTRODUCTION])
+    assert result is None
+    assert run.checkpoints.load('section_summarize', 'test2') is None
+
+def test_sections_cut_by_the_token_budget_are_not_missing(run):
+    result, _ = run(token_budget=SMALL_BUDGET)
+    assert result is not None
+    assert list(run.checkpoints.load('section_summarize', 'test2')['summaries']) == ['Introduction']
+    assert run.checkpoints.load(PARTIAL_SUMMARIES, 'test2') is None
+
+def test_engine_budget_is_used_for_missing_sections(run):
+    engine = AsyncSummaryEngine(client=FakeAsyncOpenAI(), token_budget=SMALL_BUDGET)
+    try:
+        result, _ = run(engine=engine)
+    finally:
+        engine.close()
+    assert result is not None
+    assert run.checkpoints.load(PARTIAL_SUMMARIES, 'test2') is None
+
+def test_long_sections_are_summarized_in_chunks_of_chunk_tokens(run):
+    _, client = run()
+    _, chunked_client = run(resume=False, chunk_tokens=200)
+    # The Introduction and Methods each go out as several chunks plus a reduce call
+    assert chunked_client.request_count > client.request_count
+
+def test_corrupt_tarball_is_skipped(tmp_path, isolated):
+    papers = tmp_path / 'papers'
+    papers.mkdir()
+    (papers / '2401.00001v1.tar.gz').write_bytes(b'not an archive at all')
+    paper = {**PAPER, 'arxiv_id': '2401.00001v1'}
+    assert process_paper(paper, '2401.00001v1.tar.gz', papers, summary_dir=tmp_path / 'summaries') is None
@@ -0,0 +1,33 @@
+from postprocess import convert_markdown_section, build_site
+
+
+def test_math_is_passed_through_untouched():
+    assert convert_markdown_section('Loss $a*b*c$ on *x*') == '<p>Loss \\(a*b*c\\) on <em>x</em></p>'
+    assert convert_markdown_section('Math $$x_1 **y** < z$$ done') == '<p>Math \\[x_1 **y** &lt; z\\] done</p>'
+    assert convert_markdown_section('$$a$$ $b$') == '<p>\\[a\\] \\(b\\)</p>'
+
+def test_escaped_and_unpaired_dollars_are_not_math():
+    assert convert_markdown_section('Costs \\$5 and $6 more') == '<p>Costs \\$5 and $6 more</p>'
+
+def test_bold_around_math_and_escaping():
+    assert convert_markdown_section('x < y & **a $b$ c**') == '<p>x &lt; y &amp; <strong>a \\(b\\) c</strong></p>'
+    assert convert_markdown_section('**one** and **two**') == '<p><strong>one</strong> and <strong>two</strong></p>'
+
+def test_headers_paragraphs_and_links():
+    rendered = convert_markdown_section('### Head\n\nSee [code](https://example.com/a) and [paper](https://arxiv.org/abs/1)')
+    assert rendered == (
+        '<p><strong>Head</strong></p><p>See <a href="https://example.com/a">code</a> and '
+        '[paper](https://arxiv.org/abs/1)</p>'
+    )
+
+def test_unchanged_issues_are_not_rendered_again(tmp_path):
+    (tmp_path / '2024').mkdir()
+    issue = tmp_path / '2024' / 'n_2024-05-03.md'
+    issue.write_text('## A paper\n\n### Objective\n\nStudy $x$.\n\narxiv: https://arxiv.org/abs/1\n\n---\n\n')
+    first = build_site(tmp_path, max_workers=1)
+    page = tmp_path / 'html' / 'final_newsletter_2024-05-03.html'
+    assert page in first and '\\(x\\)' in page.read_text()
+    assert page not in build_site(tmp_path, max_workers=1)
+
+    issue.write_text(issue.read_text().replace('Study', 'We study'))
+    assert page in build_site(tmp_path, max_workers=1)
@@ -0,0 +1,33 @@
+import threading
+from section_prompts import SECTION_PROMPTS, SectionPromptRegistry
+
+
+def test_known_sections_need_no_generated_prompt(tmp_path):
+    registry = SectionPromptRegistry(tmp_path / 'section_prompts.json')
+    assert registry.lookup('02_Related-Work') == SECTION_PROMPTS['related_work']
+    assert registry.lookup('Experimantal Setup') == SECTION_PROMPTS['experiments']
+    assert registry.lookup('Frobnication') is None
+
+def test_writers_sharing_a_file_keep_each_others_prompts(tmp_path):
+    path = tmp_path / 'section_prompts.json'
+    a, b = SectionPromptRegistry(path), SectionPromptRegistry(path)
+    a.add('Frobnication', 'frobnicate')
+    b.add('Quuxing', 'quux')
+    saved = SectionPromptRegistry(path)
+    assert (saved.lookup('Frobnication'), saved.lookup('Quuxing')) == ('frobnicate', 'quux')
+    # The writer that saved last also sees the other's prompt
+    assert b.lookup('Frobnication') == 'frobnicate'
+
+def test_concurrent_saves(tmp_path):
+    path = tmp_path / 'section_prompts.json'
+    registries = [SectionPromptRegistry(path) for _ in range(8)]
+    threads = [
+        threading.Thread(target=lambda r=r, i=i: [r.add(f"Section {chr(97 + i)}{chr(97 + j)}", f"prompt {i} {j}") for j in range(5)])
+        for i, r in enumerate(registries)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(SectionPromptRegistry(path).generated) == 40
+    assert not list(tmp_path.glob('*.tmp'))
@@ -0,0 +1,116 @@
+import json
+import pytest
+import requests
+from openai import AsyncOpenAI
+from llm_engine import AsyncSummaryEngine
+from paper_store import PaperStore
+from summary_cache import SummaryCache
+from section_prompts import SectionPromptRegistry
+from service import SummaryService, serve
+
+ARXIV_ID = '2401.00001v1'
+TITLE = 'A fake paper'
+
+
+@pytest.fixture
+def service(tmp_path, isolated, openai_server, arxiv_server, paper_tarball):
+    '''The service on an ephemeral port, against fake OpenAI and arXiv servers.
+    Returns (base_url, fake OpenAI server, SummaryService).
+    '''
+    llm_server, llm_url = openai_server()
+    # Slow downloads keep a job running long enough to submit it again
+    _, arxiv_url = arxiv_server({ARXIV_ID: paper_tarball}, papers={ARXIV_ID: {'title': TITLE}}, latency=0.3)
+    engine = AsyncSummaryEngine(
+        client=AsyncOpenAI(base_url=llm_url, api_key='test', max_retries=0),
+        cache=SummaryCache(tmp_path / 'cache.sqlite'),
+        prompt_registry=SectionPromptRegistry(tmp_path / 'section_prompts.json'),
+    )
+    summary_service = SummaryService(
+        workers=2, engine=engine, store=PaperStore(tmp_path / 'index.sqlite'), papers_dir=tmp_path / 'papers',
+        checkpoint_dir=tmp_path / 'checkpoints', summary_dir=tmp_path / 'summaries', arxiv_url=arxiv_url,
+    )
+    http_server, base_url = serve(summary_service, port=0)
+    yield base_url, llm_server, summary_service
+    http_server.shutdown()
+    http_server.server_close()
+    summary_service.close()
+
+
+def events(base_url, job_id):
+    '''(event, job) pairs of a job's server-sent event stream, until it finishes'''
+    with requests.get(f"{base_url}/jobs/{job_id}/events", stream=True, timeout=30) as response:
+        assert response.status_code == 200
+        assert response.headers['Content-Type'] == 'text/event-stream'
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith('event: '):
+                event = line[len('event: '):]
+            elif line.startswith('data: '):
+                yield event, json.loads(line[len('data: '):])
+
+def submit(base_url, arxiv_id):
+    return requests.post(f"{base_url}/jobs", json={'arxiv_id': arxiv_id}, timeout=10)
+
+
+def test_job_is_summarized_and_streamed(service):
+    base_url, llm_server, _ = service
+    response = submit(base_url, '2401.00001')
+    assert response.status_code == 202
+    job = response.json()
+    assert job['status'] in ('queued', 'running')
+
+    stream = list(events(base_url, job['id']))
+    event, final = stream[-1]
+    assert event == 'done'
+    assert final['title'] == TITLE
+    assert '### Objective' in final['summary']
+    assert [e for e, _ in stream].count('done') == 1
+
+    assert requests.get(f"{base_url}/jobs/{job['id']}", timeout=10).json()['status'] == 'done'
+    summary = requests.get(f"{base_url}/summaries/{ARXIV_ID}", timeout=10).json()
+    assert summary['summary'] == final['summary']
+    assert llm_server.request_count > 0
+
+def test_finished_papers_are_not_summarized_again(service):
+    base_url, llm_server, summary_service = service
+    first = submit(base_url, ARXIV_ID).json()
+    summary_service.wait(first['id'], timeout=30)
+    requests_made = llm_server.request_count
+
+    # The same version is answered from memory right away
+    again = submit(base_url, f"arXiv:{ARXIV_ID}").json()
+    assert again['status'] == 'done'
+    assert again['id'] != first['id']
+    # An unversioned ID is resolved on arXiv first, then served from the saved summary
+    latest = submit(base_url, '2401.00001').json()
+    job, _ = summary_service.wait(latest['id'], timeout=30)
+    assert job['status'] == 'done'
+    assert job['summary'] == again['summary']
+    assert llm_server.request_count == requests_made
+
+def test_queued_paper_is_not_queued_twice(service):
+    base_url, _, summary_service = service
+    first = submit(base_url, ARXIV_ID)
+    second = submit(base_url, ARXIV_ID)
+    assert (first.status_code, second.status_code) == (202, 200)
+    assert second.json()['id'] == first.json()['id']
+    assert second.json()['status'] in ('queued', 'running')
+    job, _ = summary_service.wait(first.json()['id'], timeout=30)
+    assert job['status'] == 'done'
+    assert summary_service.health()['done'] == 1
+
+def test_unknown_paper_fails(service):
+    base_url, _, _ = service
+    job = submit(base_url, '2401.99999').json()
+    event, final = list(events(base_url, job['id']))[-1]
+    assert event == 'failed'
+    assert 'not found' in final['error']
+
+def test_bad_requests(service):
+    base_url, _, _ = service
+    assert requests.post(f"{base_url}/jobs", json={}, timeout=10).status_code == 400
+    assert requests.get(f"{base_url}/jobs/nope", timeout=10).status_code == 404
+    assert requests.get(f"{base_url}/jobs/nope/events", timeout=10).status_code == 404
+    assert requests.get(f"{base_url}/summaries/2401.99999v1", timeout=10).status_code == 404
+    health = requests.get(f"{base_url}/health", timeout=10).json()
+    assert health['workers'] == 2
@@ -0,0 +1,58 @@
+import io
+import gzip
+import tarfile
+import pytest
+from tar_sources import read_tar_sources, find_main_tex_member, make_line_reader
+from tex_extract import extract_sections
+
+
+def tarball(members, compress='gz'):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=f'w:{compress}') as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+def write(tmp_path, data, name='paper.tar.gz'):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+def test_sources_are_read_in_memory(tmp_path, paper_tarball):
+    sources = read_tar_sources(write(tmp_path, paper_tarball))
+    main = find_main_tex_member(sources)
+    assert str(main) == 'main.tex'
+    sections = extract_sections(main, read_lines=make_line_reader(sources))
+    assert list(sections) == ['Introduction', 'Methods', 'Acknowledgements']
+    assert not [p for p in tmp_path.iterdir() if p.name != 'paper.tar.gz']
+
+def test_only_source_members_are_kept(tmp_path):
+    data = tarball({'./main.tex': b'\\documentclass{article}', 'fig.png': b'\x89PNG', 'refs.bbl': b'bib', 'big.tex': b'x' * 64})
+    sources = read_tar_sources(write(tmp_path, data), max_member_bytes=32)
+    assert sources == {'main.tex': '\\documentclass{article}', 'refs.bbl': 'bib'}
+
+def test_single_file_submissions(tmp_path):
+    path = write(tmp_path, gzip.compress(b'\\documentclass{article}\n\\begin{document}\n\\end{document}'))
+    assert list(read_tar_sources(path)) == ['main.tex']
+    assert read_tar_sources(path, max_member_bytes=10) is None
+
+@pytest.mark.parametrize('data', [
+    b'',
+    b'not an archive at all',
+    gzip.compress(b''),
+    # A gzip stream cut off half way
+    gzip.compress(b'\\documentclass{article}' * 1000)[:40],
+], ids=['empty', 'garbage', 'empty gzip', 'truncated gzip'])
+def test_unreadable_files_are_skipped(tmp_path, data):
+    assert read_tar_sources(write(tmp_path, data)) is None
+
+def test_truncated_tarball_is_skipped(tmp_path, paper_tarball):
+    assert read_tar_sources(write(tmp_path, paper_tarball[:len(paper_tarball) // 2])) is None
+
+def test_archive_without_a_document(tmp_path):
+    sources = read_tar_sources(write(tmp_path, tarball({'macros.sty': b'\\newcommand{\\x}{y}'})))
+    assert sources == {'macros.sty': '\\newcommand{\\x}{y}'}
+    assert find_main_tex_member(sources) is None
@@ -0,0 +1,29 @@
+from tex_extract import MAX_TITLE_LINES, extract_sections
+
+
+def sections_of(tmp_path, body):
+    main = tmp_path / 'main.tex'
+    main.write_text(f"\\documentclass{{article}}\n\\begin{{document}}\n{body}\\end{{document}}\n", encoding='utf-8')
+    return extract_sections(main)
+
+
+def test_sections_in_document_order(tmp_path):
+    sections = sections_of(tmp_path, "\\section{Intro}\nFirst.\n\\section*{Methods} Second.\n")
+    assert sections == {'Intro': 'First.', 'Methods': 'Second.'}
+
+def test_title_spanning_lines(tmp_path):
+    sections = sections_of(tmp_path, "\\section{A long\n  title}\nBody.\n\\section{One {nested}\n over % comment\n three} lines\nMore.\n")
+    assert sections == {'A long title': 'Body.', 'One {nested} over three': 'lines\nMore.'}
+
+def test_unclosed_title_is_cut(tmp_path):
+    lines = ''.join(f"line {i}\n" for i in range(MAX_TITLE_LINES + 3))
+    sections = sections_of(tmp_path, f"\\section{{Broken\n{lines}")
+    (title, body), = sections.items()
+    assert title.startswith('Broken line 0')
+    assert body == '\n'.join(f"line {i}" for i in range(MAX_TITLE_LINES - 1, MAX_TITLE_LINES + 3))
+
+def test_includes_and_skipped_environments(tmp_path):
+    (tmp_path / 'sections').mkdir()
+    (tmp_path / 'sections' / 'intro.tex').write_text("\\section{Intro}\nIncluded.\n\\begin{figure}\nHidden.\n\\end{figure}\n")
+    sections = sections_of(tmp_path, "\\input{sections/intro}\n\\appendix\n\\section{Proofs}\nQED.\n")
+    assert sections == {'Intro': 'Included.', 'Appendix: Proofs': 'QED.'}
@@ -0,0 +1,238 @@
+'''Single-pass LaTeX section extractor.
+
+Streams the main .tex file line by line, follows \\input/\\include/\\subfile/\\import in place, drops comments,
+figures, tables and the bibliography, and splits the body on \\section into plain-text sections.
+Only the section currently being read is buffered, so memory stays bounded by the output.
+'''
+import re
+import posixpath
+from pathlib import Path
+
+# Environments whose contents never go to the summarizer
+SKIP_ENVIRONMENTS = {
+    'figure', 'figure*', 'wrapfigure', 'subfigure', 'table', 'table*', 'thebibliography', 'comment',
+    'tikzpicture', 'filecontents', 'filecontents*',
+}
+MAX_INCLUDE_DEPTH = 16
+# A \section title still open after this many lines is cut there (an unbalanced brace)
+MAX_TITLE_LINES = 5
+
+TOKEN_RE = re.compile(
+    r'\\(?P<env_cmd>begin|end)\s*\{(?P<env>[^}]*)\}'
+    r'|\\(?P<include>input|include|subfile)\s*\{(?P<path>[^}]*)\}'
+    r'|\\(?P<import>(?:sub)?import)\*?\s*\{(?P<import_dir>[^}]*)\}\s*\{(?P<import_file>[^}]*)\}'
+    r'|\\section\*?\s*(?:\[[^\]]*\])?\s*(?P<section>\{)'
+    r'|\\(?P<appendix>appendix)\b'
+    r'|\\(?P<documentclass>documentclass)\b'
+    r'|\\(?:bibliography|bibliographystyle|addbibresource)\s*\{[^}]*\}'
+)
+COMMENT_RE = re.compile(r'(?<!\\)%.*')
+
+CLEANUP_PATTERNS = [
+    (re.compile(r'\\(?:label|ref|eqref|cref|Cref|autoref|cite[a-z]*)\*?(?:\[[^\]]*\])*\{[^}]*\}'), ''),
+    (re.compile(r'\\(?:textbf|textit|emph|texttt|textsc|underline|mathrm)\{([^{}]*)\}'), r'\1'),
+    (re.compile(r'\\(?:title|date)\{[^{}]*\}'), ''),
+    (re.compile(r'\\(?:maketitle|centering|noindent|newpage|clearpage|tableofcontents)\b'), ''),
+    (re.compile(r'\\[vh]space\*?\{[^}]*\}'), ''),
+    (re.compile(r'~'), ' '),
+    (re.compile(r'[ \t]+'), ' '),
+    (re.compile(r' *\n *'), '\n'),
+    (re.compile(r'\n{3,}'), '\n\n'),
+]
+
+
+def strip_comment(line):
+    return COMMENT_RE.sub('', line)
+
+def clean_tex_text(text):
+    for pattern, replacement in CLEANUP_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+def read_file_lines(path):
+    '''Default line reader: yields lines of a file on disk, or returns None if it doesn't exist'''
+    path = Path(path)
+    if not path.is_file():
+        return None
+    return _iter_file(path)
+
+def _iter_file(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        yield from f
+
+def resolve_include(name, root, read_lines):
+    '''Lines of an included file, resolved like LaTeX does: relative to the main file's directory,
+    with ".tex" appended when the name has no extension.
+    '''
+    name = name.strip()
+    candidates = [name] if name.endswith('.tex') else [f"{name}.tex", name]
+    for candidate in candidates:
+        lines = read_lines(root / candidate)
+        if lines is not None:
+            return root / candidate, lines
+    return None, None
+
+def _balanced_group(line, start, depth=1):
+    '''Read a {...} group from line[start:] with `depth` braces still open (the opening brace is at
+    line[start - 1] for a group that starts on this line); returns (text, end index, depth still open)
+    '''
+    for i in range(start, len(line)):
+        escaped = i > 0 and line[i - 1] == '\\'
+        if line[i] == '{' and not escaped:
+            depth += 1
+        elif line[i] == '}' and not escaped:
+            depth -= 1
+            if depth == 0:
+                return line[start:i], i + 1, 0
+    return line[start:], len(line), depth
+
+
+class _SectionBuilder:
+    def __init__(self, root, read_lines):
+        self.root = root
+        self.read_lines = read_lines
+        self.sections = {}
+        self.title = None
+        self.parts = []
+        self.skip_depth = 0
+        self.in_preamble = False
+        self.in_appendix = False
+        self.done = False
+        self.visited = set()
+        self.files = []
+        self.file_done = False
+        # Parts of a \section title whose closing brace is on a later line
+        self.heading_parts = None
+        self.heading_depth = 0
+        self.heading_skipped = False
+
+    def flush(self):
+        text = clean_tex_text(''.join(self.parts))
+        self.parts = []
+        if not text:
+            return
+        title = self.title
+        if title is None:
+            title = 'Abstract' if '\\begin{abstract}' in text else 'Front Matter'
+        # Repeated titles (e.g. two "Experiments" sections) keep separate entries
+        key, n = title, 2
+        while key in self.sections:
+            key = f"{title} ({n})"
+            n += 1
+        self.sections[key] = text
+
+    def emit(self, text):
+        if text and not self.skip_depth and not self.in_preamble:
+            self.parts.append(text)
+
+    def process_file(self, path, lines, depth=0):
+        if depth > MAX_INCLUDE_DEPTH or path in self.visited:
+            print(f"**WARNING: Skipping recursive or too deeply nested include {path}")
+            return
+        self.visited.add(path)
+        self.files.append(path)
+        try:
+            for line in lines:
+                self.process_line(strip_comment(line), depth)
+                if self.done:
+                    return
+                if self.file_done:
+                    self.file_done = False
+                    return
+        finally:
+            self.files.pop()
+
+    def read_heading(self, line, pos):
+        '''Continue the open \\section title from line[pos:]; once it is closed, start its section.
+        Returns the position after the title (the end of the line while it is still open).
+        '''
+        text, pos, self.heading_depth = _balanced_group(line, pos, self.heading_depth)
+        self.heading_parts.append(text)
+        if self.heading_depth and len(self.heading_parts) < MAX_TITLE_LINES:
+            return pos
+        title = ' '.join(''.join(self.heading_parts).split())
+        self.heading_parts = None
+        if not self.heading_skipped:
+            self.flush()
+            title = clean_tex_text(title) or 'Untitled'
+            self.title = f"Appendix: {title}" if self.in_appendix else title
+        return pos
+
+    def process_line(self, line, depth):
+        pos = 0
+        if self.heading_parts is not None:
+            pos = self.read_heading(line, pos)
+        while pos < len(line):
+            match = TOKEN_RE.search(line, pos)
+            if match is None:
+                self.emit(line[pos:])
+                return
+            self.emit(line[pos:match.start()])
+            pos = match.end()
+
+            if match.group('env_cmd'):
+                env = match.group('env').strip()
+                begin = match.group('env_cmd') == 'begin'
+                if env == 'document':
+                    # A \subfile'd chapter is a document of its own: only its body is content, and
+                    # its \end{document} ends that file rather than the paper
+                    if begin:
+                        self.in_preamble = False
+                        if depth == 0:
+                            self.parts = []
+                    elif depth == 0:
+                        self.done = True
+                        return
+                    else:
+                        self.file_done = True
+                        return
+                elif env in SKIP_ENVIRONMENTS:
+                    self.skip_depth = self.skip_depth + 1 if begin else max(0, self.skip_depth - 1)
+                else:
+                    self.emit(match.group(0))
+            elif match.group('include') or match.group('import'):
+                # Includes in the preamble are macro/style files, not content
+                if self.skip_depth or self.in_preamble:
+                    continue
+                if match.group('include'):
+                    name, base = match.group('path'), self.root
+                else:
+                    # \subimport is relative to the including file, \import to the main file
+                    name = posixpath.join(match.group('import_dir').strip(), match.group('import_file'))
+                    base = self.files[-1].parent if match.group('import') == 'subimport' else self.root
+                include_path, lines = resolve_include(name, base, self.read_lines)
+                if include_path is None:
+                    print(f"**WARNING: Could not find included file {name}")
+                    continue
+                self.process_file(include_path, lines, depth + 1)
+                if self.done:
+                    return
+            elif match.group('section'):
+                self.heading_parts, self.heading_depth = [], 1
+                self.heading_skipped = bool(self.skip_depth or self.in_preamble)
+                pos = self.read_heading(line, pos)
+            elif match.group('appendix'):
+                self.flush()
+                self.in_appendix = True
+            elif match.group('documentclass'):
+                # Everything up to \begin{document} is preamble
+                self.in_preamble = True
+
+
+def extract_sections(main_file, read_lines=read_file_lines, root=None):
+    '''Plain-text sections of a paper, keyed by \\section title in document order.
+
+    `read_lines(path)` returns an iterable of lines or None if the file doesn't exist; the default
+    reads from disk, but any source (e.g. an in-memory tarball) can be plugged in. Returns None if
+    the main file can't be read.
+    '''
+    main_file = Path(main_file)
+    root = Path(root) if root is not None else main_file.parent
+    lines = read_lines(main_file)
+    if lines is None:
+        print(f"** ERROR: could not read {main_file}")
+        return None
+    builder = _SectionBuilder(root, read_lines)
+    builder.process_file(main_file, lines)
+    builder.flush()
+    return builder.sections
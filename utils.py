@@ -1,22 +1,95 @@
 import os
 import json
+import time
 import arxiv
+import zlib
 import tarfile
 import re
 import logging
-from pathlib import Path
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
 from functools import lru_cache
 from pylatexenc.latex2text import LatexNodes2Text
 import TexSoup as texsoup
 from openai import OpenAI
+from summary_cache import cache_key, get_default_cache
+from section_prompts import get_default_registry
+from downloader import download_sources
+from include_graph import DirectorySource, build_include_graph, resolve_name, flatten
+from paper_store import paper_key
+from paper_filter import select_papers, published_papers
+from metrics import get_default_metrics
+from config import get_stage_params
+from chunking import DEFAULT_CHUNK_TOKENS, DEFAULT_PAPER_TOKEN_BUDGET, split_into_chunks, apply_token_budget
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Chunks of one long section summarized at the same time by the synchronous path
+CHUNK_WORKERS = 4
+# Last line of every newsletter entry
+ENTRY_END = "---\n\n"
+# Day files whose entries append_newsletter keeps in memory
+MAX_TRACKED_DAY_FILES = 8
+_day_entries = {}
+_day_entries_lock = threading.Lock()
+
+def set_client(new_client):
+    '''Swap the OpenAI client used by the synchronous summarizers (e.g. for local_servers.FakeOpenAI)'''
+    global client
+    client = new_client
 
 def initialize_directories(*dirs):
     for dir_path in dirs:
         Path(dir_path).mkdir(parents=True, exist_ok=True)
 
-def fetch_latest_ml_papers(max_results=10, download=False, paperspath='', extension='tar.gz', subject_query='machine learning'):
+def source_url(result):
+    # Same e-print URL that arxiv.Result.download_source uses
+    if result.pdf_url:
+        return result.pdf_url.replace('/pdf/', '/src/')
+    return result.entry_id.replace('/abs/', '/src/')
+
+def paper_metadata(result):
+    '''The paper dict the pipeline works with, from an arxiv.Result'''
+    return {
+        "title": result.title,
+        "arxiv_id": result.get_short_id(),
+        "date": result.published,
+        "summary": result.summary,
+        "authors": [str(author) for author in result.authors],
+        "pdf_url": result.pdf_url,
+        "arxiv_url": result.entry_id
+    }
+
+def arxiv_query(query='', categories=()):
+    '''arXiv search string for a free-text query restricted to any of `categories` (e.g. cs.LG)'''
+    category_query = ' OR '.join(f"cat:{category}" for category in categories)
+    if not category_query:
+        return query
+    if not query:
+        return category_query
+    return f"({query}) AND ({category_query})"
+
+def fetch_latest_ml_papers(max_results=10, download=False, paperspath='', extension='tar.gz', subject_query='machine learning',
+                           max_workers=4, store=None, top_k=None, profiles=None):
+    '''Query arXiv, then download the sources concurrently. Sources already in paperspath with a matching
+    checksum are skipped, so an interrupted batch resumes where it stopped. Papers whose download fails
+    are left out of the returned lists.
+
+    Source files are named by versioned arXiv ID. If a PaperStore is given, versions already
+    published in an issue are skipped and every fetched paper is recorded in it.
+
+    With top_k, max_results is the number of candidates: they are filtered with paper_filter (near-
+    duplicates, revisions of papers already published, papers too close to previous issues) and only
+    the top_k most relevant to `profiles` are downloaded.
+    '''
+    paper_info, list_of_files, jobs = query_papers(max_results, extension, subject_query, store, top_k, profiles)
+    kept = download_papers(paper_info, list_of_files, jobs, paperspath, max_workers, store, download)
+    return [paper_info[i] for i in kept], [list_of_files[i] for i in kept]
+
+def query_papers(max_results, extension='tar.gz', subject_query='machine learning', store=None, top_k=None,
+                 profiles=None):
+    '''The search and filtering half of fetch_latest_ml_papers: (paper info, file names, download jobs)'''
     client = arxiv.Client()
     search = arxiv.Search(
         query=subject_query,
@@ -25,45 +98,85 @@ def fetch_latest_ml_papers(max_results=10, download=False, paperspath='', extens
     )
     paper_info = []
     list_of_files = []
+    jobs = []
     
     for result in client.results(search):
-        print(f"MESSAGE -> Title: {result.title}")
-        paper_info.append({
-            "title": result.title,
-            "date": result.published,
-            "summary": result.summary,
-            "authors": [str(author) for author in result.authors],
-            "pdf_url": result.pdf_url,
-            "arxiv_url": result.entry_id
-        })
-        fileout = f'{result.title.replace(":", "").replace(" ", "_")}.{extension}'
+        arxiv_id = result.get_short_id()
+        print(f"MESSAGE -> Title: {result.title} ({arxiv_id})")
+        if store is not None and store.is_published(arxiv_id, any_version=top_k is not None):
+            print(f"**INFO: already published {arxiv_id}, skipping.")
+            continue
+        paper_info.append(paper_metadata(result))
+        fileout = f'{paper_key(arxiv_id)}.{extension}'
         print(f"MESSAGE -> Output File: {fileout}")
         list_of_files.append(fileout)
-        if download:
-            result.download_source(dirpath=paperspath, filename=fileout)
-    return paper_info, list_of_files
+        jobs.append((arxiv_id, source_url(result), fileout))
+
+    if top_k is not None:
+        selected = select_papers(paper_info, top_k=top_k, profiles=profiles, previous=published_papers(store))
+        print(f"MESSAGE -> Selected {len(selected)} of {len(paper_info)} candidate papers")
+        paper_info = [paper_info[i] for i in selected]
+        list_of_files = [list_of_files[i] for i in selected]
+        jobs = [jobs[i] for i in selected]
+    return paper_info, list_of_files, jobs
+
+def download_papers(paper_info, list_of_files, jobs, paperspath, max_workers=4, store=None, download=True):
+    '''The download half of fetch_latest_ml_papers. Returns the indices of the papers that are kept.'''
+    kept = list(range(len(jobs)))
+    if download:
+        downloaded = download_sources(jobs, paperspath, max_workers=max_workers)
+        kept = [i for i, (arxiv_id, _, _) in enumerate(jobs) if downloaded.get(arxiv_id) is not None]
+    if store is not None:
+        for i in kept:
+            store.upsert(paper_info[i], Path(paperspath) / list_of_files[i] if download else None)
+    return kept
+
+def fetch_topic_papers(topics, max_results, paperspath, extension='tar.gz', max_workers=4, store=None):
+    '''fetch_latest_ml_papers for several topics (see config.normalize_topic) at once: each topic is
+    queried and filtered on its own, then the union of the picked papers is downloaded in one pass,
+    so a paper picked by several topics is fetched (and later summarized) once.
+    Returns (paper info, file names, {topic name: indices of its papers, best first}).
+    '''
+    paper_info, list_of_files, jobs, selections, positions = [], [], [], {}, {}
+    for topic in topics:
+        query = arxiv_query(topic['query'], topic['categories'])
+        print(f"MESSAGE -> Topic {topic['name']}: {query}")
+        topic_papers = query_papers(
+            max(max_results, topic['papers']), extension, query, store, top_k=topic['papers'], profiles=topic['profiles']
+        )
+        indices = []
+        for paper, fileout, job in zip(*topic_papers):
+            if paper['arxiv_id'] not in positions:
+                positions[paper['arxiv_id']] = len(paper_info)
+                paper_info.append(paper)
+                list_of_files.append(fileout)
+                jobs.append(job)
+            indices.append(positions[paper['arxiv_id']])
+        selections[topic['name']] = indices
+
+    kept = download_papers(paper_info, list_of_files, jobs, paperspath, max_workers, store)
+    renumbered = {old: new for new, old in enumerate(kept)}
+    selections = {name: [renumbered[i] for i in indices if i in renumbered] for name, indices in selections.items()}
+    return [paper_info[i] for i in kept], [list_of_files[i] for i in kept], selections
 
 def extract_tarfile(tar_file, extract_path):
     try:
         with tarfile.open(tar_file, 'r:gz') as tar:
             tar.extractall(path=extract_path)
         return True
-    except tarfile.ReadError:
+    except (tarfile.ReadError, EOFError, zlib.error):
         print(f"Skipping {tar_file} as it is not a valid gzip file.")
         return False
 
-def find_main_tex_file(extract_path, test=False):
-    '''Find the main .tex file in the extracted directory
+def find_main_tex_file(extract_path, test=False, graph=None):
+    '''Find the main .tex file in the extracted directory; see include_graph for how the
+    candidates are scored. `graph` is an already resolved (e.g. cached) include graph.
     '''
-    for root, _, files in os.walk(extract_path):
-        for file in files:
-            if file.endswith('.tex'):
-                with open(Path(root) / file, 'r') as f:
-                    tex_content = f.read()
-                if '\\begin{document}' in tex_content:
-                    print(f"MESSAGE -> Found a likely main .tex file: {file}")
-                    return Path(root) / file
-    return None
+    graph = graph or build_include_graph(DirectorySource(extract_path))
+    if graph is None or not graph['has_document']:
+        return None
+    print(f"MESSAGE -> Found a likely main .tex file: {graph['root']}")
+    return Path(extract_path) / graph['root']
 
 @lru_cache(maxsize=32)
 # def parse_tex_file(file_path):
@@ -108,9 +221,20 @@ def find_tex_command(tex_soup, field):
     return tex_list
 
 def create_sections_from_main_tex(inputs_list, file_path):
-    section_inputs = [inputs.contents[0] for inputs in inputs_list]
+    '''Paths of the section files named by \\input-style commands (TexSoup nodes or plain names),
+    resolved relative to file_path like LaTeX does. Files that don't exist are skipped.
+    '''
+    section_inputs = [inputs if isinstance(inputs, str) else str(inputs.contents[0]) for inputs in inputs_list]
     print(f'Filepath: {file_path}\n\nContents: {section_inputs}')
-    return [Path(file_path) / f"{y.replace('.tex', '')}.tex" for y in section_inputs]
+    source = DirectorySource(file_path)
+    section_filepaths = []
+    for name in section_inputs:
+        resolved = resolve_name(source, name, '')
+        if resolved is None:
+            print(f"**WARNING: Could not find included file {name}")
+            continue
+        section_filepaths.append(Path(file_path) / resolved)
+    return section_filepaths
 
 def create_section_dict(section_filepaths):
     if not section_filepaths:
@@ -119,50 +243,54 @@ def create_section_dict(section_filepaths):
     
     return {path.stem: parse_tex_file(str(path)) for path in section_filepaths}
 
-@lru_cache(maxsize=32)
-def generate_section_prompt(section_name):
-    base_prompt = f"Create a detailed prompt to concisely summarize the '{section_name}' section of a scientific article. Stress that the summary must cover all key points but be concise, using markdown bullet points."
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": base_prompt},
-            {"role": "user", "content": f"Generate a prompt for the '{section_name}' section."}
-        ]
-    )
-    return response.choices[0].message.content.strip()
+def create_section_dict_from_graph(extract_path, graph):
+    '''One TexSoup tree per file the main file pulls in directly (\\input, \\include, \\subfile,
+    \\import), with whatever those files include in turn spliced in place
+    '''
+    source = DirectorySource(extract_path)
+    section_files = graph['includes'].get(graph['root']) or [graph['root']]
+    section_dict = {}
+    for name in section_files:
+        stem = PurePosixPath(name).stem
+        # sections/intro.tex and appendix/intro.tex would otherwise collide
+        key = stem if stem not in section_dict else str(PurePosixPath(name).with_suffix(''))
+        try:
+            section_dict[key] = texsoup.TexSoup(flatten(source, graph, name))
+        except Exception as e:
+            logging.error(f"Error parsing tex file: {name}: {str(e)}")
+            section_dict[key] = None
+    return section_dict
 
-def section_summary_generator(section_dict):
-    summaries = {}
-    # Loop through each section and generate a summary
-    for section_name, section_contents in section_dict.items():
-        if 'math_definition' not in section_name and 'acknowledgements' not in section_name:
-            print(section_name)
-            text = str(section_contents)
-            prompt = generate_section_prompt(section_name)
-            print(f"PROMPT -> {prompt}")
-            
-            try:
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": prompt},
-                        {"role": "user", "content": text}
-                    ]
-                )
-                # Checks to see if the response has any choices
-                if response.choices:
-                    summary = response.choices[0].message.content
-                    print(f"SUMMARY -> {summary}")
-                    summaries[section_name] = summary
-                else:
-                    print(f"**WARNING: No choices returned for section {section_name}")
-            except Exception as e:
-                print(f"**ERROR: {e}")
+def estimate_tokens(text):
+    '''Rough token count (~4 characters per token) used for rate limiting'''
+    return len(text) // 4 + 1
 
-    return summaries 
+def should_summarize(section_name):
+    section_name = section_name.lower()
+    return 'math_definition' not in section_name and 'acknowledg' not in section_name
 
+def section_prompt_messages(section_name):
+    base_prompt = f"Create a detailed prompt to concisely summarize the '{section_name}' section of a scientific article. Stress that the summary must cover all key points but be concise, using markdown bullet points."
+    return [
+        {"role": "system", "content": base_prompt},
+        {"role": "user", "content": f"Generate a prompt for the '{section_name}' section."}
+    ]
 
-def article_summary_generator(summary):
+def section_summary_messages(prompt, text):
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": text}
+    ]
+
+def reduce_summary_messages(prompt, section_name, partial_summaries):
+    joined = "\n\n".join(f"Part {i + 1}:\n{summary}" for i, summary in enumerate(partial_summaries))
+    return [
+        {"role": "system", "content": prompt},
+        {"role": "user", "content": f"The '{section_name}' section was summarized in {len(partial_summaries)} parts. "
+                                    f"Combine these partial summaries into a single summary of the section:\n\n{joined}"}
+    ]
+
+def article_summary_messages(summary):
     prompt = (
         "Summarize the key points of a scientific article for a technical audience using the following format. "
         "Ensure you include exactly these headings and nothing else:\n\n"
@@ -172,17 +300,137 @@ def article_summary_generator(summary):
         "## Significance:\nExplain the importance and implications of the findings.\n\n"
         "Here is the summary to format:\n\n"
     )
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that formats scientific article summaries."},
-            {"role": "user", "content": prompt + summary}
-        ],
-        temperature=0.37,
-        max_tokens=300
-    )
-    summary = response.choices[0].message.content.strip()
-    return summary
+    return [
+        {"role": "system", "content": "You are a helpful assistant that formats scientific article summaries."},
+        {"role": "user", "content": prompt + summary}
+    ]
+
+def cached_chat_completion(kind, messages, model=None, **params):
+    '''Chat completion backed by the on-disk summary cache. The model and sampling parameters default
+    to the configured ones for `kind` (see config.get_stage_params). Returns the message text, or None
+    if the response had no choices or no text (refusals, tool calls), which is not cached.
+    '''
+    params = {**get_stage_params(kind), **params}
+    stage_model = params.pop('model')
+    model = model or stage_model
+    cache = get_default_cache()
+    metrics = get_default_metrics()
+    key = cache_key(model, messages, **params)
+    content = cache.get(key)
+    if content is not None:
+        metrics.record_call(kind, model, 0.0, cached=True)
+        return content
+    start = time.perf_counter()
+    try:
+        with metrics.labels(kind=kind):
+            response = client.chat.completions.create(model=model, messages=messages, **params)
+    except Exception:
+        metrics.count('llm_error', kind=kind)
+        raise
+    metrics.record_call(kind, model, time.perf_counter() - start, usage=response.usage)
+    if not response.choices:
+        return None
+    content = response.choices[0].message.content
+    if content is None:
+        return None
+    cache.set(key, kind, content)
+    return content
+
+@lru_cache(maxsize=32)
+def generate_section_prompt(section_name):
+    prompt = cached_chat_completion('prompt', section_prompt_messages(section_name))
+    if prompt is None:
+        raise ValueError(f"No prompt returned for section {section_name}")
+    return prompt.strip()
+
+def get_section_prompt(section_name):
+    '''System prompt for a section: from the prompt registry, or generated live (and stored back)
+    when the section name doesn't map to a known kind.
+    '''
+    registry = get_default_registry()
+    prompt = registry.lookup(section_name)
+    if prompt is None:
+        prompt = generate_section_prompt(section_name)
+        registry.add(section_name, prompt)
+    return prompt
+
+def summarize_section_text(section_name, prompt, text, chunk_tokens=DEFAULT_CHUNK_TOKENS, max_workers=CHUNK_WORKERS):
+    '''Summarize one section; sections over `chunk_tokens` are summarized per chunk (up to
+    `max_workers` at a time), then reduced. Chunks are cut with the section model's tokenizer, like
+    AsyncSummaryEngine does, so both paths share cache keys.
+    '''
+    chunks = split_into_chunks(text, chunk_tokens, get_stage_params('section')['model'])
+    if len(chunks) == 1:
+        return cached_chat_completion('section', section_summary_messages(prompt, text))
+    print(f"**INFO: Splitting section {section_name} into {len(chunks)} chunks")
+    # Every chunk is tried before failing, so the ones that succeed are cached for the next run
+    # (and batch mode collects all of them in one round). Each call runs in a copy of this context
+    # so it keeps the section's metrics labels.
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as pool:
+        futures = [
+            pool.submit(contextvars.copy_context().run, cached_chat_completion, 'chunk',
+                        section_summary_messages(prompt, chunk))
+            for chunk in chunks
+        ]
+    partials, error = [], None
+    for future in futures:
+        try:
+            partials.append(future.result())
+        except Exception as e:
+            error = error or e
+    if error is not None:
+        raise error
+    partials = [partial for partial in partials if partial]
+    if not partials:
+        return None
+    return cached_chat_completion('section', reduce_summary_messages(prompt, section_name, partials))
+
+def summarizable_sections(section_dict, token_budget=DEFAULT_PAPER_TOKEN_BUDGET, model=None):
+    '''The sections that get summarized, in paper order, trimmed to the paper's token budget'''
+    model = model or get_stage_params('section')['model']
+    section_dict = {name: contents for name, contents in section_dict.items() if should_summarize(name)}
+    return apply_token_budget(section_dict, token_budget, model)
+
+def section_summary_generator(section_dict, engine=None, chunk_tokens=DEFAULT_CHUNK_TOKENS,
+                              token_budget=DEFAULT_PAPER_TOKEN_BUDGET, only=None):
+    '''Summarize each section. If an AsyncSummaryEngine is given, all sections are sent concurrently.
+    The paper is first trimmed to `token_budget` tokens and long sections are map-reduced in chunks.
+    `only` restricts the run to these section names (e.g. the ones that failed last time).
+    Sections whose summary failed are left out of the returned dict.
+    '''
+    if engine is not None:
+        return engine.run(engine.summarize_sections(section_dict, only=only))
+
+    summaries = {}
+    # Loop through each section and generate a summary
+    for section_name, text in summarizable_sections(section_dict, token_budget).items():
+        if only is not None and section_name not in only:
+            continue
+        print(section_name)
+        
+        try:
+            with get_default_metrics().labels(section=section_name):
+                prompt = get_section_prompt(section_name)
+                print(f"PROMPT -> {prompt}")
+                summary = summarize_section_text(section_name, prompt, text, chunk_tokens)
+            # Checks to see if the response has any choices
+            if summary is not None:
+                print(f"SUMMARY -> {summary}")
+                summaries[section_name] = summary
+            else:
+                print(f"**WARNING: No summary returned for section {section_name}")
+        except Exception as e:
+            print(f"**ERROR: {e}")
+
+    return summaries 
+
+
+def article_summary_generator(summary, engine=None):
+    if engine is not None:
+        return engine.run(engine.summarize_article(summary))
+
+    summary = cached_chat_completion('article', article_summary_messages(summary))
+    return summary.strip() if summary is not None else None
 
 def save_raw_summary(content, file):
     with open(file, 'w', encoding='utf-8') as f:
@@ -220,14 +468,32 @@ def format_to_markdown(text):
     return markdown_output.strip()
 
 def template_newsletter(summary, paper):
-    return f"## {paper['title']}\n\n{summary}\n\narxiv: {paper['arxiv_url']}\n\n---\n\n"
-
-# save to markdown
-def save_newsletter(content, file):
-    # content is a list with each element being a string
-    with open(file, 'w+', encoding='utf-8') as f:
-        for line in content:
-            f.write(line)
+    return f"## {paper['title']}\n\n{summary}\n\narxiv: {paper['arxiv_url']}\n\n{ENTRY_END}"
+
+def read_newsletter_entries(file):
+    '''Entries of a day file written by append_newsletter (empty if there is none yet)'''
+    if not os.path.exists(file):
+        return []
+    with open(file, 'r', encoding='utf-8') as f:
+        return [entry + ENTRY_END for entry in f.read().split(ENTRY_END) if entry]
+
+def append_newsletter(content, file):
+    # Rerunning a stage must not repeat an entry that is already there. The file is read once per
+    # process and the entries appended after that are tracked in memory; the lock keeps concurrent
+    # workers from appending the same entry twice, and each entry goes out in a single write.
+    path = os.path.abspath(file)
+    with _day_entries_lock:
+        entries = _day_entries.get(path)
+        if entries is None:
+            entries = _day_entries[path] = set(read_newsletter_entries(path))
+            # A long-running process moves on to a new day file every day
+            while len(_day_entries) > MAX_TRACKED_DAY_FILES:
+                del _day_entries[next(iter(_day_entries))]
+        if content in entries:
+            return
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(content)
+        entries.add(content)
 
 def save_to_json(content, file_path):
     with open(file_path, 'w', encoding='utf-8') as f: